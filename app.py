@@ -1,6 +1,17 @@
-from flask import Flask, render_template
+import datetime as dt
+import multiprocessing
+import os
+import threading
+from flask import Flask, Response, abort, jsonify, redirect, render_template, request, send_from_directory, url_for
 from flask_pymongo import PyMongo
-import scraping
+import images
+import metrics
+import store
+import weather
+import worker
+from jobs import JobQueue, MongoJobQueue
+from response_cache import CachedResponse, ResponseCache, json_response
+from scheduler import Scheduler
 
 ### Setup Flask
 app = Flask(__name__)
@@ -13,33 +24,254 @@ mongo = PyMongo(app)
 # app.config["MONGO_URI"] tells Python that our app will connect to Mongo using a URI, a uniform resource identifier similar to a URL.
 #"mongodb://localhost:27017/mars_app" is the URI we'll be using to connect our app to Mongo. This URI is saying that the app can reach Mongo through our localhost server, using port 27017, using a database named "mars_app".
 
+### Rendered page cache
+# Pages are rendered once per version of the stored data and served from memory until a scrape changes it.
+def current_version():
+   mars = mongo.db.mars.find_one({}, {"version": 1})
+   return mars.get("version") if mars else None
+
+page_cache = ResponseCache(current_version)
+
+### Background scrape jobs
+# Scrapes run on a background worker instead of inside the request. Only one scrape runs at a time:
+# clicking "Scrape New Data" while one is already queued or running joins that scrape instead of starting another.
+# By default the worker is a thread of this process. With MARS_SCRAPE_BACKEND=worker, scrapes are queued in Mongo
+# and run by separate worker processes (python worker.py), so this process only serves pages; the page cache
+# notices the new data version within a few seconds of a worker saving it.
+SCRAPE_BACKEND = os.environ.get("MARS_SCRAPE_BACKEND", "thread")
+
+def submit_scrape(sources):
+   job = scrape_jobs.submit(worker.SCRAPE_JOB_KEY, lambda job: run_scrape(job, sources), {"sources": sources})
+   return job.to_dict()
+
+def active_scrape():
+   job = scrape_jobs.active(worker.SCRAPE_JOB_KEY)
+   return job.to_dict() if job else None
+
+if SCRAPE_BACKEND == "worker":
+   scrape_jobs = MongoJobQueue(mongo.db)
+   scheduler = worker.mongo_scheduler(mongo.db, scrape_jobs)
+else:
+   scrape_jobs = JobQueue(max_workers=1)
+   scheduler = Scheduler(mongo.db, submit_scrape, active_scrape)
+
+# Helper processes (like the thumbnail makers in images.py) import this module again when started with `python app.py`;
+# only the process serving the app starts the background threads below
+SERVING_PROCESS = multiprocessing.parent_process() is None
+
+### Scheduled scrapes
+# Every source is refreshed on its own jittered interval (see scheduler.py), and manual scrapes from "Scrape New Data"
+# join a scheduled scrape that is in flight. Set MARS_SCHEDULE=1 in one process to run the schedule; with the worker
+# backend, `python worker.py --schedule` can run it instead.
+if os.environ.get("MARS_SCHEDULE") == "1" and SERVING_PROCESS:
+   scheduler.start()
+
+### Warm up the browser pool
+# The scraping code (BeautifulSoup, requests, Splinter, Selenium) is only imported when a scrape runs, so a process
+# that only serves pages never loads it. A process that runs scrapes can set MARS_WARM_BROWSERS=1 to import it and
+# launch the pooled headless browsers in the background at startup (if any source needs a real browser).
+def warm_browser_pool():
+   import scraping
+   if scraping.JS_SOURCES:
+      from fetchers import get_browser_pool
+      get_browser_pool().warm()
+
+if os.environ.get("MARS_WARM_BROWSERS") == "1" and SERVING_PROCESS:
+   threading.Thread(target=warm_browser_pool, daemon=True).start()
+
 ### Setup App Routes
 # Flask routes bind URLs to functions. For example, the URL "ourpage.com/" brings us to the homepage of our web app. The URL "ourpage.com/scrape" will activate our scraping code.
 # These routes can be embedded into our web app and accessed via links or buttons.
 
 ## Setup Homepage Route
+# The rendered page comes from the page cache; Mongo is only read when the data's version has changed.
+# Browsers that already have the page get a 304 Not Modified through its ETag.
 @app.route("/")
 def index():
+   page = page_cache.get("index", render_index)
+   return page.to_response(request)
+
+# Sections whose latest scrape failed still show their last good value, with a note saying since when.
+# Images that have been mirrored locally are shown from /media, as thumbnails when they have been made.
+def render_index():
    mars = mongo.db.mars.find_one()
-   return render_template("index.html", mars=mars)
+   media = images.local_media(mongo.db, images.image_urls(mars)) if mars else {}
+   html = render_template("index.html", mars=mars, stale=store.stale_sections(mars), media=media)
+   return CachedResponse(html, compressed=True)
+
+## Setup Media Route
+# Mirrored images and thumbnails (see images.py). Their names are hashes of their content, so browsers may cache
+# them for a year without checking back; the file is handed to the server to send (sendfile where it can).
+MEDIA_MAX_AGE = 365 * 24 * 60 * 60
+
+@app.route("/media/<path:name>")
+def media_file(name):
+   response = send_from_directory(images.MEDIA_DIR, name, max_age=MEDIA_MAX_AGE)
+   response.cache_control.public = True
+   response.cache_control.immutable = True
+   return response
 
 # mars = mongo.db.mars.find_one() uses PyMongo to find the "mars" collection in our database, which we will create when we convert our Jupyter scraping code to Python Script. 
 # We will also assign that path to the mars variable for use later.
 # the mars=mars tells Python to use the "mars" collection in MongoDB.
 
 ## Setup Scraping Route
+# /scrape queues a scrape job and answers right away with the job's id; /scrape/<job_id> reports how the job is doing.
+# Only sources that are past their minimum refresh interval are scraped. If every source was scraped too recently,
+# nothing is queued and the answer says how many seconds each source has left. The weather is only scraped on its
+# schedule (scheduler.SCHEDULED_ONLY), so the button never has to start Chrome.
+# The "Scrape New Data" button asks for JSON and follows the job from the page; a browser that opens /scrape itself
+# (no JavaScript) is sent back to the homepage once the job is queued.
 @app.route("/scrape")
 def scrape():
-   mars = mongo.db.mars
-   mars_data = scraping.scrape_all()
-   mars.update({}, mars_data, upsert=True)
-   return "Scraping Successful!"
-
-# mars = mongo.db.mars directs to our Mongo Database
-# mars_data = scraping.scrape_all() - create a variable to hold the scraped data - the scrape_all function being used on the scraping.py file 
-# .update() method has the syntax: .update(query_parameter, data, options) 
-# In the above we're inserting data, so first we'll need to add an empty JSON object with {} in place of the query_parameter. 
-# Next, we'll use the data we have stored in mars_data. Finally, the option we'll include is upsert=True. This indicates to Mongo to create a new document if one doesn't already exist, and new data will always be saved (even if we haven't already created a document for it).
+   job = scheduler.trigger()
+   if request.accept_mimetypes.best_match(["application/json", "text/html"]) == "text/html":
+      return redirect(url_for("index"))
+   if job is None:
+      return jsonify({"status": "fresh", "retry_after": scheduler.retry_after()})
+   return jsonify(job_status(job)), 202
+
+@app.route("/scrape/<job_id>")
+def scrape_status(job_id):
+   job = scrape_jobs.get(job_id)
+   if job is None:
+      abort(404)
+   if SCRAPE_BACKEND != "worker":
+      job = job.to_dict()
+   return jsonify(job_status(job))
+
+def job_status(job):
+   return dict(job, status_url=url_for("scrape_status", job_id=job["id"]))
+
+## Scrape job
+# Runs on the background thread: scrape the requested sources (reporting each one as it finishes) and save the result.
+# The job's result lists the sections that changed and the new version and scrape numbers.
+def run_scrape(job, sources=None):
+   saved = worker.scrape_and_save(mongo.db, on_progress=job.report, sources=sources)
+   if (saved["changed"] or saved["status_changed"] or any(saved.get("images", {}).values())
+         or any(saved.get("weather", {}).values())):
+      page_cache.invalidate()
+   return saved
+
+# worker.scrape_and_save() runs scraping.scrape_all() - the scrape_all function in the scraping.py file - and saves the scraped data
+# store.save_scrape() compares each section (news, featured image, facts, hemispheres) with what is already stored
+# and only writes the sections that changed, with a partial $set update. upsert=True creates the document on the first scrape.
+
+## Setup JSON API Routes
+# /api/mars serves the stored mars document as JSON and /api/mars/<section> one section of it (news, featured_image,
+# facts or hemispheres). ?fields=news_title,facts keeps only the listed fields. Like the homepage, every response is
+# built (serialized and compressed) once per version of the data and served from the page cache, with an ETag.
+@app.route("/api/mars")
+def api_mars():
+   return api_response()
+
+@app.route("/api/mars/<section>")
+def api_section(section):
+   if section not in store.SECTIONS:
+      abort(404)
+   return api_response(section)
+
+def api_response(section=None):
+   fields = store.api_fields(section)
+   if request.args.get("fields"):
+      requested = tuple(sorted({field.strip() for field in request.args["fields"].split(",") if field.strip()}))
+      unknown = set(requested) - set(fields)
+      if unknown:
+         abort(400, f"Unknown fields: {', '.join(sorted(unknown))}")
+      fields = requested
+
+   def build():
+      document = store.api_document(mongo.db, section, fields)
+      if document is None:
+         abort(404)
+      return json_response(document)
+
+   return page_cache.get(("api", section, fields), build).to_response(request)
+
+## Setup Weather Routes
+# The InSight weather readings kept in the weather collection (see weather.py), aggregated over a range of sols:
+# /api/weather/summary gives the min, max and mean of every reading and /api/weather/series the readings cut into
+# ?points= buckets (500 by default) for charts. The range is ?start_sol=&end_sol= or ?start=&end= (ISO dates), and
+# either end can be left open. Each range is aggregated once per version of the data and served from the page cache.
+@app.route("/api/weather/summary")
+def weather_summary():
+   return weather_response("summary")
+
+@app.route("/api/weather/series")
+def weather_series():
+   return weather_response("series")
+
+def weather_response(kind):
+   args = request.args
+   try:
+      start_sol = int(args["start_sol"]) if args.get("start_sol") else None
+      end_sol = int(args["end_sol"]) if args.get("end_sol") else None
+      start = dt.datetime.fromisoformat(args["start"]) if args.get("start") else None
+      end = dt.datetime.fromisoformat(args["end"]) if args.get("end") else None
+      points = int(args["points"]) if args.get("points") else weather.SERIES_POINTS
+   except ValueError:
+      abort(400)
+   if not 1 <= points <= weather.MAX_SERIES_POINTS:
+      abort(400, f"points must be between 1 and {weather.MAX_SERIES_POINTS}")
+
+   def build():
+      with metrics.timer("weather", kind=kind):
+         arrays = weather.columns(mongo.db, weather.range_query(start_sol, end_sol, start, end))
+         document = weather.summary(arrays) if kind == "summary" else weather.downsample(arrays, points)
+      return json_response(document)
+
+   key = ("weather", kind, start_sol, end_sol, start, end, points if kind == "series" else None)
+   return page_cache.get(key, build).to_response(request)
+
+## Setup Metrics Route
+# Stage timings, fetched bytes and success/failure counters in the Prometheus text format
+@app.route("/metrics")
+def metrics_route():
+   return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+## Setup History Routes
+# Every scrape is kept in the mars_history collection. These routes return the latest snapshot, the snapshot that was
+# current at a given time (?time=2021-01-31T12:00:00), both with every section, and the history newest first, one page
+# at a time, with the sections each scrape changed.
+@app.route("/api/snapshots/latest")
+def latest_snapshot():
+   snapshot = store.latest_snapshot(mongo.db)
+   if snapshot is None:
+      abort(404)
+   return jsonify(to_json(snapshot))
+
+@app.route("/api/snapshots/at")
+def snapshot_at():
+   try:
+      when = dt.datetime.fromisoformat(request.args["time"])
+   except (KeyError, ValueError):
+      abort(400)
+   snapshot = store.snapshot_at(mongo.db, when)
+   if snapshot is None:
+      abort(404)
+   return jsonify(to_json(snapshot))
+
+# ?before=<scrape number> continues after the previous page, ?limit= sets the page size (1 to 100) and ?news_title=
+# filters
+@app.route("/api/snapshots")
+def snapshots():
+   before = request.args.get("before", type=int)
+   limit = request.args.get("limit", 20, type=int)
+   # Mongo reads limit(0) as no limit at all, and a negative limit as a single batch
+   if limit < 1:
+      abort(400, "limit must be at least 1")
+   limit = min(limit, 100)
+   news_title = request.args.get("news_title")
+   page = store.history(mongo.db, before=before, limit=limit, news_title=news_title)
+
+   next_url = None
+   if len(page) == limit:
+      next_url = url_for("snapshots", before=page[-1]["scrape"], limit=limit, news_title=news_title)
+   return jsonify({"snapshots": [to_json(snapshot) for snapshot in page], "next": next_url})
+
+# Mongo documents hold datetimes, which are sent as ISO 8601 strings
+def to_json(document):
+   return {key: value.isoformat() if isinstance(value, dt.datetime) else value for key, value in document.items()}
 
 ### Tell Flask to run
 if __name__ == "__main__":
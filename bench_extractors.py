@@ -0,0 +1,145 @@
+# Micro-benchmark of the declarative extractor specs (extractors.py) against the hand-written extractors they replaced.
+# The hand-written extractors are kept here as the reference. Both read the recorded pages the other benchmarks use
+# (Resources/fixtures, see bench_parsers.py). For each page it times the hand-written extractor and the spec, then a
+# crawl-sized batch of copies of the news listing, read the way news_archive.py reads it. It also checks that both
+# extract the same fields.
+#
+#   python bench_extractors.py
+#   python bench_extractors.py --batch 500
+import argparse
+import datetime as dt
+import sys
+import timeit
+from urllib.parse import urljoin
+
+import scraping
+from bench_parsers import recorded_pages
+
+
+### The hand-written extractors, as they were before the specs
+def news_by_hand(html):
+    news_soup = scraping.make_soup(html, scraping.NEWS_STRAINER)
+    try:
+        slide_elem = news_soup.select_one('ul.item_list li.slide')
+        news_title = slide_elem.find("div", class_='content_title').get_text()
+        news_p = slide_elem.find('div', class_="article_teaser_body").get_text()
+    except AttributeError:
+        return None, None
+    return news_title, news_p
+
+
+def news_articles_by_hand(html, page_url):
+    news_soup = scraping.make_soup(html, scraping.NEWS_STRAINER)
+    articles = []
+    for slide_elem in news_soup.select('ul.item_list li.slide'):
+        title_elem = slide_elem.find('div', class_='content_title')
+        link = title_elem.find('a') if title_elem is not None else None
+        if link is None or not link.get('href'):
+            continue
+        teaser_elem = slide_elem.find('div', class_='article_teaser_body')
+        date_elem = slide_elem.find('div', class_='list_date')
+        date_text = date_elem.get_text().strip() if date_elem is not None else None
+        try:
+            date = dt.datetime.strptime(date_text, '%B %d, %Y') if date_text else None
+        except ValueError:
+            date = None
+        articles.append({
+            'url': urljoin(page_url, link.get('href')),
+            'title': title_elem.get_text().strip(),
+            'teaser': teaser_elem.get_text().strip() if teaser_elem is not None else None,
+            'date_text': date_text,
+            'date': date,
+        })
+    return articles
+
+
+def featured_image_link_by_hand(html):
+    list_soup = scraping.make_soup(html, scraping.FULL_IMAGE_STRAINER)
+    try:
+        return list_soup.select_one('a#full_image').get("data-link")
+    except AttributeError:
+        return None
+
+
+def featured_image_by_hand(html):
+    img_soup = scraping.make_soup(html, scraping.FEATURED_IMAGE_STRAINER)
+    try:
+        return img_soup.select_one('figure.lede a img').get("src")
+    except AttributeError:
+        return None
+
+
+def hemisphere_results_by_hand(html, page_url):
+    html_soup = scraping.make_soup(html, scraping.HEMISPHERE_RESULTS_STRAINER)
+    links = []
+    title_items = html_soup.find('div', class_='collapsible results')
+    if title_items is not None:
+        for title in title_items.find_all('h3'):
+            link = title.find_parent('a')
+            if link is not None and link.get("href"):
+                links.append((title.text, urljoin(page_url, link.get("href"))))
+    next_url = None
+    next_elem = html_soup.select_one('.pagination a[rel~="next"], .pagination a.next, .pagination li.next a')
+    if next_elem is not None and next_elem.get("href"):
+        next_url = urljoin(page_url, next_elem.get("href"))
+    return {"links": links, "next": next_url}
+
+
+def hemisphere_image_by_hand(html):
+    img_soup = scraping.make_soup(html, scraping.HEMISPHERE_IMAGE_STRAINER)
+    return img_soup.select_one('ul li a').get("href")
+
+
+# Saved page, the hand-written extractor, and the spec-based one in scraping.py
+PAGES = [
+    ("news", news_by_hand, scraping.parse_news),
+    ("news_articles", lambda html: news_articles_by_hand(html, scraping.NEWS_URL),
+     lambda html: scraping.parse_news_articles(html, scraping.NEWS_URL)),
+    ("featured_image_list", featured_image_link_by_hand, scraping.parse_featured_image_link),
+    ("featured_image_details", featured_image_by_hand, scraping.parse_featured_image),
+    ("hemisphere_results", lambda html: hemisphere_results_by_hand(html, scraping.HEMISPHERES_URL),
+     lambda html: scraping.parse_hemisphere_results(html, scraping.HEMISPHERES_URL)),
+    ("hemisphere_details", hemisphere_image_by_hand, scraping.parse_hemisphere_image),
+]
+
+
+def read_page(name):
+    return {page_name: html for page_name, html, _ in recorded_pages()}.get(name)
+
+
+def run(repeat, batch):
+    parity_ok = True
+    print(f"{'page':32} {'by hand':>12} {'spec':>12}")
+
+    for name, by_hand, by_spec in PAGES:
+        html = read_page(name)
+        if html is None:
+            print(f"{name:32} missing (run `python replay.py record`)")
+            continue
+        timings = [min(timeit.repeat(lambda: extract(html), number=1, repeat=repeat)) for extract in (by_hand, by_spec)]
+        print(f"{name:32} {timings[0] * 1000:10.2f}ms {timings[1] * 1000:10.2f}ms")
+
+        # Parity: the spec must extract exactly what the hand-written extractor did
+        expected, result = by_hand(html), by_spec(html)
+        if result != expected:
+            parity_ok = False
+            print(f"  MISMATCH {name}: {result!r} != {expected!r}")
+
+    # A crawl over many listing pages of the same layout
+    html = read_page("news")
+    if html is not None:
+        pages = [(html, f"{scraping.NEWS_URL}?page={page}") for page in range(batch)]
+        by_hand = min(timeit.repeat(lambda: [news_articles_by_hand(*page) for page in pages], number=1, repeat=3))
+        by_spec = min(timeit.repeat(lambda: [scraping.parse_news_articles(*page) for page in pages], number=1, repeat=3))
+        print(f"{f'news listing x{batch} (per page)':32} {by_hand / batch * 1000:10.2f}ms {by_spec / batch * 1000:10.2f}ms")
+
+    return parity_ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the extractor specs against the hand-written extractors")
+    parser.add_argument("--repeat", type=int, default=20, help="timing runs per page (the best is kept)")
+    parser.add_argument("--batch", type=int, default=200, help="listing pages in the batch run")
+    args = parser.parse_args()
+
+    sys.exit(0 if run(args.repeat, args.batch) else 1)
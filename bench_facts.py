@@ -0,0 +1,63 @@
+# Benchmark of the facts table extractors: the built-in streaming extractor (facts_table.py) against pd.read_html.
+# For each engine it measures, in a fresh Python process, the import time of what the engine needs, the time to turn
+# the recorded facts page (Resources/fixtures) into the table HTML, and the process's peak RSS. It also checks both
+# engines render the same HTML (tests/test_parsers.py runs the same check).
+#
+#   python bench_facts.py
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import scraping
+from replay import recorded_path
+
+# Runs in a fresh interpreter so imports and memory aren't shared between engines
+MEASURE_SCRIPT = """
+import json, resource, sys, time, timeit
+engine, path, repeat = sys.argv[1], sys.argv[2], int(sys.argv[3])
+started = time.perf_counter()
+if engine == "pandas":
+    import pandas
+else:
+    import facts_table
+import_seconds = time.perf_counter() - started
+
+import scraping
+scraping.FACTS_ENGINE = engine
+html = open(path, encoding="utf-8").read()
+table = scraping.parse_facts(html)
+parse_seconds = min(timeit.repeat(lambda: scraping.parse_facts(html), number=1, repeat=repeat))
+peak_rss_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"import_ms": import_seconds * 1000, "parse_ms": parse_seconds * 1000,
+                  "peak_rss_mib": peak_rss_kib / 1024, "table": table}))
+"""
+
+
+def measure(engine, path, repeat):
+    output = subprocess.run(
+        [sys.executable, "-c", MEASURE_SCRIPT, engine, path, str(repeat)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the facts table extractors")
+    parser.add_argument("--page", default=recorded_path(scraping.FACTS_URL), help="recorded space-facts page")
+    parser.add_argument("--repeat", type=int, default=20, help="timing runs per engine (the best is kept)")
+    args = parser.parse_args()
+
+    if not args.page or not os.path.exists(args.page):
+        sys.exit("The facts page wasn't recorded; run `python replay.py record` first")
+
+    results = {engine: measure(engine, args.page, args.repeat) for engine in ("pandas", "builtin")}
+
+    print(f"{'engine':10} {'import':>10} {'parse':>10} {'peak RSS':>10}")
+    for engine, result in results.items():
+        print(f"{engine:10} {result['import_ms']:8.1f}ms {result['parse_ms']:8.2f}ms {result['peak_rss_mib']:7.1f}MiB")
+
+    if results["pandas"]["table"] != results["builtin"]["table"]:
+        print("MISMATCH: the engines rendered different tables")
+        sys.exit(1)
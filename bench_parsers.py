@@ -0,0 +1,105 @@
+# Micro-benchmark of the HTML parser backends on the recorded copies of each source page.
+# Every parse_* function in scraping.py is timed with each installed BeautifulSoup backend, parsing the whole document
+# and parsing only the part the extractor needs. It also checks that every backend extracts the same fields
+# (tests/test_parsers.py runs the same check).
+# The pages are the ones the offline suite replays (Resources/fixtures); `python replay.py record` refreshes them.
+#
+#   python bench_parsers.py
+import argparse
+import sys
+import timeit
+from urllib.parse import urljoin
+
+import scraping
+from replay import FIXTURES_DIR, recorded_page
+
+BACKENDS = ["html.parser", "lxml", "html5lib"]
+
+
+# Name, recorded HTML (None if it wasn't recorded) and parse function of every page an extractor reads.
+# The details pages are the ones the recorded list pages link to, as in a scrape.
+def recorded_pages(directory=FIXTURES_DIR):
+    def page(url):
+        return recorded_page(url, directory) if url else None
+
+    list_html = page(scraping.JPL_URL)
+    details_url_rel = scraping.parse_featured_image_link(list_html) if list_html else None
+    results_html = page(scraping.HEMISPHERES_URL)
+    links = scraping.parse_hemisphere_results(results_html, scraping.HEMISPHERES_URL)["links"] if results_html else []
+
+    return [
+        ("news", page(scraping.NEWS_URL), scraping.parse_news),
+        ("news_articles", page(scraping.NEWS_URL),
+         lambda html: scraping.parse_news_articles(html, scraping.NEWS_URL)),
+        ("featured_image_list", list_html, scraping.parse_featured_image_link),
+        ("featured_image_details", page(details_url_rel and urljoin(scraping.JPL_BASE_URL, details_url_rel)),
+         scraping.parse_featured_image),
+        ("hemisphere_results", results_html,
+         lambda html: scraping.parse_hemisphere_results(html, scraping.HEMISPHERES_URL)),
+        ("hemisphere_details", page(links[0][1] if links else None), scraping.parse_hemisphere_image),
+        ("weather", page(scraping.WEATHER_URL), scraping.parse_weather),
+    ]
+
+
+def installed_backends():
+    backends = []
+    for backend in BACKENDS:
+        try:
+            scraping.soup("<p></p>", backend)
+        except Exception:
+            continue
+        backends.append(backend)
+    return backends
+
+
+# What parse extracts from html with every installed backend, whole page and partial, as {(backend, partial): result}
+def backend_results(html, parse):
+    results = {}
+    saved = scraping.HTML_PARSER, scraping.PARTIAL_PARSING
+    try:
+        for backend in installed_backends():
+            scraping.HTML_PARSER = backend
+            for partial in (False, True):
+                scraping.PARTIAL_PARSING = partial
+                results[(backend, partial)] = parse(html)
+    finally:
+        scraping.HTML_PARSER, scraping.PARTIAL_PARSING = saved
+    return results
+
+
+def run(repeat, directory=FIXTURES_DIR):
+    parity_ok = True
+    print(f"{'page':24} {'backend':12} {'whole page':>12} {'partial':>12}")
+
+    for name, html, parse in recorded_pages(directory):
+        if html is None:
+            parity_ok = False
+            print(f"{name:24} missing (run `python replay.py record`)")
+            continue
+
+        for backend in installed_backends():
+            scraping.HTML_PARSER = backend
+            timings = {}
+            for partial in (False, True):
+                scraping.PARTIAL_PARSING = partial
+                timings[partial] = min(timeit.repeat(lambda: parse(html), number=1, repeat=repeat))
+            print(f"{name:24} {backend:12} {timings[False] * 1000:10.2f}ms {timings[True] * 1000:10.2f}ms")
+
+        # Parity: every backend, whole or partial, must extract exactly the same fields
+        results = backend_results(html, parse)
+        expected = results[("html.parser", False)]
+        for key, result in results.items():
+            if result != expected:
+                parity_ok = False
+                print(f"  MISMATCH {name} with {key[0]} (partial={key[1]}): {result!r} != {expected!r}")
+
+    return parity_ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the HTML parser backends on the recorded source pages")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="directory of pages recorded with replay.py")
+    parser.add_argument("--repeat", type=int, default=20, help="timing runs per page and backend (the best is kept)")
+    args = parser.parse_args()
+
+    sys.exit(0 if run(args.repeat, args.fixtures) else 1)
@@ -0,0 +1,73 @@
+# Import-time profile of the web app.
+# Imports app.py in a fresh interpreter with `python -X importtime`, prints the slowest imports and the process's
+# peak RSS, and fails if any of the scraping dependencies were loaded or the import took longer than the budget.
+# The same numbers are shown for importing scraping as well, which is what every web worker used to pay.
+#
+#   python bench_startup.py
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Modules only a scrape needs; none of them may be imported just to serve pages
+SCRAPING_MODULES = ["scraping", "fetchers", "bs4", "requests", "splinter", "selenium", "pandas", "lxml"]
+# Total time allowed for `import app`, in milliseconds
+IMPORT_BUDGET_MS = 1000
+
+# Imports the given modules, then prints the peak RSS (KiB) and the scraping modules that ended up loaded
+IMPORT_SCRIPT = """
+import resource, sys
+for module in sys.argv[1].split(","):
+    __import__(module)
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+print(",".join(name for name in sys.argv[2].split(",") if name in sys.modules))
+"""
+
+_IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def profile(modules):
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_SCRIPT, ",".join(modules), ",".join(SCRAPING_MODULES)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+    )
+    imports = []
+    for line in completed.stderr.splitlines():
+        match = _IMPORT_TIME_LINE.match(line)
+        if match:
+            imports.append((match.group(4), int(match.group(2)) / 1000, len(match.group(3)) // 2))
+
+    peak_rss_kib, loaded = completed.stdout.split("\n")[:2]
+    total_ms = sum(cumulative for name, cumulative, depth in imports if depth == 0)
+    return {
+        "total_ms": total_ms,
+        "peak_rss_mib": int(peak_rss_kib) / 1024,
+        "slowest": sorted(((cumulative, name) for name, cumulative, _ in imports), reverse=True),
+        "scraping_modules": [name for name in loaded.split(",") if name],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile the web app's import time")
+    parser.add_argument("--top", type=int, default=15, help="number of slowest imports to list")
+    parser.add_argument("--budget", type=float, default=IMPORT_BUDGET_MS, help="import time budget in milliseconds")
+    args = parser.parse_args()
+
+    web = profile(["app"])
+    with_scraping = profile(["app", "scraping"])
+
+    print(f"import app:            {web['total_ms']:8.1f}ms  peak RSS {web['peak_rss_mib']:6.1f}MiB")
+    print(f"import app + scraping: {with_scraping['total_ms']:8.1f}ms  peak RSS {with_scraping['peak_rss_mib']:6.1f}MiB")
+    print("\nslowest imports for app (cumulative):")
+    for cumulative, name in web["slowest"][:args.top]:
+        print(f"  {cumulative:8.1f}ms  {name}")
+
+    failures = []
+    if web["scraping_modules"]:
+        failures.append(f"importing app loaded scraping dependencies: {', '.join(web['scraping_modules'])}")
+    if web["total_ms"] > args.budget:
+        failures.append(f"importing app took {web['total_ms']:.1f}ms, over the {args.budget:.0f}ms budget")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,116 @@
+# Offline benchmark suite for the scraper.
+# Replays the pages recorded with `python replay.py record` from a local server and measures, for every extractor in
+# scraping.SOURCES and for the whole scrape_all: latency (best and median), throughput and peak Python memory.
+# Results are compared with a saved baseline, and the run fails if anything got slower or bigger than the allowed margin.
+# The recorded pages (Resources/fixtures) and the baseline (Resources/benchmark_baseline.json) are both kept in the
+# repository; save a new baseline after recording new pages or on a different machine.
+#
+#   python benchmarks.py --save-baseline   # measure and store the current numbers as the baseline
+#   python benchmarks.py                   # measure and compare against the baseline (exit code 1 on regression)
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import scraping
+from replay import FIXTURES_DIR, ReplayFetcher, ReplayServer
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Resources", "benchmark_baseline.json")
+# How much worse than the baseline a number may get before it counts as a regression: a ratio, plus a small
+# absolute slack so timer and allocator noise on very fast extractors doesn't fail the run
+LATENCY_TOLERANCE = 1.25
+LATENCY_SLACK_MS = 1
+MEMORY_TOLERANCE = 1.25
+MEMORY_SLACK_KIB = 64
+
+
+# Run func `runs` times and return its latency, throughput and peak memory
+def measure(func, runs):
+    func()  # warm up connections and imports
+
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - started)
+
+    # Memory is measured on a separate run, because tracing allocations slows everything down
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "best_ms": round(min(latencies) * 1000, 3),
+        "median_ms": round(statistics.median(latencies) * 1000, 3),
+        "per_second": round(runs / sum(latencies), 2),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(fixtures_dir, runs):
+    results = {}
+    with ReplayServer(fixtures_dir) as server:
+        fetcher = ReplayFetcher(server.url)
+        try:
+            for name, scrape_source in scraping.SOURCES.items():
+                results[name] = measure(lambda: scrape_source(fetcher), runs)
+            results["scrape_all"] = measure(lambda: scraping.scrape_all(fetcher), runs)
+        finally:
+            fetcher.close()
+    return results
+
+
+# Names and descriptions of every number that is worse than the baseline allows
+def regressions(results, baseline):
+    found = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result["median_ms"] > expected["median_ms"] * LATENCY_TOLERANCE + LATENCY_SLACK_MS:
+            found.append(f"{name}: median {result['median_ms']}ms, baseline {expected['median_ms']}ms")
+        if result["peak_kib"] > expected["peak_kib"] * MEMORY_TOLERANCE + MEMORY_SLACK_KIB:
+            found.append(f"{name}: peak memory {result['peak_kib']}KiB, baseline {expected['peak_kib']}KiB")
+    return found
+
+
+def print_results(results):
+    print(f"{'benchmark':16} {'best':>10} {'median':>10} {'per second':>12} {'peak memory':>14}")
+    for name, result in results.items():
+        print(f"{name:16} {result['best_ms']:8.2f}ms {result['median_ms']:8.2f}ms "
+              f"{result['per_second']:12.2f} {result['peak_kib']:11.1f}KiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the extractors against recorded pages")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="directory of pages recorded with replay.py")
+    parser.add_argument("--runs", type=int, default=20, help="timed runs per benchmark")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.join(args.fixtures, "index.json")):
+        sys.exit(f"No recorded pages in {args.fixtures}; run `python replay.py record` first")
+
+    results = run_benchmarks(args.fixtures, args.runs)
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print(f"saved baseline to {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print("no baseline to compare against; run with --save-baseline to create one")
+        sys.exit(0)
+
+    with open(args.baseline, encoding="utf-8") as baseline_file:
+        found = regressions(results, json.load(baseline_file))
+    for regression in found:
+        print(f"REGRESSION {regression}")
+    sys.exit(1 if found else 0)
@@ -0,0 +1,163 @@
+# Declarative extractor specs.
+# What each extractor reads from a page is described as data: a Spec maps field names to Fields, and each Field says
+# which element to find (a CSS selector), what to read from it (its text or an attribute), whether to resolve it
+# against the page url, and what to try when it's missing. Selectors are compiled once, when the spec is defined, so
+# applying a spec never re-parses a selector, however many pages of the same layout a crawl reads. Simple selectors
+# (tags, one class or id, descendants of those) compile to BeautifulSoup find/find_all calls, which are what a
+# hand-written extractor would use and are much cheaper than soupsieve's general matching; any other selector is
+# compiled with soupsieve.
+#
+#   HEMISPHERE_LINKS = Spec({
+#       "title": Field("h3"),
+#       "url": Field(attr="href", join=True, required=True),
+#   }, scope="div.collapsible.results a:has(h3)", many=True)
+import re
+from urllib.parse import urljoin
+
+import soupsieve
+from bs4 import BeautifulSoup, Tag
+
+# One step of a simple selector: a tag name and at most one .class or #id ("li.slide", "a#full_image", ".results")
+SIMPLE_STEP = re.compile(r"^(?P<name>[a-zA-Z][\w-]*)?(?:\.(?P<class_>[\w-]+)|#(?P<id>[\w-]+))?$")
+
+
+## Selectors
+# A descendant chain of simple steps, each matched with a plain test on the tag while walking the tree (what a
+# hand-written find/find_all loop does, without BeautifulSoup building a filter on every call). It answers
+# select_one and select like a soupsieve pattern: the first match in document order, and every match in document
+# order without repeats.
+class FindSelector:
+    def __init__(self, steps):
+        self.tests = [_step_test(**step) for step in steps]
+
+    def select_one(self, root, _step=0):
+        test = self.tests[_step]
+        last = _step == len(self.tests) - 1
+        for element in root.descendants:
+            if isinstance(element, Tag) and test(element):
+                if last:
+                    return element
+                # Descendants of an earlier match come before those of a later one, so the first hit is the first match
+                found = self.select_one(element, _step + 1)
+                if found is not None:
+                    return found
+        return None
+
+    def select(self, root):
+        elements = [root]
+        for test in self.tests:
+            matches, seen = [], set()
+            for element in elements:
+                for match in element.descendants:
+                    # Nested matches of the previous step find the same descendants again
+                    if isinstance(match, Tag) and test(match) and id(match) not in seen:
+                        seen.add(id(match))
+                        matches.append(match)
+            elements = matches
+        return elements
+
+
+def _step_test(name=None, class_=None, id=None):
+    def test(element):
+        return ((name is None or element.name == name)
+                and (class_ is None or class_ in (element.get("class") or ()))
+                and (id is None or element.get("id") == id))
+    return test
+
+
+# A FindSelector for simple selectors, a compiled soupsieve pattern for the rest
+def compile_selector(selector):
+    steps = []
+    for step in selector.split():
+        match = SIMPLE_STEP.match(step)
+        if match is None:
+            return soupsieve.compile(selector)
+        steps.append(match.groupdict())
+    return FindSelector(steps) if steps else soupsieve.compile(selector)
+
+
+## Field
+# selector: CSS selector of the element, relative to the spec's scope (None reads the scope element itself)
+# attr: attribute to read; None reads the element's text (stripped of surrounding whitespace if strip is set)
+# join: True resolves the value against the page url, a string resolves it against that base url
+# fallback: Field tried when this one finds nothing; default: value when neither finds anything
+# required: with many=True, items where this field is missing or empty are left out
+class Field:
+    def __init__(self, selector=None, attr=None, join=False, fallback=None, default=None, strip=False, required=False):
+        self.selector = selector
+        self.pattern = compile_selector(selector) if selector else None
+        self.attr = attr
+        self.join = join
+        self.fallback = fallback
+        self.default = default
+        self.strip = strip
+        self.required = required
+
+    def apply(self, root, url=None):
+        element = self.pattern.select_one(root) if self.pattern is not None else root
+        value = None
+        if element is not None:
+            value = element.get(self.attr) if self.attr else element.get_text()
+            if isinstance(value, list):
+                value = " ".join(value)
+            if value is not None and self.strip:
+                value = value.strip()
+        if value:
+            if self.join is True and url:
+                value = urljoin(url, value)
+            elif isinstance(self.join, str):
+                value = urljoin(self.join, value)
+            return value
+        if self.fallback is not None:
+            return self.fallback.apply(root, url)
+        return self.default if value is None else value
+
+    # Everything that decides what the field extracts, for fingerprinting extractor code
+    def signature(self):
+        fallback = self.fallback.signature() if self.fallback is not None else None
+        return (self.selector, self.attr, self.join, fallback, self.default, self.strip, self.required)
+
+
+## Spec
+# fields: {name: Field}. scope: selector of the element the fields are read from (the whole document by default).
+# With many=True the fields are read from every element matching scope and a list of dicts is returned; otherwise
+# one dict, read from the first match (every field is its default when nothing matches).
+# parse_only: optional SoupStrainer limiting what is built when the spec parses a page itself.
+class Spec:
+    def __init__(self, fields, scope=None, many=False, parse_only=None):
+        self.fields = fields
+        self.scope_selector = scope
+        self.scope = compile_selector(scope) if scope else None
+        self.many = many
+        self.parse_only = parse_only
+
+    def apply(self, root, url=None):
+        if self.many:
+            scopes = self.scope.select(root) if self.scope is not None else [root]
+            return [item for item in (self._read(scope, url) for scope in scopes) if item is not None]
+
+        scope = self.scope.select_one(root) if self.scope is not None else root
+        if scope is None:
+            return {name: field.default for name, field in self.fields.items()}
+        return self._read(scope, url, skip_incomplete=False)
+
+    def signature(self):
+        return (self.scope_selector, self.many, tuple((name, field.signature()) for name, field in self.fields.items()))
+
+    def _read(self, scope, url, skip_incomplete=True):
+        item = {}
+        for name, field in self.fields.items():
+            value = field.apply(scope, url)
+            if not value and field.required and skip_incomplete:
+                return None
+            item[name] = value
+        return item
+
+    # Parse html (with make_soup(html, parse_only) if given) and apply the spec to it
+    def extract(self, html, url=None, make_soup=None):
+        return self.apply(self._soup(html, make_soup), url)
+
+    def _soup(self, html, make_soup):
+        if make_soup is not None:
+            return make_soup(html, self.parse_only)
+        return BeautifulSoup(html, "html.parser", parse_only=self.parse_only)
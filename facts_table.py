@@ -0,0 +1,111 @@
+# Lightweight extractor for the Mars facts table.
+# Replaces pd.read_html for mars_facts: the page is streamed through Python's built-in HTMLParser, only the first
+# table is collected (as a list of rows) and parsing stops as soon as that table closes. The rows are then rendered
+# as the same Bootstrap table HTML that DataFrame.to_html(classes="table table-striped") produced.
+import re
+from html import escape
+from html.parser import HTMLParser
+
+# Characters fed to the parser at a time, so parsing can stop early without reading the rest of the page
+CHUNK_SIZE = 16 * 1024
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class _TableFound(Exception):
+    pass
+
+
+## First table parser
+# Collects the text of every cell of the first table, row by row. Cells of tables nested inside it are folded into
+# the enclosing cell's text. Rows made only of header cells (<th>), like a header row, are left out, the way
+# read_html turned them into column names.
+class _FirstTableParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self._depth = 0
+        self._row = None
+        self._cell = None
+        self._header_row = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "table":
+            self._depth += 1
+        elif self._depth != 1:
+            return
+        elif tag == "tr":
+            self._row = []
+            self._header_row = True
+        elif tag in ("td", "th") and self._row is not None:
+            self._finish_cell()
+            self._cell = []
+            self._header_row = self._header_row and tag == "th"
+
+    def handle_endtag(self, tag):
+        if tag == "table":
+            self._depth -= 1
+            if self._depth == 0:
+                self._finish_row()
+                raise _TableFound
+        elif self._depth != 1:
+            return
+        elif tag in ("td", "th"):
+            self._finish_cell()
+        elif tag == "tr":
+            self._finish_row()
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+    def _finish_cell(self):
+        if self._cell is not None:
+            self._row.append(_WHITESPACE.sub(" ", "".join(self._cell)).strip())
+            self._cell = None
+
+    def _finish_row(self):
+        self._finish_cell()
+        if self._row and not self._header_row:
+            self.rows.append(self._row)
+        self._row = None
+
+
+# Rows of the first table in html as lists of cell text, or None if the page has no table
+def first_table_rows(html):
+    parser = _FirstTableParser()
+    try:
+        for start in range(0, len(html), CHUNK_SIZE):
+            parser.feed(html[start:start + CHUNK_SIZE])
+        parser.close()
+    except _TableFound:
+        return parser.rows
+    return parser.rows or None
+
+
+# Two-column rows as the Bootstrap table DataFrame.to_html rendered for the facts, with the first column as the index
+def render_facts_table(rows, columns=("Description", "Mars"), classes="table table-striped"):
+    lines = [
+        f'<table border="1" class="dataframe {classes}">',
+        '  <thead>',
+        '    <tr style="text-align: right;">',
+        '      <th></th>',
+        f'      <th>{escape(columns[1], quote=False)}</th>',
+        '    </tr>',
+        '    <tr>',
+        f'      <th>{escape(columns[0], quote=False)}</th>',
+        '      <th></th>',
+        '    </tr>',
+        '  </thead>',
+        '  <tbody>',
+    ]
+    for row in rows:
+        description, value = (list(row) + ["", ""])[:2]
+        lines += [
+            '    <tr>',
+            f'      <th>{escape(description, quote=False)}</th>',
+            f'      <td>{escape(value, quote=False)}</td>',
+            '    </tr>',
+        ]
+    lines += ['  </tbody>', '</table>']
+    return "\n".join(lines)
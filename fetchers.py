@@ -0,0 +1,352 @@
+# Import requests for plain HTTP fetching. Splinter is only imported when a page actually needs a browser.
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from http_cache import get_http_cache
+from metrics import count_bytes, registry, timer
+from ratelimit import host_limiter, limited_request
+from readiness import wait_until_ready
+
+### Fetcher settings
+# Number of host pools and connections per host kept alive in the shared session
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = 10
+# Seconds to wait for a server before giving up on a page
+TIMEOUT = 20
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) MissionToMars/1.0"
+
+### Shared HTTP session
+# A single requests.Session is shared by every scrape in the process so TCP/TLS connections
+# to the NASA, JPL, USGS and space-facts hosts are kept alive and reused between pages and between scrapes.
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = USER_AGENT
+            _session = session
+    return _session
+
+
+## HTTP-only engine
+# Downloads the raw HTML of a page without rendering it. This is enough for every page that
+# doesn't build its content with JavaScript.
+# Pages are revalidated against the HTTP cache: if the server answers 304 Not Modified the cached copy is used.
+# Pass cache=False to always download pages in full.
+# Requests go through the per-host rate limits (see ratelimit.py), which also retry throttled and failed requests.
+# Pass limiter=False to send every request straight away.
+class HttpFetcher:
+    def __init__(self, session=None, timeout=TIMEOUT, cache=None, limiter=None):
+        self.session = session or get_session()
+        self.timeout = timeout
+        self.cache = get_http_cache() if cache is None else (cache or None)
+        self.limiter = host_limiter if limiter is None else (limiter or None)
+
+    def get(self, url):
+        host = urlsplit(url).netloc
+        with timer("fetch", engine="http", host=host):
+            return self._get(url, host)
+
+    def _request(self, url, host, headers=None):
+        def request():
+            return self.session.get(url, headers=headers, timeout=self.timeout)
+        if self.limiter is None:
+            return request()
+        return limited_request(host, request, self.limiter)
+
+    def _get(self, url, host):
+        headers = self.cache.conditional_headers(url) if self.cache else {}
+        response = self._request(url, host, headers)
+
+        if response.status_code == 304 and self.cache:
+            body = self.cache.body(url)
+            if body is not None:
+                registry.inc("mars_http_cache_total", outcome="hit", host=host)
+                return body
+            # The cached copy disappeared (evicted by another scrape), so download the page in full
+            response = self._request(url, host)
+
+        response.raise_for_status()
+        body = response.text
+        count_bytes(len(response.content), host=host)
+        if headers:
+            registry.inc("mars_http_cache_total", outcome="miss", host=host)
+
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if self.cache and (etag or last_modified):
+            self.cache.store(url, body, etag=etag, last_modified=last_modified)
+        return body
+
+    def close(self):
+        # The shared session stays open so the next scrape can reuse its connections
+        pass
+
+
+### Resource blocking
+# URL patterns (Chrome DevTools wildcards) for each kind of resource a page can pull in
+RESOURCE_PATTERNS = {
+    "image": ["png", "jpg", "jpeg", "gif", "webp", "svg", "ico", "tif", "tiff", "bmp"],
+    "media": ["mp4", "webm", "m4v", "mov", "mp3", "ogg", "wav"],
+    "font": ["woff", "woff2", "ttf", "otf", "eot"],
+    "stylesheet": ["css"],
+}
+# Analytics, ads and social widgets the NASA, JPL and USGS pages load from other domains
+THIRD_PARTY_SCRIPT_HOSTS = [
+    "googletagmanager.com", "google-analytics.com", "doubleclick.net", "googlesyndication.com",
+    "facebook.net", "connect.facebook.net", "platform.twitter.com", "addthis.com", "s7.addthis.com",
+    "hotjar.com", "newrelic.com", "nr-data.net", "dap.digitalgov.gov", "siteimproveanalytics.com",
+]
+
+
+## Resource blocking profile
+# Which resources the scraping browser refuses to download, by type (see RESOURCE_PATTERNS) and by host.
+# The scrape only reads src/href attributes, so blocking the files they point to doesn't change what it extracts.
+class BlockProfile:
+    def __init__(self, resource_types=(), hosts=()):
+        self.resource_types = tuple(resource_types)
+        self.hosts = tuple(hosts)
+
+    def patterns(self):
+        patterns = []
+        for resource_type in self.resource_types:
+            for extension in RESOURCE_PATTERNS[resource_type]:
+                patterns += [f"*.{extension}", f"*.{extension}?*"]
+        for host in self.hosts:
+            patterns.append(f"*://*{host}/*")
+        return patterns
+
+
+# Images, media, fonts, stylesheets and third-party scripts are all skipped
+BLOCK_HEAVY_RESOURCES = BlockProfile(["image", "media", "font", "stylesheet"], THIRD_PARTY_SCRIPT_HOSTS)
+BLOCK_NOTHING = BlockProfile()
+
+
+### Browser pool settings
+# Headless Chrome instances kept alive for the whole process, and how many pages each one loads before it is
+# replaced with a fresh instance (long-lived Chrome sessions slowly leak memory)
+BROWSER_POOL_SIZE = 2
+BROWSER_MAX_USES = 50
+# Seconds a page waits for a browser of the pool to be free before its fetch fails
+BROWSER_ACQUIRE_TIMEOUT = 60
+CHROMEDRIVER_PATH = "chromedriver"
+
+
+## Browser pool
+# Keeps pre-launched browsers so a scrape borrows one instead of paying Chrome's startup cost on every request.
+# A browser is health checked when it is checked out, reset (cookies cleared, blank page) when it is returned,
+# and quit once it has been used max_uses times.
+# Borrowers wait on a condition that is notified whenever a browser is returned or retired, so a waiting borrower
+# either takes the returned browser or launches the replacement of the retired one.
+class BrowserPool:
+    def __init__(self, size=BROWSER_POOL_SIZE, max_uses=BROWSER_MAX_USES, executable_path=CHROMEDRIVER_PATH, headless=True):
+        self.size = size
+        self.max_uses = max_uses
+        self.executable_path = executable_path
+        self.headless = headless
+        # Idle browsers, the most recently returned last (it is the one most likely to still be warm)
+        self._idle = []
+        self._uses = {}
+        self._launched = 0
+        self._available = threading.Condition()
+
+    def _launch(self):
+        from selenium.webdriver.chrome.options import Options
+        from splinter import Browser
+
+        # Return from visit() as soon as the HTML is parsed; wait_until_ready waits for what the scrape needs
+        options = Options()
+        options.page_load_strategy = "eager"
+        with timer("browser_launch"):
+            return Browser("chrome", executable_path=self.executable_path, headless=self.headless, options=options)
+
+    # Launch a browser in a place already counted in _launched, giving the place back if Chrome doesn't start
+    def _launch_counted(self):
+        try:
+            browser = self._launch()
+        except Exception:
+            with self._available:
+                self._launched -= 1
+                self._available.notify()
+            raise
+        with self._available:
+            self._uses[id(browser)] = 0
+        return browser
+
+    # Quit a browser and free its place in the pool for a waiting borrower
+    def _discard(self, browser):
+        with self._available:
+            self._uses.pop(id(browser), None)
+            self._launched -= 1
+            self._available.notify()
+        try:
+            browser.quit()
+        except Exception:
+            pass
+
+    # Start browsers until the pool is full, so the first scrape doesn't wait for Chrome
+    def warm(self):
+        while True:
+            with self._available:
+                if self._launched >= self.size:
+                    return
+                self._launched += 1
+            browser = self._launch_counted()
+            with self._available:
+                self._idle.append(browser)
+                self._available.notify()
+
+    # A browser whose driver no longer answers (crashed tab, killed chromedriver) is replaced
+    def is_healthy(self, browser):
+        try:
+            browser.driver.current_url
+        except Exception:
+            return False
+        return True
+
+    # Clear anything a page left behind so the next borrower starts from a clean browser
+    def reset(self, browser):
+        browser.cookies.delete()
+        browser.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": []})
+        browser.visit("about:blank")
+
+    # Take an idle browser, or launch one if the pool has room, waiting up to timeout seconds for either
+    def acquire(self, timeout=BROWSER_ACQUIRE_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._available:
+                while not self._idle and self._launched >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"no browser free after {timeout}s")
+                    self._available.wait(remaining)
+                if self._idle:
+                    browser = self._idle.pop()
+                else:
+                    self._launched += 1
+                    browser = None
+
+            if browser is None:
+                return self._launch_counted()
+            if self.is_healthy(browser):
+                return browser
+            self._discard(browser)
+
+    def release(self, browser):
+        with self._available:
+            self._uses[id(browser)] = self._uses.get(id(browser), 0) + 1
+            worn_out = self._uses[id(browser)] >= self.max_uses
+        if worn_out:
+            self._discard(browser)
+            return
+        try:
+            self.reset(browser)
+        except Exception:
+            self._discard(browser)
+            return
+        with self._available:
+            self._idle.append(browser)
+            self._available.notify()
+
+    @contextmanager
+    def browser(self, timeout=BROWSER_ACQUIRE_TIMEOUT):
+        browser = self.acquire(timeout=timeout)
+        try:
+            yield browser
+        finally:
+            self.release(browser)
+
+    def close(self):
+        while True:
+            with self._available:
+                if not self._idle:
+                    return
+                browser = self._idle.pop()
+            self._discard(browser)
+
+
+# Process-level pool shared by every scrape (created on first use and shut down when the process exits)
+_browser_pool = None
+
+
+def get_browser_pool():
+    global _browser_pool
+    with _session_lock:
+        if _browser_pool is None:
+            _browser_pool = BrowserPool()
+            atexit.register(_browser_pool.close)
+    return _browser_pool
+
+
+## Browser engine
+# Borrows a browser from the pool for each page. Chrome is only launched the first time a page needs it,
+# so a scrape that never needs JavaScript never pays for the browser, and later scrapes reuse the warm instances.
+# Page loads share the per-host rate limits with the HTTP engine. The browser doesn't expose status codes, so
+# throttled page loads aren't retried here.
+class BrowserFetcher:
+    def __init__(self, pool=None, limiter=None):
+        self.pool = pool or get_browser_pool()
+        self.limiter = limiter or host_limiter
+
+    def get(self, url, wait_css=None, wait_text=None, block=BLOCK_HEAVY_RESOURCES):
+        host = urlsplit(url).netloc
+        with self.pool.browser() as browser:
+            # Tell Chrome which requests to refuse for this page
+            block = block or BLOCK_NOTHING
+            browser.driver.execute_cdp_cmd("Network.enable", {})
+            browser.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": block.patterns()})
+
+            with self.limiter.slot(host), timer("fetch", engine="browser", host=host):
+                browser.visit(url)
+
+            # Wait until the element the scrape needs is on the page (or the page has settled), for at most
+            # the time this site has recently needed rather than a fixed delay
+            with timer("wait", host=host):
+                wait_until_ready(browser, url, wait_css=wait_css, wait_text=wait_text)
+
+            html = browser.html
+            count_bytes(len(html.encode("utf-8")), host=host)
+            return html
+
+    def close(self):
+        # The browsers go back to the pool for the next scrape
+        pass
+
+
+## Pluggable fetcher
+# Sends each page to the HTTP engine by default and only to the browser engine when the
+# caller says the page needs JavaScript (js=True). block is the resource blocking profile for browser pages.
+class Fetcher:
+    def __init__(self, http=None, browser=None):
+        self.http = http or HttpFetcher()
+        self.browser = browser or BrowserFetcher()
+        # Parsed values are cached alongside the HTTP cache's pages
+        self.cache = self.http.cache
+
+    def get(self, url, js=False, wait_css=None, wait_text=None, block=BLOCK_HEAVY_RESOURCES):
+        if js:
+            return self.browser.get(url, wait_css=wait_css, wait_text=wait_text, block=block)
+        return self.http.get(url)
+
+    def close(self):
+        self.http.close()
+        self.browser.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,169 @@
+# On-disk HTTP cache for the scraped pages.
+# Pages that came with an ETag or Last-Modified validator are stored so the next scrape can send a conditional request
+# (If-None-Match / If-Modified-Since). On a 304 Not Modified the stored body is reused instead of downloading the page again.
+# The values extractors parsed out of a page are stored with it, so an unchanged page isn't parsed again either.
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+### Cache settings
+CACHE_DIR = os.environ.get("MARS_HTTP_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".http_cache"))
+# Total size of the cache on disk. The least recently used pages are evicted past this.
+CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+
+## HTTP cache
+# Every page is kept as two files named after a hash of its url: <key>.body holds the page and <key>.json holds the
+# url, validators and parsed values. Entries are evicted least recently used first once the cache is over max_bytes.
+class HttpCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._sizes = self._load_index()
+        self._total = sum(self._sizes.values())
+
+    # Rebuild the LRU order from disk, oldest use first (a hit touches the meta file)
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            key = name[:-len(".json")]
+            try:
+                entries.append((os.path.getmtime(self._meta_path(key)), key, self._entry_size(key)))
+            except OSError:
+                continue
+        return OrderedDict((key, size) for _, key, size in sorted(entries))
+
+    def _key(self, url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def _body_path(self, key):
+        return os.path.join(self.directory, key + ".body")
+
+    def _meta_path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def _entry_size(self, key):
+        size = 0
+        for path in (self._body_path(key), self._meta_path(key)):
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        return size
+
+    def _read_meta(self, key):
+        try:
+            with open(self._meta_path(key), encoding="utf-8") as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+
+    # Write to a temporary file first so a crash never leaves half a page behind
+    def _write(self, path, text):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as tmp_file:
+            tmp_file.write(text)
+        os.replace(tmp_path, path)
+
+    def _remove(self, key):
+        for path in (self._body_path(key), self._meta_path(key)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._total -= self._sizes.pop(key, 0)
+
+    def _record(self, key):
+        self._total -= self._sizes.pop(key, 0)
+        self._sizes[key] = self._entry_size(key)
+        self._total += self._sizes[key]
+        while self._total > self.max_bytes and len(self._sizes) > 1:
+            oldest = next(iter(self._sizes))
+            self._remove(oldest)
+
+    # Validators to send with the next request for url, or an empty dict if the page isn't cached
+    def conditional_headers(self, url):
+        with self._lock:
+            meta = self._read_meta(self._key(url))
+        headers = {}
+        if meta is None:
+            return headers
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    # Stored body for url (after a 304), marking it as recently used
+    def body(self, url):
+        key = self._key(url)
+        with self._lock:
+            try:
+                with open(self._body_path(key), encoding="utf-8") as body_file:
+                    body = body_file.read()
+            except OSError:
+                return None
+            os.utime(self._meta_path(key))
+            if key in self._sizes:
+                self._sizes.move_to_end(key)
+        return body
+
+    def store(self, url, body, etag=None, last_modified=None):
+        key = self._key(url)
+        meta = {"url": url, "etag": etag, "last_modified": last_modified, "parsed": {}}
+        with self._lock:
+            self._write(self._body_path(key), body)
+            self._write(self._meta_path(key), json.dumps(meta))
+            self._record(key)
+
+    # Value parse(body) would return, reused from the last time the same body was parsed under this name by the same
+    # extractor code. fingerprint identifies that code: values saved under another fingerprint are never reused, and
+    # are dropped the next time the page's parsed values are saved.
+    def parsed(self, url, name, body, parse, fingerprint=None):
+        key = self._key(url)
+        digest = hashlib.sha1(body.encode("utf-8")).hexdigest()
+        with self._lock:
+            meta = self._read_meta(key)
+        if meta is not None:
+            saved = meta["parsed"].get(name)
+            if saved is not None and saved["digest"] == digest and saved.get("fingerprint") == fingerprint:
+                return saved["value"]
+
+        value = parse(body)
+
+        # Only pages already in the cache keep their parsed values, so this never grows the cache by itself
+        with self._lock:
+            meta = self._read_meta(key)
+            if meta is not None:
+                meta["parsed"] = {
+                    saved_name: saved for saved_name, saved in meta["parsed"].items()
+                    if saved.get("fingerprint") == fingerprint
+                }
+                meta["parsed"][name] = {"digest": digest, "fingerprint": fingerprint, "value": value}
+                self._write(self._meta_path(key), json.dumps(meta))
+                self._record(key)
+        return value
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._sizes):
+                self._remove(key)
+
+
+# Cache shared by every fetcher in the process
+_http_cache = None
+_http_cache_lock = threading.Lock()
+
+
+def get_http_cache():
+    global _http_cache
+    with _http_cache_lock:
+        if _http_cache is None:
+            _http_cache = HttpCache()
+    return _http_cache
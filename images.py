@@ -0,0 +1,176 @@
+# Local mirror of the scraped images.
+# After a scrape is saved, the featured image and every hemisphere image are downloaded once into content-addressed
+# storage (each file is named by the SHA-256 of its bytes, so an image that shows up under several urls is stored once
+# and a file never changes under its name). Resized JPEG thumbnails are made from each original on a process pool.
+# The app serves the files from /media/<name> with long-lived cache headers, and the page uses the small local
+# thumbnails instead of making every visitor download the full-resolution originals from the third-party hosts.
+#
+# The thumbnails need Pillow; without it the originals are still mirrored and served locally.
+#
+# Which urls have been mirrored, and where to, is kept in the media collection:
+#   {"_id": url, "original": "<sha256>.<ext>", "thumbnails": {"thumb": "<sha256>-480.jpg", ...}, ...}
+import datetime as dt
+import hashlib
+import importlib.util
+import logging
+import mimetypes
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+MEDIA_DIR = os.environ.get("MARS_MEDIA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "media"))
+# Width in pixels of each thumbnail size: "thumb" for the hemisphere tiles, "display" for the featured image
+THUMBNAIL_WIDTHS = {"thumb": 480, "display": 1280}
+THUMBNAIL_QUALITY = 80
+# Images downloaded at the same time, and processes making thumbnails
+DOWNLOAD_WORKERS = 4
+THUMBNAIL_PROCESSES = 2
+CHUNK_SIZE = 64 * 1024
+# Seconds to wait for an image server before giving up on an image
+TIMEOUT = 60
+
+
+# The image urls on a mars document: the featured image and every hemisphere's image
+def image_urls(mars):
+    urls = []
+    if mars.get("featured_image"):
+        urls.append(mars["featured_image"])
+    for hemisphere in mars.get("hemispheres") or []:
+        if hemisphere.get("image_url"):
+            urls.append(hemisphere["image_url"])
+    return list(dict.fromkeys(urls))
+
+
+def _extension(url, content_type):
+    extension = os.path.splitext(urlsplit(url).path)[1].lower()
+    if not extension and content_type:
+        extension = mimetypes.guess_extension(content_type.split(";")[0].strip()) or ""
+    return extension or ".bin"
+
+
+# Download an image into the media directory, hashing it on the way, and return its content-addressed file name
+def download(url, media_dir=MEDIA_DIR):
+    from fetchers import get_session
+    from ratelimit import limited_request
+
+    host = urlsplit(url).netloc
+    session = get_session()
+    with metrics.timer("image_download", host=host):
+        response = limited_request(host, lambda: session.get(url, stream=True, timeout=TIMEOUT))
+        with response:
+            response.raise_for_status()
+            digest = hashlib.sha256()
+            partial = os.path.join(media_dir, f".{os.getpid()}-{hashlib.sha1(url.encode('utf-8')).hexdigest()}.part")
+            size = 0
+            try:
+                with open(partial, "wb") as part_file:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        digest.update(chunk)
+                        part_file.write(chunk)
+                        size += len(chunk)
+            except BaseException:
+                os.remove(partial)
+                raise
+            extension = _extension(url, response.headers.get("Content-Type"))
+
+    metrics.count_bytes(size, host=host)
+    name = digest.hexdigest() + extension
+    # Same bytes, same name: if the file is already there the new copy is simply dropped
+    os.replace(partial, os.path.join(media_dir, name))
+    return name
+
+
+# Runs in a worker process: write a JPEG copy of source at most width pixels wide (never enlarged)
+def make_thumbnail(source, destination, width):
+    from PIL import Image
+
+    with Image.open(source) as image:
+        # Lets JPEGs decode straight at a reduced scale instead of at full resolution
+        image.draft("RGB", (width, width))
+        image = image.convert("RGB")
+        # The height bound is the image's own height, so only the width limits the size
+        image.thumbnail((width, image.height))
+        partial = destination + ".part"
+        image.save(partial, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True, progressive=True)
+    os.replace(partial, destination)
+    return destination
+
+
+def thumbnail_name(original, width):
+    return f"{os.path.splitext(original)[0]}-{width}.jpg"
+
+
+# Mirror every image on the mars document that isn't mirrored yet, and make the thumbnails that are missing.
+# Returns how many images were downloaded and how many thumbnails were made.
+def mirror_images(db, mars, media_dir=MEDIA_DIR):
+    os.makedirs(media_dir, exist_ok=True)
+    urls = image_urls(mars)
+    known = {media["_id"]: media for media in db.media.find({"_id": {"$in": urls}})}
+    missing = [url for url in urls
+               if url not in known or not os.path.exists(os.path.join(media_dir, known[url]["original"]))]
+
+    downloaded = 0
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="images") as executor:
+        futures = {url: metrics.submit(executor, download, url, media_dir) for url in missing}
+        for url, future in futures.items():
+            try:
+                name = future.result()
+            except Exception as error:
+                logger.warning("could not mirror %s: %r", url, error)
+                continue
+            known[url] = {"_id": url, "original": name, "thumbnails": {}}
+            db.media.update_one(
+                {"_id": url},
+                {"$set": {"original": name, "fetched": dt.datetime.now()}, "$setOnInsert": {"thumbnails": {}}},
+                upsert=True,
+            )
+            downloaded += 1
+
+    thumbnails = 0
+    if importlib.util.find_spec("PIL") is not None:
+        thumbnails = _make_thumbnails(db, known.values(), media_dir)
+    return {"downloaded": downloaded, "thumbnails": thumbnails}
+
+
+def _make_thumbnails(db, media, media_dir):
+    jobs = []
+    for item in media:
+        for size, width in THUMBNAIL_WIDTHS.items():
+            name = thumbnail_name(item["original"], width)
+            if item.get("thumbnails", {}).get(size) != name or not os.path.exists(os.path.join(media_dir, name)):
+                jobs.append((item["_id"], size, item["original"], name, width))
+    if not jobs:
+        return 0
+
+    made = 0
+    # Resizing is CPU-bound, so it runs in separate processes; spawn keeps them clear of the caller's threads
+    context = multiprocessing.get_context("spawn")
+    with metrics.timer("thumbnails"), ProcessPoolExecutor(max_workers=THUMBNAIL_PROCESSES, mp_context=context) as pool:
+        futures = [
+            (url, size, name, pool.submit(make_thumbnail, os.path.join(media_dir, original),
+                                          os.path.join(media_dir, name), width))
+            for url, size, original, name, width in jobs
+        ]
+        for url, size, name, future in futures:
+            try:
+                future.result()
+            except Exception as error:
+                logger.warning("could not make the %s thumbnail of %s: %r", size, url, error)
+                continue
+            db.media.update_one({"_id": url}, {"$set": {f"thumbnails.{size}": name}})
+            made += 1
+    return made
+
+
+# Local files of the mirrored images among urls, as {url: {"original": name, "thumb": name, "display": name}}
+# (a thumbnail size is missing until it has been made)
+def local_media(db, urls):
+    return {
+        media["_id"]: {"original": media["original"], **media.get("thumbnails", {})}
+        for media in db.media.find({"_id": {"$in": list(urls)}})
+    }
@@ -0,0 +1,247 @@
+# Background job queues used by app.py so long scrapes don't run inside a request: an in-process queue run on
+# threads, and a Mongo-backed queue run by separate worker processes (worker.py).
+import datetime as dt
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Finished jobs remembered for the status endpoint before the oldest are forgotten
+MAX_FINISHED_JOBS = 100
+# Seconds a worker holds a Mongo job without a heartbeat before the job is considered abandoned
+LEASE_SECONDS = 60
+
+
+## Job
+# Status of one piece of background work. The work function reports progress through job.report(step, status),
+# and whatever it returns is kept as the job's result. params describes what the job was asked to do.
+class Job:
+    def __init__(self, key, params=None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.params = params or {}
+        self.status = "queued"
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created = dt.datetime.now()
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def report(self, step, status):
+        with self._lock:
+            self.progress[step] = status
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "key": self.key,
+                "params": self.params,
+                "status": self.status,
+                "progress": dict(self.progress),
+                "result": self.result,
+                "error": self.error,
+                "created": self.created.isoformat(),
+                "started": self.started.isoformat() if self.started else None,
+                "finished": self.finished.isoformat() if self.finished else None,
+            }
+
+
+## Job queue
+# Runs jobs on a small worker pool. Submitting a job while another job with the same key is still queued or running
+# returns the existing job instead of starting a duplicate, so a burst of requests coalesces into a single run.
+class JobQueue:
+    def __init__(self, max_workers=1):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="jobs")
+        self._jobs = OrderedDict()
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, func, params=None):
+        with self._lock:
+            job = self._active.get(key)
+            if job is not None:
+                return job
+
+            job = Job(key, params)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            self._forget_old_jobs()
+
+        self._executor.submit(self._run, job, func)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active(self, key):
+        with self._lock:
+            return self._active.get(key)
+
+    def _run(self, job, func):
+        job.status = "running"
+        job.started = dt.datetime.now()
+        try:
+            job.result = func(job)
+        except Exception as error:
+            job.error = repr(error)
+            job.status = "failed"
+        else:
+            job.status = "done"
+        finally:
+            job.finished = dt.datetime.now()
+            with self._lock:
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+
+## Mongo job queue
+# Jobs stored in a Mongo collection, so the web app can queue scrapes that separate worker processes (worker.py) run.
+# Job documents have the same fields as Job.to_dict(). While a job is queued or running its key is also stored as
+# active_key, which has a unique index: queuing a key that already has an active job returns that job instead.
+# A running job is leased to its worker until lease_until, and the worker renews the lease with heartbeat() while it
+# works. A job whose lease ran out (its worker or the whole host died without anyone calling release_worker) is
+# requeued the next time a worker claims a job, so it can't hold its active_key forever.
+class MongoJobQueue:
+    def __init__(self, db, collection="scrape_jobs", lease_seconds=LEASE_SECONDS):
+        self.collection = db[collection]
+        self.lease = dt.timedelta(seconds=lease_seconds)
+        self._indexed = False
+
+    def ensure_indexes(self):
+        if not self._indexed:
+            self.collection.create_index("active_key", unique=True, sparse=True)
+            self.collection.create_index([("status", 1), ("created", 1)])
+            self.collection.create_index("worker", sparse=True)
+            self.collection.create_index([("status", 1), ("lease_until", 1)])
+            self._indexed = True
+
+    def submit(self, key, params=None):
+        from pymongo.errors import DuplicateKeyError
+
+        self.ensure_indexes()
+        job = {
+            "_id": uuid.uuid4().hex,
+            "key": key,
+            "params": params or {},
+            "active_key": key,
+            "status": "queued",
+            "progress": {},
+            "result": None,
+            "error": None,
+            "attempts": 0,
+            "created": dt.datetime.now(),
+            "started": None,
+            "finished": None,
+        }
+        try:
+            self.collection.insert_one(job)
+        except DuplicateKeyError:
+            active = self.collection.find_one({"active_key": key})
+            if active is not None:
+                return self._to_dict(active)
+            # The active job finished in the meantime, so queue a new one
+            return self.submit(key, params)
+        return self._to_dict(job)
+
+    def get(self, job_id):
+        job = self.collection.find_one({"_id": job_id})
+        return self._to_dict(job) if job else None
+
+    def active(self, key):
+        job = self.collection.find_one({"active_key": key})
+        return self._to_dict(job) if job else None
+
+    # Take the oldest queued job for this worker, or None if there is nothing to do. Abandoned jobs are requeued
+    # first (see requeue_expired).
+    def claim(self, worker, max_attempts=3):
+        from pymongo import ReturnDocument
+
+        self.requeue_expired(max_attempts)
+        now = dt.datetime.now()
+        job = self.collection.find_one_and_update(
+            {"status": "queued"},
+            {
+                "$set": {"status": "running", "worker": worker, "started": now, "lease_until": now + self.lease},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        return self._to_dict(job) if job else None
+
+    # Renew the worker's lease on a running job. False if the job isn't its own anymore (the lease ran out and the
+    # job was requeued, or it finished).
+    def heartbeat(self, job_id, worker):
+        result = self.collection.update_one(
+            self._held(job_id, worker), {"$set": {"lease_until": dt.datetime.now() + self.lease}},
+        )
+        return result.matched_count == 1
+
+    # report() and finish() only touch the job while this worker still holds it: once its lease ran out the job may
+    # have been claimed by another worker, whose run it mustn't overwrite. Both return whether the job was updated.
+    def report(self, job_id, worker, step, status):
+        result = self.collection.update_one(self._held(job_id, worker), {"$set": {f"progress.{step}": status}})
+        return result.matched_count == 1
+
+    def finish(self, job_id, worker, result=None, error=None):
+        updated = self.collection.update_one(
+            self._held(job_id, worker),
+            {
+                "$set": {"status": "failed" if error else "done", "result": result, "error": error,
+                         "finished": dt.datetime.now()},
+                "$unset": {"active_key": "", "worker": "", "lease_until": ""},
+            },
+        )
+        return updated.matched_count == 1
+
+    def _held(self, job_id, worker):
+        return {"_id": job_id, "worker": worker, "status": "running"}
+
+    # Put the jobs a crashed worker was running back in the queue, or fail them once they've been tried max_attempts times
+    def release_worker(self, worker, max_attempts=3):
+        self._release({"worker": worker}, f"worker {worker} crashed", max_attempts)
+
+    # Same for every running job whose lease has run out, whichever worker had it
+    def requeue_expired(self, max_attempts=3):
+        self._release({"lease_until": {"$lt": dt.datetime.now()}}, "worker stopped renewing its lease", max_attempts)
+
+    def _release(self, query, error, max_attempts):
+        query = {**query, "status": "running"}
+        self.collection.update_many(
+            {**query, "attempts": {"$lt": max_attempts}},
+            {"$set": {"status": "queued", "started": None}, "$unset": {"worker": "", "lease_until": ""}},
+        )
+        self.collection.update_many(
+            query,
+            {
+                "$set": {"status": "failed", "error": error, "finished": dt.datetime.now()},
+                "$unset": {"active_key": "", "worker": "", "lease_until": ""},
+            },
+        )
+
+    def _to_dict(self, job):
+        return {
+            "id": job["_id"],
+            "key": job["key"],
+            "params": job.get("params", {}),
+            "status": job["status"],
+            "progress": job.get("progress", {}),
+            "result": job.get("result"),
+            "error": job.get("error"),
+            "created": job["created"].isoformat(),
+            "started": job["started"].isoformat() if job.get("started") else None,
+            "finished": job["finished"].isoformat() if job.get("finished") else None,
+        }
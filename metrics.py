@@ -0,0 +1,197 @@
+# Lightweight instrumentation for the scrape: timers, byte counts and success/failure counters for every stage
+# (browser launch, fetch, readiness wait, parsing, each source, saving). Everything is kept in memory and rendered in
+# the Prometheus text format for the /metrics route. Each scrape also collects its own timing record, which is saved
+# next to the scraped data.
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Type and help text of every metric
+METRICS = {
+    "mars_stage_seconds": ("histogram", "Time spent in each scrape stage."),
+    "mars_stage_total": ("counter", "Scrape stages run, by outcome."),
+    "mars_fetched_bytes_total": ("counter", "Bytes of HTML fetched, by host."),
+    "mars_http_cache_total": ("counter", "Conditional requests answered from the HTTP cache (hit) or downloaded (miss)."),
+    "mars_source_results_total": ("counter", "Source results per scrape: ok, empty, timeout or error."),
+    "mars_throttle_seconds": ("histogram", "Time fetches waited for their host's rate limit."),
+    "mars_fetch_retries_total": ("counter", "Fetches retried, by host and reason (status code or connection)."),
+    "mars_readiness_budget_seconds": ("gauge", "Time pages are given to become ready, learned per host."),
+    "mars_readiness_waits_total": ("counter", "Waits for pages to become ready, by host."),
+    "mars_readiness_timeouts_total": ("counter", "Waits for pages to become ready that ran out of time, by host."),
+}
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+## Registry
+# Counters, gauges and histograms by metric name and label set. Collectors are functions called on every snapshot that
+# return (name, labels, value) samples of values kept elsewhere; a counter's sample is its total so far.
+class Registry:
+    def __init__(self):
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def add_collector(self, collect):
+        with self._lock:
+            self._collectors.append(collect)
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._counters[(name, _label_key(labels))] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram["buckets"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    # Copy of every counter, gauge and histogram, which can be sent to another process and merged into its registry
+    # there
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: {**value, "buckets": list(value["buckets"])} for key, value in self._histograms.items()}
+            collectors = list(self._collectors)
+        for collect in collectors:
+            for name, labels, value in collect():
+                samples = counters if METRICS[name][0] == "counter" else gauges
+                samples[(name, _label_key(labels))] = value
+        return {"counters": counters, "gauges": gauges, "histograms": histograms}
+
+    # Add the counts of another registry's snapshot to this one's. Its gauges replace this registry's, with the extra
+    # labels added (to tell apart the processes they come from).
+    def merge(self, snapshot, **labels):
+        with self._lock:
+            for key, value in snapshot["counters"].items():
+                self._counters[key] += value
+            for (name, label_key), value in snapshot["gauges"].items():
+                self._gauges[(name, _label_key({**dict(label_key), **labels}))] = value
+            for key, other in snapshot["histograms"].items():
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+                histogram["buckets"] = [count + added for count, added in zip(histogram["buckets"], other["buckets"])]
+                histogram["sum"] += other["sum"]
+                histogram["count"] += other["count"]
+
+    # Everything in the Prometheus text exposition format
+    def render(self):
+        snapshot = self.snapshot()
+        histograms = snapshot["histograms"]
+
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind in ("counter", "gauge"):
+                for (metric, labels), value in sorted(snapshot[f"{kind}s"].items()):
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(labels)} {value:g}")
+            else:
+                for (metric, labels), histogram in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, count in zip(BUCKETS, histogram["buckets"]):
+                        lines.append(f"{name}_bucket{_format_labels(labels, [('le', f'{bound:g}')])} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']:.6f}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+# Registry shared by the whole process
+registry = Registry()
+
+
+## Per-scrape timing record
+# Every stage timed while a scrape is running, in the order the stages finished, and the bytes it fetched
+class ScrapeRecord:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = []
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, ok, labels):
+        with self._lock:
+            self.stages.append({"stage": stage, **labels, "seconds": round(seconds, 4), "ok": ok})
+
+    def add_bytes(self, count):
+        with self._lock:
+            self.bytes += count
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "total_seconds": round(time.perf_counter() - self.started, 4),
+                "bytes": self.bytes,
+                "stages": list(self.stages),
+            }
+
+
+_current_record = contextvars.ContextVar("scrape_record", default=None)
+
+
+# Collect the timings of everything run inside the block (including work submitted with submit()) into a record
+@contextmanager
+def scrape_record():
+    record = ScrapeRecord()
+    token = _current_record.set(record)
+    try:
+        yield record
+    finally:
+        _current_record.reset(token)
+
+
+# executor.submit that keeps the current scrape record, so stages timed on worker threads are recorded too
+def submit(executor, func, *args, **kwargs):
+    return executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+
+
+# Time a stage. It counts as a failure if the block raises.
+@contextmanager
+def timer(stage, **labels):
+    started = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        seconds = time.perf_counter() - started
+        registry.observe("mars_stage_seconds", seconds, stage=stage, **labels)
+        registry.inc("mars_stage_total", stage=stage, outcome="success" if ok else "failure", **labels)
+        record = _current_record.get()
+        if record is not None:
+            record.add(stage, seconds, ok, labels)
+
+
+def count_bytes(count, **labels):
+    registry.inc("mars_fetched_bytes_total", count, **labels)
+    record = _current_record.get()
+    if record is not None:
+        record.add_bytes(count)
@@ -0,0 +1,151 @@
+# Crawler for the whole NASA Mars news listing.
+# mars_news only keeps the latest article; this follows the listing's ?page=N pagination and keeps every article
+# (title, teaser, date and url) in the news_articles collection, one document per url.
+#
+# The crawl is a pipeline of generators: pages are fetched one at a time, turned into articles, and written in
+# batches of unordered bulk upserts, so memory stays flat however long the archive is. The listing is newest first,
+# so a re-crawl stops once it has seen STOP_AFTER_KNOWN articles in a row that are already stored (--full crawls
+# everything and refreshes every stored article).
+#
+#   python news_archive.py             # add the articles published since the last crawl
+#   python news_archive.py --full      # crawl the whole listing
+import argparse
+import datetime as dt
+import os
+from itertools import islice
+
+import metrics
+
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/mars_app")
+# Pages of the listing are NEWS_URL?page=0, ?page=1, ...
+FIRST_PAGE = 0
+# The most listing pages a crawl follows
+MAX_PAGES = 1000
+# Articles written per bulk_write
+BATCH_SIZE = 200
+# A re-crawl stops after this many already-stored articles in a row
+STOP_AFTER_KNOWN = 20
+
+
+def ensure_indexes(db):
+    db.news_articles.create_index("url", unique=True)
+    db.news_articles.create_index([("date", -1)])
+
+
+def batched(items, size):
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+### Pipeline stages
+# Each page of the listing as (url, html), until a page has no articles or max_pages pages have been read
+def listing_pages(fetcher, max_pages=MAX_PAGES):
+    import scraping
+
+    for page in range(FIRST_PAGE, FIRST_PAGE + max_pages):
+        url = f"{scraping.NEWS_URL}?page={page}"
+        html = fetcher.get(url, js="news" in scraping.JS_SOURCES, block=scraping.BLOCK_PROFILES["news"],
+                           wait_css="ul.item_list li.slide")
+        yield url, html
+
+
+# The articles on each page, stopping at the first page without any (the end of the listing)
+def articles(pages):
+    import scraping
+
+    previous_page = set()
+    for url, html in pages:
+        with metrics.timer("parse", page="news_archive"):
+            page_articles = scraping.parse_news_articles(html, url)
+        if not page_articles:
+            return
+        # New articles push older ones onto the next page while the listing is being crawled, so an article
+        # can show up again at the top of the next page; keep the first copy only
+        for article in page_articles:
+            if article["url"] not in previous_page:
+                yield article
+        previous_page = {article["url"] for article in page_articles}
+
+
+# Pass articles through until stop_after of them in a row are already in the collection.
+# Articles are looked up batch by batch, with one query per batch.
+def until_known(articles, collection, stop_after=STOP_AFTER_KNOWN, batch_size=STOP_AFTER_KNOWN):
+    known_in_a_row = 0
+    for batch in batched(articles, batch_size):
+        stored = {article["url"] for article in collection.find(
+            {"url": {"$in": [article["url"] for article in batch]}}, {"url": 1, "_id": 0})}
+        for article in batch:
+            if article["url"] in stored:
+                known_in_a_row += 1
+                if known_in_a_row >= stop_after:
+                    return
+            else:
+                known_in_a_row = 0
+                yield article
+
+
+# Upsert the articles by url in unordered bulk writes of batch_size. Returns how many were added and updated.
+def write_articles(collection, articles, batch_size=BATCH_SIZE):
+    from pymongo import UpdateOne
+
+    counts = {"added": 0, "updated": 0}
+    for batch in batched(articles, batch_size):
+        now = dt.datetime.now()
+        operations = [
+            UpdateOne(
+                {"url": article["url"]},
+                {"$set": {**article, "crawled": now}, "$setOnInsert": {"first_seen": now}},
+                upsert=True,
+            )
+            for article in batch
+        ]
+        with metrics.timer("save", collection="news_articles"):
+            result = collection.bulk_write(operations, ordered=False)
+        counts["added"] += result.upserted_count
+        counts["updated"] += result.modified_count
+    return counts
+
+
+# The crawl's fetcher. It doesn't use the shared HTTP cache: thousands of listing pages would fill it and evict the
+# regular scrape's pages and their parsed values.
+def crawl_fetcher():
+    from fetchers import Fetcher, HttpFetcher
+
+    return Fetcher(http=HttpFetcher(cache=False))
+
+
+# Crawl the news listing into db.news_articles. With full=False the crawl stops at the articles already stored.
+def crawl(db, fetcher=None, full=False, max_pages=MAX_PAGES, batch_size=BATCH_SIZE):
+    ensure_indexes(db)
+    owns_fetcher = fetcher is None
+    if owns_fetcher:
+        fetcher = crawl_fetcher()
+    try:
+        pipeline = articles(listing_pages(fetcher, max_pages))
+        if not full:
+            pipeline = until_known(pipeline, db.news_articles)
+        return write_articles(db.news_articles, pipeline, batch_size)
+    finally:
+        if owns_fetcher:
+            fetcher.close()
+
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Crawl the NASA Mars news listing into Mongo")
+    parser.add_argument("--full", action="store_true", help="crawl the whole listing instead of stopping at known articles")
+    parser.add_argument("--max-pages", type=int, default=MAX_PAGES, help="most listing pages to follow")
+    parser.add_argument("--mongo-uri", default=MONGO_URI)
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo_uri)
+    try:
+        counts = crawl(client.get_default_database(), full=args.full, max_pages=args.max_pages)
+    finally:
+        client.close()
+    print(f"{counts['added']} articles added, {counts['updated']} updated")
@@ -0,0 +1,163 @@
+# Per-host rate limiting for the scraping fetches.
+# Every request to a host takes a token from that host's token bucket (so requests are spread out at a steady rate,
+# with short bursts allowed) and holds one of the host's concurrency slots while it runs. When a host answers
+# 429 Too Many Requests or 503, the whole host is paused for as long as its Retry-After header asks, and the request
+# is retried; other retryable failures back off exponentially with jitter.
+import email.utils
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from metrics import registry, timer
+
+### Rate limit settings
+# Requests per second, burst size and concurrent requests allowed per host
+DEFAULT_LIMIT = {"rate": 2, "burst": 4, "concurrency": 4}
+# Hosts that need different limits than DEFAULT_LIMIT
+HOST_LIMITS = {
+    # The hemisphere scrape fans out to one page per hemisphere
+    "astrogeology.usgs.gov": {"rate": 4, "burst": 8, "concurrency": 8},
+}
+# Responses worth retrying, and how many times to retry them
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 4
+# Exponential backoff: the wait before retry n is random between 0 and min(BACKOFF_MAX, BACKOFF_BASE * 2 ** n) seconds
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+# Longest Retry-After honored, in seconds; a host asking for more makes the fetch fail instead
+RETRY_AFTER_MAX = 120
+
+
+## Token bucket
+# Holds up to `burst` tokens, refilled at `rate` per second. take() waits for a token; pause() empties the bucket
+# until the given time, for hosts that asked us to back off.
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0
+        self._lock = threading.Lock()
+
+    # Take a token now if there is one; otherwise return how many seconds to wait before trying again
+    def _try_take(self):
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    # Wait for a token and return how long that took
+    def take(self):
+        waited = 0
+        while True:
+            wait = self._try_take()
+            if not wait:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+            self._updated = self._paused_until
+
+
+## Host limiter
+# A token bucket and a concurrency semaphore per host, created the first time the host is fetched
+class HostLimiter:
+    def __init__(self, limits=None, default=None):
+        self.limits = {**HOST_LIMITS, **(limits or {})}
+        self.default = default or DEFAULT_LIMIT
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, host):
+        with self._lock:
+            if host not in self._hosts:
+                limit = {**self.default, **self.limits.get(host, {})}
+                self._hosts[host] = (
+                    TokenBucket(limit["rate"], limit["burst"]),
+                    threading.BoundedSemaphore(limit["concurrency"]),
+                )
+            return self._hosts[host]
+
+    # Hold one of the host's concurrency slots and one of its tokens for the block
+    @contextmanager
+    def slot(self, host):
+        bucket, semaphore = self._host(host)
+        with semaphore:
+            started = time.perf_counter()
+            if bucket.take():
+                registry.observe("mars_throttle_seconds", time.perf_counter() - started, host=host)
+            yield
+
+    # Stop sending requests to the host for the given number of seconds
+    def pause(self, host, seconds):
+        self._host(host)[0].pause(seconds)
+
+
+# Limits shared by every fetcher in the process
+host_limiter = HostLimiter()
+
+
+# Seconds a response's Retry-After header asks for (a number of seconds or an HTTP date), or None without one
+def retry_after(response):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return int(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0, when.timestamp() - time.time())
+
+
+# Random wait before the given retry (counting from 0), growing exponentially up to BACKOFF_MAX
+def backoff(attempt):
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+# Run request() (which returns a requests Response) under the host's limits, retrying throttled and failed requests.
+# Returns the last response; connection errors are raised once the retries run out.
+def limited_request(host, request, limiter=None, max_retries=MAX_RETRIES):
+    limiter = limiter or host_limiter
+    for attempt in range(max_retries + 1):
+        last_attempt = attempt == max_retries
+        try:
+            with limiter.slot(host):
+                response = request()
+        except (requests.ConnectionError, requests.Timeout):
+            registry.inc("mars_fetch_retries_total", host=host, reason="connection")
+            if last_attempt:
+                raise
+            time.sleep(backoff(attempt))
+            continue
+
+        if response.status_code not in RETRY_STATUSES or last_attempt:
+            return response
+
+        registry.inc("mars_fetch_retries_total", host=host, reason=str(response.status_code))
+        wait = retry_after(response)
+        if wait is not None:
+            if wait > RETRY_AFTER_MAX:
+                return response
+            # The host asked everyone to back off, not just this request
+            limiter.pause(host, wait)
+        else:
+            wait = backoff(attempt)
+        with timer("backoff", host=host):
+            time.sleep(wait)
+    return response
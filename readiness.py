@@ -0,0 +1,123 @@
+# Waiting for a page in the browser to be ready to scrape.
+# Instead of sleeping a fixed second, the page is polled for the element the extractor needs. With nothing to look
+# for, the wait ends once the DOM has stopped changing and no new resources are loading. How long to wait at most is
+# learned per site from how long its pages took to become ready on recent scrapes.
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import urlsplit
+
+import metrics
+
+### Readiness settings
+# Bounds for the per-site wait budget, in seconds
+MIN_BUDGET = 2
+MAX_BUDGET = 20
+# The budget is this many times the slowest of the site's recent ready times (ignoring the slowest 10%)
+BUDGET_FACTOR = 2
+# Recent ready times remembered per site
+WINDOW = 20
+# Seconds between checks, and how long the DOM and network must stay quiet to count as settled
+POLL_INTERVAL = 0.05
+QUIET_PERIOD = 0.3
+
+# Runs in the page. The first call starts a MutationObserver that remembers when the DOM last changed.
+# Returns the document's ready state, whether the wanted element/text is there, how long the DOM has been quiet (ms)
+# and how many resources the page has loaded so far.
+PROBE_SCRIPT = """
+if (!window.__marsObserver) {
+    window.__marsLastMutation = performance.now();
+    window.__marsObserver = new MutationObserver(function () { window.__marsLastMutation = performance.now(); });
+    window.__marsObserver.observe(document, {childList: true, subtree: true, attributes: true});
+}
+var found = true;
+if (arguments[0]) { found = document.querySelector(arguments[0]) !== null; }
+if (found && arguments[1]) { found = !!document.body && document.body.innerText.indexOf(arguments[1]) !== -1; }
+return {
+    state: document.readyState,
+    found: found,
+    quiet: performance.now() - window.__marsLastMutation,
+    resources: performance.getEntriesByType('resource').length
+};
+"""
+
+
+## Latency budgets
+# Remembers how long each site's pages took to become ready and turns that into how long to wait next time.
+# Waits that ran out are remembered at the full budget, so a site that keeps timing out gets more time.
+class LatencyBudgets:
+    def __init__(self, window=WINDOW):
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._waits = defaultdict(int)
+        self._timeouts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def budget(self, host):
+        with self._lock:
+            samples = sorted(self._samples[host])
+        if not samples:
+            return MAX_BUDGET
+        p90 = samples[min(len(samples) - 1, int(len(samples) * 0.9))]
+        return min(MAX_BUDGET, max(MIN_BUDGET, p90 * BUDGET_FACTOR))
+
+    def record(self, host, seconds, timed_out=False):
+        with self._lock:
+            self._samples[host].append(seconds)
+            self._waits[host] += 1
+            if timed_out:
+                self._timeouts[host] += 1
+
+    # Waits, timeouts and current budget per site
+    def stats(self):
+        with self._lock:
+            counts = {host: (waits, self._timeouts[host]) for host, waits in self._waits.items()}
+        return {
+            host: {"waits": waits, "timeouts": timeouts, "budget": self.budget(host)}
+            for host, (waits, timeouts) in counts.items()
+        }
+
+    # The stats as metrics samples, for metrics.Registry.add_collector
+    def metric_samples(self):
+        for host, stats in self.stats().items():
+            yield "mars_readiness_budget_seconds", {"host": host}, stats["budget"]
+            yield "mars_readiness_waits_total", {"host": host}, stats["waits"]
+            yield "mars_readiness_timeouts_total", {"host": host}, stats["timeouts"]
+
+
+# Budgets shared by every browser in the process, reported on /metrics
+latency_budgets = LatencyBudgets()
+metrics.registry.add_collector(latency_budgets.metric_samples)
+
+
+# Wait until the page in browser is ready to scrape and return True, or False if the site's budget ran out.
+# With wait_css/wait_text the page is ready as soon as that element/text is in the DOM; without them it is ready
+# once it has finished loading and its DOM and network have been quiet for QUIET_PERIOD.
+def wait_until_ready(browser, url, wait_css=None, wait_text=None, budgets=latency_budgets):
+    host = urlsplit(url).netloc
+    budget = budgets.budget(host)
+    started = time.monotonic()
+    deadline = started + budget
+    resources = None
+    resources_since = started
+
+    while True:
+        probe = browser.driver.execute_script(PROBE_SCRIPT, wait_css, wait_text)
+        now = time.monotonic()
+
+        if probe["resources"] != resources:
+            resources = probe["resources"]
+            resources_since = now
+
+        if wait_css or wait_text:
+            ready = probe["found"] and probe["state"] != "loading"
+        else:
+            network_quiet = now - resources_since >= QUIET_PERIOD
+            ready = probe["state"] == "complete" and probe["quiet"] >= QUIET_PERIOD * 1000 and network_quiet
+
+        if ready:
+            budgets.record(host, now - started)
+            return True
+        if now >= deadline:
+            budgets.record(host, budget, timed_out=True)
+            return False
+        time.sleep(POLL_INTERVAL)
@@ -0,0 +1,244 @@
+# Record/replay harness for the scraped pages.
+# Recording runs a real scrape and saves every page the extractors read. Replaying serves the saved pages from a
+# local HTTP server, so scrapes, tests and benchmarks can run reproducibly with no network. A recorded set of every
+# page a scrape reads is kept in Resources/fixtures; recording again replaces it with the live pages.
+#
+#   python replay.py record            # scrape the live sites and save the pages into Resources/fixtures
+#   python replay.py serve             # serve the saved pages on http://127.0.0.1:8001
+#   python replay.py serve --throttle 5  # ...answering 429 Too Many Requests past 5 requests a second
+#   python replay.py throttle-test     # scrape through a throttling server to check the rate limits hold
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlsplit
+
+import requests
+
+from fetchers import Fetcher, HttpFetcher
+from ratelimit import HostLimiter
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Resources", "fixtures")
+INDEX_FILE = "index.json"
+
+
+def load_index(directory):
+    with open(os.path.join(directory, INDEX_FILE), encoding="utf-8") as index_file:
+        return json.load(index_file)
+
+
+# Path of the page recorded from url, or None if it wasn't recorded
+def recorded_path(url, directory=FIXTURES_DIR):
+    name = load_index(directory).get(url)
+    return os.path.join(directory, name) if name else None
+
+
+# HTML of the page recorded from url, or None if it wasn't recorded
+def recorded_page(url, directory=FIXTURES_DIR):
+    path = recorded_path(url, directory)
+    if path is None:
+        return None
+    with open(path, encoding="utf-8") as page_file:
+        return page_file.read()
+
+
+## Recording fetcher
+# Passes every request on to another fetcher and saves the HTML it returns. index.json maps each url to its file.
+class RecordingFetcher:
+    def __init__(self, fetcher, directory=FIXTURES_DIR):
+        self.fetcher = fetcher
+        self.directory = directory
+        self.cache = None
+        self._index = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, url, **options):
+        html = self.fetcher.get(url, **options)
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest() + ".html"
+        with open(os.path.join(self.directory, name), "w", encoding="utf-8") as page_file:
+            page_file.write(html)
+        with self._lock:
+            self._index[url] = name
+            with open(os.path.join(self.directory, INDEX_FILE), "w", encoding="utf-8") as index_file:
+                json.dump(self._index, index_file, indent=2, sort_keys=True)
+        return html
+
+    def close(self):
+        self.fetcher.close()
+
+
+## Replay server
+# Serves the recorded pages. A page recorded from https://host/path?query is served at /https/host/path?query.
+# With throttle set, it stands in for a site that rate limits: past `throttle` requests in a second it answers
+# 429 Too Many Requests with a Retry-After header. served and throttled count the requests answered each way.
+# With delay set, every page takes that many seconds to answer, and peak_concurrency records the most requests that
+# were being answered at once.
+class ReplayServer:
+    def __init__(self, directory=FIXTURES_DIR, host="127.0.0.1", port=0, throttle=None, retry_after=1, delay=0):
+        self.directory = directory
+        self.pages = load_index(directory)
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.delay = delay
+        self.served = 0
+        self.throttled = 0
+        self.peak_concurrency = 0
+        self._in_flight = 0
+        self._recent = deque()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    # Whether this request goes over the throttle (more than `throttle` requests in the last second)
+    def _over_limit(self):
+        with self._lock:
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] >= 1:
+                self._recent.popleft()
+            if self.throttle is not None and len(self._recent) >= self.throttle:
+                self.throttled += 1
+                return True
+            self._recent.append(now)
+            self.served += 1
+            return False
+
+    # Count the request as being answered while the block runs
+    @contextmanager
+    def _answering(self):
+        with self._lock:
+            self._in_flight += 1
+            self.peak_concurrency = max(self.peak_concurrency, self._in_flight)
+        try:
+            time.sleep(self.delay)
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        replay = self
+
+        class ReplayHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if replay._over_limit():
+                    self.send_response(429)
+                    self.send_header("Retry-After", str(replay.retry_after))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                path, question, query = self.path.partition("?")
+                scheme, _, rest = unquote(path).lstrip("/").partition("/")
+                name = replay.pages.get(f"{scheme}://{rest}{question}{query}")
+                if name is None:
+                    self.send_error(404, "Page was not recorded")
+                    return
+                with replay._answering():
+                    with open(os.path.join(replay.directory, name), "rb") as page_file:
+                        body = page_file.read()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return ReplayHandler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+## Replay fetcher
+# Fetches every page from a replay server instead of the live site. The extractors still see the original urls,
+# so the links they build are exactly the ones a live scrape would produce. Nothing is cached, so every
+# scrape parses every page. Requests aren't rate limited unless a limiter is passed in.
+class ReplayFetcher(HttpFetcher):
+    def __init__(self, server_url, limiter=False):
+        super().__init__(session=requests.Session(), cache=False, limiter=limiter)
+        self.server_url = server_url
+
+    def get(self, url, **options):
+        parts = urlsplit(url)
+        replay_url = f"{self.server_url}/{parts.scheme}/{parts.netloc}{quote(parts.path)}"
+        if parts.query:
+            replay_url += "?" + parts.query
+        return super().get(replay_url)
+
+    def close(self):
+        self.session.close()
+
+
+# Scrape the live sites once, saving every page the extractors read
+def record(directory=FIXTURES_DIR):
+    import scraping
+
+    with Fetcher() as live_fetcher:
+        data = scraping.scrape_all(RecordingFetcher(live_fetcher, directory))
+    print(f"recorded {len(load_index(directory))} pages into {directory}")
+    return data
+
+
+# Scrape the recorded pages through a server that throttles at `throttle` requests a second, with the given
+# per-host limits, and report how many requests were throttled and how long the scrapes took
+def throttle_test(directory=FIXTURES_DIR, throttle=5, rate=4, burst=4, concurrency=4, scrapes=3):
+    import scraping
+
+    limiter = HostLimiter(default={"rate": rate, "burst": burst, "concurrency": concurrency})
+    with ReplayServer(directory, throttle=throttle) as server:
+        fetcher = ReplayFetcher(server.url, limiter=limiter)
+        started = time.perf_counter()
+        try:
+            for _ in range(scrapes):
+                scraping.scrape_all(fetcher)
+        finally:
+            fetcher.close()
+        seconds = time.perf_counter() - started
+    print(f"{scrapes} scrapes in {seconds:.2f}s: {server.served} requests served, {server.throttled} throttled (429)")
+    return {"seconds": seconds, "served": server.served, "throttled": server.throttled}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record the scraped pages or replay them from a local server")
+    parser.add_argument("command", choices=["record", "serve", "throttle-test"])
+    parser.add_argument("--dir", default=FIXTURES_DIR, help="directory holding the recorded pages")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--throttle", type=int, help="requests per second served before answering 429")
+    parser.add_argument("--rate", type=float, default=4, help="throttle-test: requests per second the limiter allows")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.dir)
+    elif args.command == "throttle-test":
+        throttle_test(args.dir, throttle=args.throttle or 5, rate=args.rate)
+    else:
+        server = ReplayServer(args.dir, port=args.port, throttle=args.throttle)
+        print(f"serving {len(server.pages)} recorded pages on {server.url}")
+        server.serve_forever()
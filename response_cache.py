@@ -0,0 +1,138 @@
+# In-memory cache of finished responses, built once per version of the stored mars data.
+# The data only changes when a scrape finishes, so a rendered page can be served again and again until then.
+import datetime as dt
+import gzip
+import hashlib
+import json
+import threading
+import time
+
+from flask import make_response
+
+# orjson serializes several times faster than the json module; it is used when installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# brotli compresses JSON and HTML noticeably smaller than gzip; gzip is always available
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Seconds a cached version is trusted before the stored version is checked again. A scrape in this process
+# invalidates the cache straight away; this only bounds how long a scrape saved by another process goes unnoticed.
+REVALIDATE_AFTER = 5
+# Bodies smaller than this aren't worth compressing
+COMPRESS_MIN_BYTES = 512
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 9
+# Most entries kept for one version; past it the oldest entry is dropped (keys like API ranges are open-ended)
+MAX_ENTRIES = 512
+
+
+# Compressed copies of body by content coding, best first, keeping only those that came out smaller
+def compress(body):
+    encodings = {}
+    if len(body) < COMPRESS_MIN_BYTES:
+        return encodings
+    if brotli is not None:
+        encodings["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    encodings["gzip"] = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return {coding: encoded for coding, encoded in encodings.items() if len(encoded) < len(body)}
+
+
+def _json_default(value):
+    if isinstance(value, (dt.datetime, dt.date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+# document as compact UTF-8 JSON; datetimes become ISO 8601 strings
+def dumps(document):
+    if orjson is not None:
+        return orjson.dumps(document, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(document, default=_json_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+## Cached response
+# The response body as bytes with a strong ETag (a hash of the body), so clients can revalidate with If-None-Match.
+# With compressed=True the body is also compressed once, up front, and each request gets the smallest encoding it
+# accepts (each encoding has its own ETag, as a strong ETag must name the exact bytes sent).
+class CachedResponse:
+    def __init__(self, body, mimetype="text/html", headers=None, compressed=False):
+        self.body = body.encode("utf-8") if isinstance(body, str) else body
+        self.mimetype = mimetype
+        self.headers = headers or {}
+        self.etag = hashlib.sha1(self.body).hexdigest()
+        self.encodings = compress(self.body) if compressed else {}
+
+    # Flask response for this request: 304 Not Modified if the client already has this body
+    def to_response(self, request):
+        body, coding = self.body, None
+        for candidate, encoded in self.encodings.items():
+            if request.accept_encodings[candidate]:
+                body, coding = encoded, candidate
+                break
+
+        response = make_response(body)
+        response.mimetype = self.mimetype
+        response.headers.update(self.headers)
+        if self.encodings:
+            response.vary.add("Accept-Encoding")
+        if coding is not None:
+            response.headers["Content-Encoding"] = coding
+            response.set_etag(f"{self.etag}-{coding}")
+        else:
+            response.set_etag(self.etag)
+        return response.make_conditional(request)
+
+
+# A document as a cached, compressed JSON response
+def json_response(document):
+    return CachedResponse(dumps(document), mimetype="application/json", compressed=True)
+
+
+## Response cache
+# current_version() returns the version of the stored data (it is only called every REVALIDATE_AFTER seconds).
+# get(key, build) returns the cached entry for key, calling build() to make it the first time for a version.
+class ResponseCache:
+    def __init__(self, current_version, revalidate_after=REVALIDATE_AFTER, max_entries=MAX_ENTRIES):
+        self._current_version = current_version
+        self.revalidate_after = revalidate_after
+        self.max_entries = max_entries
+        self._entries = {}
+        self._version = None
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        with self._lock:
+            now = time.monotonic()
+            if self._checked is None or now - self._checked > self.revalidate_after:
+                version = self._current_version()
+                if version != self._version:
+                    self._entries = {}
+                    self._version = version
+                self._checked = now
+            version = self._version
+            entry = self._entries.get(key)
+        if entry is not None:
+            return entry
+
+        # Build outside the lock so a slow render doesn't hold up requests for other keys
+        entry = build()
+        with self._lock:
+            if self._version == version:
+                if key not in self._entries and len(self._entries) >= self.max_entries:
+                    del self._entries[next(iter(self._entries))]
+                self._entries[key] = entry
+        return entry
+
+    # Forget everything, for example once a scrape has saved new data
+    def invalidate(self):
+        with self._lock:
+            self._entries = {}
+            self._version = None
+            self._checked = None
@@ -0,0 +1,156 @@
+# Periodic scraping.
+# Each source is refreshed on its own interval, with random jitter so the sources (and several app processes) don't
+# all hit the upstream sites at the same moment. Scrapes started by the scheduler and by the "Scrape New Data" button
+# go through the same job queue, so a manual trigger that arrives while a scrape is in flight joins that scrape.
+# A source is never scraped again sooner than its minimum refresh interval, whoever asks for it. Sources in
+# SCHEDULED_ONLY are left out of manual scrapes and only refreshed on their schedule.
+# When each source was last scraped is kept in Mongo (store.last_scraped), so the intervals hold across restarts
+# and across every process that schedules or triggers scrapes.
+import datetime as dt
+import logging
+import random
+import threading
+
+import store
+
+logger = logging.getLogger(__name__)
+
+# Seconds between scheduled refreshes of each source
+REFRESH_INTERVALS = {
+    "news": 30 * 60,
+    "featured_image": 60 * 60,
+    "facts": 24 * 60 * 60,
+    "hemispheres": 24 * 60 * 60,
+    # InSight reports about one new sol a day
+    "weather": 6 * 60 * 60,
+}
+# Seconds that must pass after a source was scraped before it may be scraped again, scheduled or not
+MIN_REFRESH_INTERVALS = {
+    "news": 5 * 60,
+    "featured_image": 10 * 60,
+    "facts": 60 * 60,
+    "hemispheres": 60 * 60,
+    "weather": 60 * 60,
+}
+# Sources a manual scrape doesn't include. The InSight weather page is rendered with JavaScript, so scraping it starts
+# Chrome (scraping.JS_SOURCES); it changes about once a day, so the button never pays for that and the schedule does.
+SCHEDULED_ONLY = {"weather"}
+# Each scheduled interval is randomly stretched or shrunk by up to this fraction
+JITTER = 0.1
+# Seconds between checks for sources that are due
+TICK = 10
+
+
+## Scheduler
+# submit(sources) queues a scrape of the given sources and returns its job status (a dict like Job.to_dict());
+# active() returns the status of the scrape that is queued or running, or None.
+class Scheduler:
+    def __init__(self, db, submit, active, intervals=None, min_intervals=None, jitter=JITTER, tick=TICK,
+                 scheduled_only=None):
+        self.db = db
+        self.submit = submit
+        self.active = active
+        self.intervals = {**REFRESH_INTERVALS, **(intervals or {})}
+        self.min_intervals = {**MIN_REFRESH_INTERVALS, **(min_intervals or {})}
+        self.scheduled_only = SCHEDULED_ONLY if scheduled_only is None else set(scheduled_only)
+        self.jitter = jitter
+        self.tick = tick
+        # When each source was last asked for, so a scrape that fails isn't retried on every tick
+        self._attempted = {}
+        self._delays = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # When each source was last scraped or asked for, whichever is later
+    def _last_runs(self):
+        last_runs = dict(store.last_scraped(self.db))
+        for source, attempted in list(self._attempted.items()):
+            if source not in last_runs or attempted > last_runs[source]:
+                last_runs[source] = attempted
+        return last_runs
+
+    # Scheduled interval of a source with its jitter, drawn again after every scheduled refresh
+    def _delay(self, source):
+        if source not in self._delays:
+            spread = 1 + random.uniform(-self.jitter, self.jitter)
+            self._delays[source] = dt.timedelta(seconds=self.intervals[source] * spread)
+        return self._delays[source]
+
+    # Sources whose scheduled refresh is due. A stale source (its last scrape failed) is retried as soon as its
+    # minimum refresh interval allows, instead of waiting for its next scheduled refresh.
+    def due(self, now=None):
+        now = now or dt.datetime.now()
+        last_runs = self._last_runs()
+        stale = store.stale_sections(self.db.mars.find_one({}, {"section_status": 1}))
+        return [
+            source for source in self.intervals
+            if source not in last_runs
+            or now - last_runs[source] >= self._delay(source)
+            or (source in stale and now - last_runs[source] >= dt.timedelta(seconds=self.min_intervals[source]))
+        ]
+
+    # Sources that may be scraped now without breaking their minimum refresh interval
+    def allowed(self, sources, now=None):
+        now = now or dt.datetime.now()
+        last_runs = self._last_runs()
+        return [
+            source for source in sources
+            if source not in last_runs
+            or now - last_runs[source] >= dt.timedelta(seconds=self.min_intervals[source])
+        ]
+
+    # Sources a manual scrape covers: every source but the scheduled-only ones
+    def manual_sources(self):
+        return [source for source in self.intervals if source not in self.scheduled_only]
+
+    # Ask for a scrape of the given sources (the manual_sources by default). Joins the scrape in flight if there is
+    # one; otherwise scrapes the sources that are allowed and returns the new job's status, or None if none of them is.
+    def trigger(self, sources=None):
+        with self._lock:
+            job = self.active()
+            if job is not None:
+                return job
+
+            now = dt.datetime.now()
+            sources = self.allowed(sources or self.manual_sources(), now)
+            if not sources:
+                return None
+            for source in sources:
+                self._attempted[source] = now
+                self._delays.pop(source, None)
+            return self.submit(sources)
+
+    # Seconds until each of the manual_sources may be scraped again (0 if it may be scraped now)
+    def retry_after(self, now=None):
+        now = now or dt.datetime.now()
+        last_runs = self._last_runs()
+        waits = {}
+        for source in self.manual_sources():
+            waits[source] = 0
+            if source in last_runs:
+                next_allowed = last_runs[source] + dt.timedelta(seconds=self.min_intervals[source])
+                waits[source] = max(0, round((next_allowed - now).total_seconds(), 1))
+        return waits
+
+    def run_pending(self):
+        sources = self.due()
+        if sources:
+            self.trigger(sources)
+
+    def _run(self):
+        while not self._stop.wait(self.tick):
+            try:
+                self.run_pending()
+            except Exception:
+                logger.exception("scheduled scrape could not be queued")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="scrape-scheduler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
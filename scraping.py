@@ -1,63 +1,288 @@
-# Import Splinter, BeautifulSoup, and Pandas
-from splinter import Browser
-from bs4 import BeautifulSoup as soup
-import pandas as pd
+# Import BeautifulSoup and our fetchers (plain HTTP by default, Splinter only when a page needs it)
+from bs4 import BeautifulSoup as soup, SoupStrainer
 import datetime as dt
+import hashlib
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from io import StringIO
+from urllib.parse import urljoin
+
+import metrics
+from facts_table import first_table_rows, render_facts_table
+from extractors import Field, Spec
+from fetchers import BLOCK_HEAVY_RESOURCES, Fetcher
+
+### Source URLs
+NEWS_URL = 'https://mars.nasa.gov/news/'
+JPL_URL = 'https://www.jpl.nasa.gov/spaceimages/?search=&category=Mars'
+JPL_BASE_URL = 'https://www.jpl.nasa.gov'
+FACTS_URL = 'http://space-facts.com/mars/'
+HEMISPHERES_URL = 'https://astrogeology.usgs.gov/search/results?q=hemisphere+enhanced&k1=target&v1=Mars'
+WEATHER_URL = 'https://mars.nasa.gov/insight/weather/'
+
+# Sources whose pages only show their content after JavaScript runs. These are loaded in Chrome;
+# every other source is fetched over plain HTTP. Add "news", "featured_image" or "hemispheres" here if a site
+# starts rendering client-side. The InSight weather page fills its table in with JavaScript.
+JS_SOURCES = {"weather"}
+
+# Resources the browser skips for each source when it is loaded in Chrome (see fetchers.BlockProfile).
+# None of the extractors need images, fonts or styles, only the links to them. If a site's JavaScript stops working
+# without its stylesheets, give it a profile that leaves "stylesheet" out of its resource types.
+BLOCK_PROFILES = {
+    "news": BLOCK_HEAVY_RESOURCES,
+    "featured_image": BLOCK_HEAVY_RESOURCES,
+    "hemispheres": BLOCK_HEAVY_RESOURCES,
+    "weather": BLOCK_HEAVY_RESOURCES,
+}
+
+### HTML parsing settings
+# Parser BeautifulSoup builds its trees with. lxml is several times faster than Python's built-in html.parser,
+# so it is used whenever it's installed. Set MARS_HTML_PARSER to "html.parser", "lxml" or "html5lib" to choose.
+def _default_parser():
+    try:
+        import lxml  # noqa: F401
+    except ImportError:
+        return 'html.parser'
+    return 'lxml'
+
+HTML_PARSER = os.environ.get("MARS_HTML_PARSER") or _default_parser()
+
+# Only build the part of each page an extractor reads (see the strainers below) instead of the whole document
+PARTIAL_PARSING = True
+
+# Strainer test for elements having any of the given classes. While parsing, BeautifulSoup hands strainers the raw
+# class attribute ("collapsible results"), so the classes have to be split before comparing.
+def _has_class(*names):
+    def matches(value):
+        if value is None:
+            return False
+        classes = value.split() if isinstance(value, str) else value
+        return any(name in classes for name in names)
+    return matches
+
+# The parts of each page the extractors look at
+NEWS_STRAINER = SoupStrainer('ul', class_=_has_class('item_list'))
+FULL_IMAGE_STRAINER = SoupStrainer('a', id='full_image')
+FEATURED_IMAGE_STRAINER = SoupStrainer('figure', class_=_has_class('lede'))
+HEMISPHERE_RESULTS_STRAINER = SoupStrainer(class_=_has_class('collapsible', 'pagination'))
+HEMISPHERE_IMAGE_STRAINER = SoupStrainer('ul')
+WEATHER_STRAINER = SoupStrainer('table', class_=_has_class('mb_table'))
+
+# Convert html to a soup object with the configured parser, only keeping the elements parse_only matches
+# (html5lib can't parse partially, so it always builds the whole document)
+def make_soup(html, parse_only=None):
+    if not PARTIAL_PARSING or HTML_PARSER == 'html5lib':
+        parse_only = None
+    return soup(html, HTML_PARSER, parse_only=parse_only)
+
+# What each extractor reads from its page (see extractors.py); the selectors are compiled once, here
+NEWS_SPEC = Spec({
+    "title": Field("div.content_title"),
+    "paragraph": Field("div.article_teaser_body"),
+}, scope="ul.item_list li.slide", parse_only=NEWS_STRAINER)
+NEWS_ARTICLES_SPEC = Spec({
+    "url": Field("div.content_title a", attr="href", join=True, required=True),
+    "title": Field("div.content_title", strip=True),
+    "teaser": Field("div.article_teaser_body", strip=True),
+    "date_text": Field("div.list_date", strip=True),
+}, scope="ul.item_list li.slide", many=True, parse_only=NEWS_STRAINER)
+FULL_IMAGE_SPEC = Spec({"details_url": Field("a#full_image", attr="data-link")}, parse_only=FULL_IMAGE_STRAINER)
+FEATURED_IMAGE_SPEC = Spec({"image_url": Field("figure.lede a img", attr="src")}, parse_only=FEATURED_IMAGE_STRAINER)
+HEMISPHERE_LINKS_SPEC = Spec({
+    "title": Field("h3"),
+    "url": Field(attr="href", join=True, required=True),
+}, scope="div.collapsible.results a:has(h3)", many=True, parse_only=HEMISPHERE_RESULTS_STRAINER)
+HEMISPHERE_NEXT_SPEC = Spec({
+    "url": Field('.pagination a[rel~="next"], .pagination a.next, .pagination li.next a', attr="href", join=True),
+}, parse_only=HEMISPHERE_RESULTS_STRAINER)
+HEMISPHERE_IMAGE_SPEC = Spec({"image_url": Field("ul li a", attr="href")}, parse_only=HEMISPHERE_IMAGE_STRAINER)
+
+# Values parsed from a page are cached with the page (see _parse) under a fingerprint of the extractor code, so a
+# deploy that changes what an extractor returns never reuses values the old code parsed. The specs are part of the
+# fingerprint; bump PARSE_VERSION whenever a parse_* function changes in a way the specs don't show.
+PARSE_VERSION = 1
+PARSE_FINGERPRINT = hashlib.sha1(repr((PARSE_VERSION, [spec.signature() for spec in (
+    NEWS_SPEC, NEWS_ARTICLES_SPEC, FULL_IMAGE_SPEC, FEATURED_IMAGE_SPEC,
+    HEMISPHERE_LINKS_SPEC, HEMISPHERE_NEXT_SPEC, HEMISPHERE_IMAGE_SPEC,
+)])).encode("utf-8")).hexdigest()
+
+# Extractor for the facts table: "builtin" streams the page through facts_table.py and stops after the first table;
+# "pandas" uses pd.read_html (pandas is then imported on first use). Both render the same table HTML.
+FACTS_ENGINE = os.environ.get("MARS_FACTS_ENGINE", "builtin")
+
+### Concurrency settings
+# Seconds each source gets before scrape_all stops waiting for it and records no data for it
+SOURCE_TIMEOUTS = {
+    "news": 30,
+    "featured_image": 30,
+    "facts": 30,
+    "hemispheres": 60,
+    "weather": 60,
+}
+# Times a source is tried before it counts as failed (if its timeout allows), and the wait before the first retry,
+# which doubles for every retry after it
+SOURCE_ATTEMPTS = 2
+RETRY_DELAY = 1
+# Hemisphere detail pages fetched at the same time, and the most search results pages followed
+HEMISPHERE_FANOUT = 8
+HEMISPHERE_MAX_PAGES = 50
 
 # Path to chromedriver (macOS users only)
 # !which chromedriver
 
-# Set the executable path and initialize the chrome browser in splinter
 # Defining scrape_all function to be called on in app.py
-def scrape_all():
-    # Initiate headless driver for deployment
-    browser = Browser("chrome", executable_path="chromedriver", headless=False)
-    
-    # Set our news title and paragraph variables (remember, this function will return two values - news_title, news_p).
-    news_title, news_paragraph = mars_news(browser)
-
-    # Run all scraping functions and store results in a dictionary
-    data = {
-        "news_title": news_title,
-        "news_paragraph": news_paragraph,
-        "featured_image": featured_image(browser),
-        "facts": mars_facts(),
-        "last_modified": dt.datetime.now(),
-        "hemispheres":mars_hemispheres(browser)
-    }
-
-    # Stop webdriver and return data
-    browser.quit()
+# A fetcher can be passed in (for example one pointed at local copies of the pages); otherwise a new one is created
+# and closed when the scrape is done. Chrome is only started if one of the JS_SOURCES is scraped.
+# Every source runs on its own thread (MAX_WORKERS, unless max_workers says otherwise), so the scrape takes about as
+# long as the slowest source.
+# A source that raises or finds nothing is tried again (up to SOURCE_ATTEMPTS times, within its timeout); one error
+# never stops the other sources. The outcome of each source is returned under "sources" (see _source_result), and
+# only the fields of the sources that succeeded are returned, so store.save_scrape keeps the last good value of the
+# others and marks them stale.
+# on_progress, if given, is called with (source, "done"/"empty"/"failed"/"timed out") as each source finishes.
+# Every stage of the scrape is timed (see metrics.py) and the scrape's timing record is returned under "timings".
+# sources, if given, limits the scrape to those sources (names from SOURCES); the fields of the other sources are
+# left out of the returned data, so store.save_scrape keeps their stored values.
+def scrape_all(fetcher=None, max_workers=None, timeouts=None, on_progress=None, sources=None):
+    with metrics.scrape_record() as record:
+        data = _scrape_all(fetcher, max_workers or MAX_WORKERS, timeouts, on_progress, sources)
+    data["timings"] = record.to_dict()
+    return data
+
+def _scrape_all(fetcher, max_workers, timeouts, on_progress, sources):
+    owns_fetcher = fetcher is None
+    if owns_fetcher:
+        fetcher = Fetcher()
+    timeouts = {**SOURCE_TIMEOUTS, **(timeouts or {})}
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scrape")
+    try:
+        started = time.monotonic()
+        futures = {
+            name: metrics.submit(executor, _run_source, name, scrape_source, fetcher, started + timeouts[name])
+            for name, scrape_source in SOURCES.items()
+            if sources is None or name in sources
+        }
+        timed_out = set()
+        if on_progress is not None:
+            def report(name, future):
+                if name not in timed_out and not future.cancelled():
+                    status = future.result()["status"]
+                    on_progress(name, "done" if status == "ok" else status)
+            for name, future in futures.items():
+                future.add_done_callback(lambda future, name=name: report(name, future))
+
+        # Collect each result, giving up on a source once its timeout (counted from the start of the scrape) has passed
+        results = {}
+        for name, future in futures.items():
+            remaining = max(0, started + timeouts[name] - time.monotonic())
+            try:
+                results[name] = future.result(timeout=remaining)
+            except FutureTimeout:
+                results[name] = _source_result("timed out", error=f"no result after {timeouts[name]}s")
+                timed_out.add(name)
+                if on_progress is not None:
+                    on_progress(name, "timed out")
+            outcome = SOURCE_OUTCOMES[results[name]["status"]]
+            metrics.registry.inc("mars_source_results_total", source=name, outcome=outcome)
+    finally:
+        # Don't wait for sources that timed out, then stop webdriver (if one was started)
+        executor.shutdown(wait=False, cancel_futures=True)
+        if owns_fetcher:
+            fetcher.close()
+
+    # Store results in a dictionary and return data
+    data = {"last_modified": dt.datetime.now()}
+    ok = {name: result["value"] for name, result in results.items() if result["status"] == "ok"}
+    # Set our news title and paragraph variables (remember, mars_news returns two values - news_title, news_p).
+    if "news" in ok:
+        data["news_title"], data["news_paragraph"] = ok["news"]
+    for name in ("featured_image", "facts", "hemispheres", "weather"):
+        if name in ok:
+            data[name] = ok[name]
+    data["sources"] = {name: {key: value for key, value in result.items() if key != "value"}
+                       for name, result in results.items()}
     return data
 
+# Outcome label of each source status in the mars_source_results_total metric
+SOURCE_OUTCOMES = {"ok": "ok", "empty": "empty", "failed": "error", "timed out": "timeout"}
+
+## Source result envelope
+# What became of one source in a scrape. status is "ok" (value holds what the source returned), "empty" (the source
+# found nothing to extract, e.g. the page layout changed), "failed" (it raised; error holds the exception) or
+# "timed out". attempts counts how many times the source was tried.
+def _source_result(status, value=None, attempts=0, error=None):
+    return {"status": status, "value": value, "attempts": attempts, "error": error}
+
+def _is_empty(value):
+    return value is None or value == (None, None) or value == []
+
+# Run one source's scraping function, timed as the "source" stage, trying again after an error or an empty result
+# as long as there are attempts left and the retry can start before the source's deadline
+def _run_source(name, scrape_source, fetcher, deadline, attempts=SOURCE_ATTEMPTS, retry_delay=RETRY_DELAY):
+    for attempt in range(1, attempts + 1):
+        try:
+            with metrics.timer("source", source=name):
+                value = scrape_source(fetcher)
+        except Exception as error:
+            result = _source_result("failed", attempts=attempt, error=f"{type(error).__name__}: {error}")
+        else:
+            if not _is_empty(value):
+                return _source_result("ok", value, attempts=attempt)
+            result = _source_result("empty", attempts=attempt)
+
+        delay = retry_delay * 2 ** (attempt - 1)
+        if attempt == attempts or time.monotonic() + delay >= deadline:
+            return result
+        time.sleep(delay)
+
+# Parse a page, reusing the value parsed from the same page content on an earlier scrape when the fetcher has a cache.
+# parse must return plain lists, dicts, strings and numbers so the value can be saved in the cache.
+def _parse(fetcher, url, name, html, parse):
+    def timed_parse(html):
+        with metrics.timer("parse", page=name):
+            return parse(html)
+
+    cache = getattr(fetcher, "cache", None)
+    if cache is None:
+        return timed_parse(html)
+    return cache.parsed(url, f"{name}:{HTML_PARSER}", html, timed_parse, fingerprint=PARSE_FINGERPRINT)
+
 ### Scrape New Title and Paragraph
-# Convert to function by adding 'browser' argument to our function to use the browser variable we defined outside the function.
+# Convert to function by adding 'fetcher' argument to our function to use the fetcher we defined outside the function.
 # change output variables 'news_title' and 'news_p' into the return statement so we can access the resulting variables outside the function
-# Add error handling with a try/except clause to handle AttributeErrors - which come up when the webpage format has changed and scraping code doesn't match with the new HTML elements
-def mars_news(browser):
+def mars_news(fetcher):
     # Visit the mars nasa news site
-    url = 'https://mars.nasa.gov/news/'
-    browser.visit(url)
+    # (the wait is only used when the page is loaded in the browser)
+    html = fetcher.get(NEWS_URL, js="news" in JS_SOURCES, block=BLOCK_PROFILES["news"], wait_css="ul.item_list li.slide")
 
-    # Optional delay for loading the page
-    browser.is_element_present_by_css("ul.item_list li.slide", wait_time=1)
+    news_title, news_p = _parse(fetcher, NEWS_URL, "news", html, parse_news)
+    return news_title, news_p
 
-    # Convert the browser html to a soup object and then quit the browser
-    html = browser.html
-    news_soup = soup(html, 'html.parser')
+# The first slide of the news list holds the latest article. NEWS_SPEC reads its title and teaser paragraph.
+# When the webpage format has changed and the spec doesn't match the new HTML elements, nothing is returned.
+def parse_news(html):
+    news = NEWS_SPEC.extract(html, make_soup=make_soup)
+    if news["title"] is None or news["paragraph"] is None:
+        return None, None
+    return news["title"], news["paragraph"]
 
-    # Add try/except for error handling
-    # By adding try: just before scraping, we're telling Python to look for these elements. If there's an error, Python will continue to run the remainder of the code. If it runs into an AttributeError, however, instead of returning the title and paragraph, Python will return nothing instead.
-    try:
-        slide_elem = news_soup.select_one('ul.item_list li.slide')
-        # Use the parent element to find the first a tag and save it as `news_title`
-        news_title = slide_elem.find("div", class_='content_title').get_text() 
-        # Use the parent element to find the paragraph text
-        news_p = slide_elem.find('div', class_="article_teaser_body").get_text()
+# Every article on a page of the news listing, in page order, for the news archive crawler (news_archive.py):
+# title, teaser, the date as shown ("October 1, 2026"), the date as a datetime (None if it can't be read) and the
+# absolute url of the article
+def parse_news_articles(html, page_url):
+    return news_articles(NEWS_ARTICLES_SPEC.extract(html, page_url, make_soup=make_soup))
 
-    except AttributeError:
-        return None, None
-    return news_title, news_p
+# Add the parsed date to articles read with NEWS_ARTICLES_SPEC
+def news_articles(articles):
+    for article in articles:
+        try:
+            article['date'] = dt.datetime.strptime(article['date_text'], '%B %d, %Y') if article['date_text'] else None
+        except ValueError:
+            article['date'] = None
+    return articles
 
 
 # ## JPL Space Images Featured Image
@@ -66,54 +291,65 @@ def mars_news(browser):
 # 2. Remove prints and return them instead
 # 3. Add error handling: AttributeError
 
-def featured_image(browser):
-    # Visit URL
-    url = 'https://www.jpl.nasa.gov/spaceimages/?search=&category=Mars'
-    browser.visit(url)
-
-    # Find and click the full image button
-    full_image_elem = browser.find_by_id('full_image')[0]
-    full_image_elem.click()
-
-    # Find the more info button and click that
-    browser.is_element_present_by_text('more info', wait_time=1)
-    more_info_elem = browser.links.find_by_partial_text('more info')
-    more_info_elem.click()
+def featured_image(fetcher):
+    js = "featured_image" in JS_SOURCES
 
-    # Parse the resulting html with soup
-    html = browser.html
-    img_soup = soup(html, 'html.parser')
+    # Visit URL
+    html = fetcher.get(JPL_URL, js=js, block=BLOCK_PROFILES["featured_image"], wait_css='#full_image')
 
-    # Add try/except for error handling
-    try:
-        # Find the relative image url
-        img_url_rel = img_soup.select_one('figure.lede a img').get("src")
+    # Instead of clicking the full image button and then the more info button, go to the details page directly
+    details_url_rel = _parse(fetcher, JPL_URL, "featured_image_link", html, parse_featured_image_link)
+    if not details_url_rel:
+        return None
+    details_url = urljoin(JPL_BASE_URL, details_url_rel)
 
-    except AttributeError:
+    # Find the relative image url on the details page
+    html = fetcher.get(details_url, js=js, block=BLOCK_PROFILES["featured_image"], wait_css='figure.lede')
+    img_url_rel = _parse(fetcher, details_url, "featured_image", html, parse_featured_image)
+    if img_url_rel is None:
         return None
 
     # Use the base url to create an absolute url
-    img_url = f'https://www.jpl.nasa.gov{img_url_rel}'
+    img_url = f'{JPL_BASE_URL}{img_url_rel}'
 
     return img_url
 
+# The full image button carries the link to the image's details page in its data-link attribute
+def parse_featured_image_link(html):
+    return FULL_IMAGE_SPEC.extract(html, make_soup=make_soup)["details_url"]
+
+# Find the relative image url on the details page (None if it isn't there)
+def parse_featured_image(html):
+    return FEATURED_IMAGE_SPEC.extract(html, make_soup=make_soup)["image_url"]
+
 # ## Mars Facts
 # Convert code to function for Mars Facts
 # 1. Define the function: mars_facts
 # 2. Remove print statements or wanted outputs into return: df.to_html()
-# 3. Error Handling with try/except: BaseException
-    # A BaseException is a little bit of a catchall when it comes to error handling. 
-    # It is raised when any of the built-in exceptions are encountered and it won't handle any user-defined exceptions. 
-    # We're using it here because we're using Pandas' read_html() function to pull data, instead of scraping with BeautifulSoup and Splinter. 
-    # The data is returned a little differently and can result in errors other than AttributeErrors, which is what we've been addressing so far.
-def mars_facts():
-    # Add try/except for error handling
-    try:
-        # Use 'read_html' to scrape the facts table into a dataframe
-        df = pd.read_html('http://space-facts.com/mars/')[0]
-
-    except BaseException:
-        return None
+# 3. Error Handling: errors are no longer swallowed here with a catch-all BaseException.
+    # The table is read as rows (or with Pandas' read_html()) instead of scraped with BeautifulSoup selectors, so it can
+    # fail with errors other than AttributeErrors. scrape_all catches them for every source, retries the source and
+    # records the error in the source's result, and the last good facts table stays on the page.
+def mars_facts(fetcher):
+    # Download the page through the shared connection pool
+    html = fetcher.get(FACTS_URL)
+    return _parse(fetcher, FACTS_URL, f"facts_{FACTS_ENGINE}", html, parse_facts)
+
+def parse_facts(html):
+    if FACTS_ENGINE == "pandas":
+        return parse_facts_pandas(html)
+
+    # Read the rows of the first table on the page and render them as a bootstrap table
+    rows = first_table_rows(html)
+    if rows is None:
+        raise ValueError("No tables found")
+    return render_facts_table(rows)
+
+def parse_facts_pandas(html):
+    import pandas as pd
+
+    # Use 'read_html' to scrape the facts table into a dataframe
+    df = pd.read_html(StringIO(html))[0]
 
     # Assign columns and set index of dataframe
     df.columns=['Description', 'Mars']
@@ -122,41 +358,134 @@ def mars_facts():
     # Convert dataframe into HTML format, add bootstrap
     return df.to_html(classes="table table-striped")
 
+# ## Mars Hemispheres
+# The detail page link for every hemisphere is read from the search results once, and the detail pages are then
+# fetched in parallel (at most HEMISPHERE_FANOUT at a time) instead of clicking each title and going back.
+# Results that span several pages are followed through their "next" links, and the list keeps the order of the results pages.
+def mars_hemispheres(fetcher, fanout=HEMISPHERE_FANOUT, max_pages=HEMISPHERE_MAX_PAGES):
+    js = "hemispheres" in JS_SOURCES
+
+    # Create a list to hold the titles and the pending image lookups, in results page order.
+    pending = []
+
+    with ThreadPoolExecutor(max_workers=fanout, thread_name_prefix="hemispheres") as executor:
+        # Use the fetcher to visit each page of results
+        url = HEMISPHERES_URL
+        visited = set()
+        while url and url not in visited and len(visited) < max_pages:
+            visited.add(url)
+            html = fetcher.get(url, js=js, block=BLOCK_PROFILES["hemispheres"], wait_css='div.collapsible.results')
+
+            # Parse the HTML and start fetching this page's detail pages before moving on to the next results page
+            results = _parse(fetcher, url, "hemisphere_results", html,
+                             lambda html, url=url: parse_hemisphere_results(html, url))
+            for hemisphere_title, detail_url in results["links"]:
+                pending.append((hemisphere_title, metrics.submit(executor, _hemisphere_image_url, fetcher, detail_url, js)))
+
+            url = results["next"]
+
+        # 3. Retrieve the image urls and titles for each hemisphere.
+        hemisphere_image_urls = [
+            {'image_url': future.result(), 'title': hemisphere_title}
+            for hemisphere_title, future in pending
+        ]
+
+    return hemisphere_image_urls
+
+# Title and absolute detail page url of every hemisphere listed on a results page,
+# and the absolute url of the next page of results (None on the last page). Both specs read the same parsed page.
+def parse_hemisphere_results(html, page_url):
+    html_soup = make_soup(html, HEMISPHERE_RESULTS_STRAINER)
+    links = [(link["title"], link["url"]) for link in HEMISPHERE_LINKS_SPEC.apply(html_soup, page_url)]
+    return {"links": links, "next": HEMISPHERE_NEXT_SPEC.apply(html_soup, page_url)["url"]}
+
+def _hemisphere_image_url(fetcher, detail_url, js):
+    html = fetcher.get(detail_url, js=js, block=BLOCK_PROFILES["hemispheres"], wait_css='ul li a')
+    return _parse(fetcher, detail_url, "hemisphere_image", html, parse_hemisphere_image)
+
+# Parse a hemisphere detail page with soup and get link to the full resolution image
+def parse_hemisphere_image(html):
+    image_url = HEMISPHERE_IMAGE_SPEC.extract(html, make_soup=make_soup)["image_url"]
+    if image_url is None:
+        raise ValueError("No full resolution image link on the hemisphere page")
+    return image_url
+
+# ### Mars Weather
+# The InSight Daily Weather Report table (table.mb_table) lists the latest sols, one row each. Every row is kept:
+# worker.scrape_and_save adds them to the weather collection (see weather.py), which builds up a time series.
+def mars_weather(fetcher):
+    html = fetcher.get(WEATHER_URL, js="weather" in JS_SOURCES, block=BLOCK_PROFILES["weather"], wait_css='table.mb_table')
+    return _parse(fetcher, WEATHER_URL, "weather", html, parse_weather)
+
+# Columns of the weather table, recognized by words in their header cells ("Sol", "Date", "High", "Low",
+# "Pressure", "Wind"); the first matching word wins
+WEATHER_COLUMNS = [
+    ("sol", "sol"),
+    ("date", "date"),
+    ("max_temp", "high"),
+    ("max_temp", "max"),
+    ("min_temp", "low"),
+    ("min_temp", "min"),
+    ("pressure", "pressure"),
+    ("wind_speed", "wind"),
+]
+WEATHER_DATE_FORMATS = ['%b. %d, %Y', '%b %d, %Y', '%B %d, %Y', '%Y-%m-%d']
+_NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+
+# One dict per row of the weather table: sol (an int), date (ISO 8601, "2020-10-19") and the readings as numbers
+# (None where a cell is blank). Rows without a sol are left out; an empty list means the table wasn't found.
+def parse_weather(html):
+    weather_soup = make_soup(html, WEATHER_STRAINER)
+    weather_table = weather_soup.select_one('table.mb_table')
+    if weather_table is None:
+        return []
+
+    rows = weather_table.find_all('tr')
+    if not rows:
+        return []
+    columns = []
+    for cell in rows[0].find_all(['th', 'td']):
+        header = cell.get_text(" ").strip().lower()
+        columns.append(next((name for name, word in WEATHER_COLUMNS if word in header), None))
+
+    observations = []
+    for row in rows[1:]:
+        cells = [cell.get_text(" ").strip() for cell in row.find_all(['th', 'td'])]
+        observation = {}
+        for name, text in zip(columns, cells):
+            if name is None or name in observation:
+                continue
+            observation[name] = _weather_date(text) if name == "date" else _weather_number(text)
+        if observation.get("sol") is None:
+            continue
+        observation["sol"] = int(observation["sol"])
+        observations.append(observation)
+    return observations
+
+def _weather_number(text):
+    match = _NUMBER.search(text.replace(',', ''))
+    return float(match.group()) if match else None
+
+def _weather_date(text):
+    for date_format in WEATHER_DATE_FORMATS:
+        try:
+            return dt.datetime.strptime(text, date_format).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+# Scraping function for each source, keyed by the name used in JS_SOURCES and SOURCE_TIMEOUTS
+SOURCES = {
+    "news": mars_news,
+    "featured_image": featured_image,
+    "facts": mars_facts,
+    "hemispheres": mars_hemispheres,
+    "weather": mars_weather,
+}
+# None of the sources depend on each other, so scrape_all gives each one its own thread
+MAX_WORKERS = len(SOURCES)
+
 if __name__ == "__main__":
 
     # If running as script, print scraped data
     print(scrape_all())
-
-def mars_hemispheres(browser):
-    # Use browser to visit the URL 
-    url = 'https://astrogeology.usgs.gov/search/results?q=hemisphere+enhanced&k1=target&v1=Mars'
-    browser.visit(url)
-
-    # Create a list to hold the images and titles.
-    hemisphere_image_urls = []
-
-    # 3. Write code to retrieve the image urls and titles for each hemisphere.
-    # Parse the HTML
-    html = browser.html
-    html_soup = soup(html, 'html.parser')
-
-    title_items= html_soup.find('div', class_='collapsible results')
-
-    titles = title_items.find_all('h3')
-
-    for title in titles:
-        # Convert title to text and click link by title
-        hemisphere_title = title.text
-        title_elem = browser.links.find_by_partial_text(hemisphere_title)
-        title_elem.click()
-        
-        # Parse the resulting html with soup and get link to image
-        html = browser.html
-        img_soup = soup(html, 'html.parser')
-        hemisphere_url= img_soup.select_one('ul li a').get("href")
-            
-        hemisphere = {'image_url':hemisphere_url, 'title':hemisphere_title}
-        hemisphere_image_urls.append(hemisphere)
-        browser.visit(url)
-
-    return hemisphere_image_urls
\ No newline at end of file
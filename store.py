@@ -0,0 +1,211 @@
+# Saving scraped data to Mongo.
+# The mars document is split into sections, one per scraping source. Each section's content is hashed, and only the
+# sections whose hash changed since the last scrape are written, with a partial $set update.
+# Every scrape is also appended to the mars_history collection so earlier snapshots can be looked up. A history record
+# only holds the sections that changed in its scrape; a full snapshot is put together from the latest change of each.
+import datetime as dt
+import hashlib
+import json
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+
+# Fields of the mars document that belong to each section (named like the sources in scraping.SOURCES)
+SECTIONS = {
+    "news": ("news_title", "news_paragraph"),
+    "featured_image": ("featured_image",),
+    "facts": ("facts",),
+    "hemispheres": ("hemispheres",),
+}
+
+
+# Every field that makes up a snapshot of the data
+SNAPSHOT_FIELDS = tuple(field for fields in SECTIONS.values() for field in fields)
+
+
+# Indexes for the history queries: by scrape number (the pagination cursor), by time and by news title
+def ensure_indexes(db):
+    db.mars_history.create_index([("scrape", DESCENDING)], unique=True)
+    db.mars_history.create_index([("last_modified", DESCENDING)])
+    db.mars_history.create_index([("news_title", ASCENDING)])
+    # The latest change of each section at or before a scrape, for putting snapshots together
+    db.mars_history.create_index([("changed", ASCENDING), ("scrape", DESCENDING)])
+
+
+# Stable hash of a section's fields
+def section_hash(data, section):
+    content = {field: data.get(field) for field in SECTIONS[section]}
+    encoded = json.dumps(content, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()
+
+
+# Write the sections of data that changed since the stored document, then append the scrape to the history.
+# Each written section gets its own section_modified.<section> time, and the document's last_modified only moves
+# when at least one section changed. Every section in data, changed or not, gets section_scraped.<section> (when it
+# was last scraped, which the scheduler goes by). Sections missing from data are left as they are.
+# data["sources"], if present, holds the outcome of each source (see scraping._source_result). It is saved as
+# section_status.<section>; a section whose source didn't succeed keeps its last good value and is marked stale
+# (with stale_since, the time of the first failure in a row) until the source succeeds again.
+# The document counts scrapes ("scrape") and data changes ("version"); both are returned with the changed sections,
+# the stale sections and whether any section became stale or fresh again (which also counts as a change of version,
+# so the page shows it).
+def save_scrape(db, data):
+    collection = db.mars
+    stored = collection.find_one({}, {"section_hashes": 1, "section_status": 1}) or {}
+    stored_hashes = stored.get("section_hashes", {})
+    stored_status = stored.get("section_status", {})
+    now = data.get("last_modified") or dt.datetime.now()
+
+    update = {}
+    changed = []
+    for section, fields in SECTIONS.items():
+        if not all(field in data for field in fields):
+            continue
+        update[f"section_scraped.{section}"] = now
+        digest = section_hash(data, section)
+        if stored_hashes.get(section) == digest:
+            continue
+
+        changed.append(section)
+        for field in fields:
+            update[field] = data[field]
+        update[f"section_hashes.{section}"] = digest
+        update[f"section_modified.{section}"] = now
+
+    freshness_changed = False
+    for section, result in data.get("sources", {}).items():
+        stale = result["status"] != "ok"
+        previous = stored_status.get(section, {})
+        status = {"status": result["status"], "attempts": result["attempts"], "error": result["error"], "stale": stale}
+        if stale:
+            status["stale_since"] = previous.get("stale_since") or now
+        update[f"section_scraped.{section}"] = now
+        update[f"section_status.{section}"] = status
+        freshness_changed = freshness_changed or stale != previous.get("stale", False)
+
+    operations = {"$inc": {"scrape": 1, "version": 1 if changed or freshness_changed else 0}}
+    if changed:
+        update["last_modified"] = now
+    # The timing record of the latest scrape is kept whether or not the data changed
+    if data.get("timings") is not None:
+        update["timings"] = data["timings"]
+    if update:
+        operations["$set"] = update
+    mars = collection.find_one_and_update(
+        {},
+        operations,
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+
+    # The history record is numbered by scrape and holds only the fields of the sections that changed in it
+    # (the timings of the latest scrape stay on the mars document)
+    record = {field: data[field] for section in changed for field in SECTIONS[section]}
+    record.update({"scrape": mars["scrape"], "version": mars["version"], "last_modified": now, "changed": changed})
+    db.mars_history.insert_one(record)
+
+    stale = sorted(stale_sections(mars))
+    return {"changed": changed, "stale": stale, "status_changed": freshness_changed, "version": mars["version"],
+            "scrape": mars["scrape"]}
+
+
+# Move the data version on without changing the data (for example when new local copies of its images are ready),
+# so cached pages are rendered again. Returns the new version.
+def bump_version(db):
+    mars = db.mars.find_one_and_update({}, {"$inc": {"version": 1}}, return_document=ReturnDocument.AFTER)
+    return mars["version"] if mars else None
+
+
+# When each section was last scraped, as {section: datetime}; sections never scraped are left out
+def last_scraped(db):
+    mars = db.mars.find_one({}, {"section_scraped": 1}) or {}
+    return mars.get("section_scraped", {})
+
+
+# Sections showing their last good value because their latest scrape failed, as {section: status}
+def stale_sections(mars):
+    statuses = (mars or {}).get("section_status", {})
+    return {section: status for section, status in statuses.items() if status.get("stale")}
+
+
+### JSON API queries
+# Fields /api/mars serves from the mars document, and the fields of each section's endpoint (the section's own
+# fields, when it last changed and the status of its latest scrape)
+API_FIELDS = SNAPSHOT_FIELDS + ("last_modified", "version", "section_modified", "section_status")
+SECTION_API_FIELDS = ("modified", "status")
+
+
+def api_fields(section=None):
+    if section is None:
+        return API_FIELDS
+    return SECTIONS[section] + SECTION_API_FIELDS
+
+
+# The given fields (all of them by default) of the mars document or of one section, or None before the first scrape.
+# Only those fields are read from Mongo.
+def api_document(db, section=None, fields=None):
+    fields = fields or api_fields(section)
+    if section is None:
+        return db.mars.find_one({}, {"_id": 0, **{field: 1 for field in fields}})
+
+    section_fields = [field for field in fields if field in SECTIONS[section]]
+    projection = {"_id": 0, **{field: 1 for field in section_fields}}
+    if "modified" in fields:
+        projection[f"section_modified.{section}"] = 1
+    if "status" in fields:
+        projection[f"section_status.{section}"] = 1
+    mars = db.mars.find_one({}, projection)
+    if mars is None:
+        return None
+
+    document = {field: mars.get(field) for field in section_fields}
+    if "modified" in fields:
+        document["modified"] = mars.get("section_modified", {}).get(section)
+    if "status" in fields:
+        document["status"] = mars.get("section_status", {}).get(section)
+    return document
+
+
+### History queries
+# Projection that leaves Mongo's _id out of the records
+SNAPSHOT_PROJECTION = {"_id": 0}
+
+
+# The full snapshot as of a history record: the sections that changed in its scrape come from the record itself,
+# every other section from the latest earlier record it changed in (one indexed lookup per section)
+def snapshot(db, record):
+    if record is None:
+        return None
+    document = {}
+    for section, fields in SECTIONS.items():
+        source = record
+        if section not in record.get("changed", []):
+            source = db.mars_history.find_one(
+                {"changed": section, "scrape": {"$lt": record["scrape"]}},
+                {"_id": 0, **{field: 1 for field in fields}},
+                sort=[("scrape", DESCENDING)],
+            ) or {}
+        document.update({field: source.get(field) for field in fields})
+    document.update({key: record.get(key) for key in ("scrape", "version", "last_modified", "changed")})
+    return document
+
+
+def latest_snapshot(db):
+    return snapshot(db, db.mars_history.find_one({}, SNAPSHOT_PROJECTION, sort=[("scrape", DESCENDING)]))
+
+
+# Snapshot that was current at the given time (the last scrape at or before it)
+def snapshot_at(db, when):
+    return snapshot(db, db.mars_history.find_one(
+        {"last_modified": {"$lte": when}}, SNAPSHOT_PROJECTION, sort=[("last_modified", DESCENDING)]))
+
+
+# One page of history records, newest first: each scrape with the sections that changed in it. Pages are walked with
+# a range cursor on the scrape number: pass the last scrape number of a page as `before` to get the next page.
+# news_title finds the scrape that brought in that news article.
+def history(db, before=None, limit=20, news_title=None):
+    query = {}
+    if before is not None:
+        query["scrape"] = {"$lt": before}
+    if news_title is not None:
+        query["news_title"] = news_title
+    return list(db.mars_history.find(query, SNAPSHOT_PROJECTION).sort("scrape", DESCENDING).limit(limit))
@@ -0,0 +1,49 @@
+# Shared fixtures for the test suite.
+# Scrapes run against the pages recorded in Resources/fixtures, served by replay.ReplayServer, so no test needs
+# the network.
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from replay import FIXTURES_DIR, ReplayFetcher, ReplayServer  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def replay_server():
+    with ReplayServer(FIXTURES_DIR) as server:
+        yield server
+
+
+# A fetcher that reads every page from the replay server, without caching or rate limits
+@pytest.fixture
+def replay_fetcher(replay_server):
+    fetcher = ReplayFetcher(replay_server.url)
+    yield fetcher
+    fetcher.close()
+
+
+# The Flask app, connected to an in-memory mongomock database instead of a Mongo server
+@pytest.fixture(scope="session")
+def app_module():
+    import flask_pymongo
+    import mongomock
+
+    class MockPyMongo:
+        def __init__(self, app):
+            self.cx = mongomock.MongoClient()
+            self.db = self.cx.mars_app
+
+    flask_pymongo.PyMongo = MockPyMongo
+    import app
+    return app
+
+
+# A test client of the app, starting from an empty database and an empty page cache
+@pytest.fixture
+def client(app_module):
+    app_module.mongo.cx.drop_database("mars_app")
+    app_module.page_cache.invalidate()
+    return app_module.app.test_client()
@@ -0,0 +1,106 @@
+import datetime as dt
+import gzip
+
+import pytest
+
+JOB = {"id": "job-1", "key": "scrape_all", "params": {"sources": ["news"]}, "status": "queued", "progress": {},
+       "result": None, "error": None, "created": "2020-10-19T12:00:00", "started": None, "finished": None}
+
+
+@pytest.fixture
+def queued_job(monkeypatch, app_module):
+    monkeypatch.setattr(app_module.scheduler, "trigger", lambda sources=None: dict(JOB))
+
+
+@pytest.fixture
+def nothing_due(monkeypatch, app_module):
+    monkeypatch.setattr(app_module.scheduler, "trigger", lambda sources=None: None)
+    monkeypatch.setattr(app_module.scheduler, "retry_after", lambda: {"news": 120})
+
+
+def test_scrape_answers_json_with_the_job(client, queued_job):
+    response = client.get("/scrape", headers={"Accept": "application/json"})
+
+    assert response.status_code == 202
+    assert response.json["id"] == "job-1"
+    assert response.json["status_url"] == "/scrape/job-1"
+
+
+def test_scrape_answers_json_when_everything_is_fresh(client, nothing_due):
+    response = client.get("/scrape", headers={"Accept": "application/json"})
+
+    assert response.status_code == 200
+    assert response.json == {"status": "fresh", "retry_after": {"news": 120}}
+
+
+@pytest.mark.parametrize("trigger", ["queued_job", "nothing_due"])
+def test_scrape_sends_browsers_back_to_the_homepage(client, request, trigger):
+    request.getfixturevalue(trigger)
+    response = client.get("/scrape", headers={"Accept": "text/html,application/xhtml+xml,*/*;q=0.8"})
+
+    assert response.status_code == 302
+    assert response.headers["Location"] == "/"
+
+
+def test_homepage_button_follows_the_job(client):
+    html = client.get("/").get_data(as_text=True)
+
+    assert 'id="scrape-button"' in html
+    assert 'href="/scrape"' in html
+    assert "status_url" in html
+
+
+## JSON API
+FACTS = "<table>" + "".join(f"<tr><td>Fact {number}</td><td>Value {number}</td></tr>" for number in range(40)) + "</table>"
+
+
+@pytest.fixture
+def mars(client, app_module):
+    app_module.mongo.db.mars.insert_one({
+        "news_title": "Title", "news_paragraph": "Paragraph", "featured_image": "https://site/image.jpg",
+        "facts": FACTS, "hemispheres": [], "version": 1, "last_modified": dt.datetime(2020, 10, 19, 12),
+        "section_modified": {"news": dt.datetime(2020, 10, 19, 12)}, "section_status": {"news": {"ok": True}},
+    })
+    return client
+
+
+def test_api_fields_keeps_only_the_listed_fields(mars):
+    assert mars.get("/api/mars?fields=news_title, facts").json == {"news_title": "Title", "facts": FACTS}
+    assert mars.get("/api/mars/news?fields=news_title").json == {"news_title": "Title"}
+    assert set(mars.get("/api/mars").json) == {"news_title", "news_paragraph", "featured_image", "facts",
+                                               "hemispheres", "version", "last_modified", "section_modified",
+                                               "section_status"}
+
+
+@pytest.mark.parametrize("url", ["/api/mars?fields=news_title,secret", "/api/mars/news?fields=facts"])
+def test_api_unknown_fields_are_rejected(mars, url):
+    response = mars.get(url)
+    assert response.status_code == 400
+    assert b"Unknown fields" in response.data
+
+
+def test_api_unknown_section_is_not_found(mars):
+    assert mars.get("/api/mars/weather_report").status_code == 404
+
+
+def test_api_etag_names_each_encoding(mars):
+    plain = mars.get("/api/mars", headers={"Accept-Encoding": "identity"})
+    compressed = mars.get("/api/mars", headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in plain.headers
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["Vary"]
+    assert gzip.decompress(compressed.data) == plain.data
+    plain_etag, compressed_etag = plain.get_etag()[0], compressed.get_etag()[0]
+    assert compressed_etag == f"{plain_etag}-gzip"
+
+
+def test_api_if_none_match_answers_304_for_the_compressed_body(mars):
+    etag = mars.get("/api/mars", headers={"Accept-Encoding": "gzip"}).get_etag()[0]
+
+    again = mars.get("/api/mars", headers={"Accept-Encoding": "gzip", "If-None-Match": f'"{etag}"'})
+    assert again.status_code == 304
+    assert again.data == b""
+    # The compressed body's ETag doesn't match the uncompressed body
+    plain = mars.get("/api/mars", headers={"Accept-Encoding": "identity", "If-None-Match": f'"{etag}"'})
+    assert plain.status_code == 200
@@ -0,0 +1,133 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from fetchers import BrowserPool
+
+
+## Stand-in for a splinter browser
+class FakeBrowser:
+    def __init__(self):
+        self.healthy = True
+        self.quit_called = False
+        self.cookies = SimpleNamespace(delete=lambda: None)
+        self.driver = SimpleNamespace(execute_cdp_cmd=lambda *args: None)
+
+    def visit(self, url):
+        pass
+
+    def quit(self):
+        self.quit_called = True
+
+
+class FakePool(BrowserPool):
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.launched = []
+
+    def _launch(self):
+        browser = FakeBrowser()
+        self.launched.append(browser)
+        return browser
+
+    def is_healthy(self, browser):
+        return browser.healthy
+
+
+# Acquire a browser on another thread, returning the thread and where its browser ends up
+def acquire_in_thread(pool, timeout=5):
+    result = {}
+
+    def borrow():
+        try:
+            result["browser"] = pool.acquire(timeout=timeout)
+        except TimeoutError as error:
+            result["error"] = error
+
+    thread = threading.Thread(target=borrow, daemon=True)
+    thread.start()
+    return thread, result
+
+
+def test_waiting_borrower_gets_a_returned_browser():
+    pool = FakePool(size=1)
+    browser = pool.acquire()
+    thread, result = acquire_in_thread(pool)
+    thread.join(0.2)
+    assert thread.is_alive()
+
+    pool.release(browser)
+    thread.join(2)
+    assert result == {"browser": browser}
+
+
+def test_waiting_borrower_replaces_a_worn_out_browser():
+    pool = FakePool(size=1, max_uses=1)
+    browser = pool.acquire()
+    thread, result = acquire_in_thread(pool)
+    thread.join(0.2)
+
+    # The browser is retired on release, which must wake the waiting borrower so it launches a new one
+    pool.release(browser)
+    thread.join(2)
+    assert not thread.is_alive()
+    assert browser.quit_called
+    assert result["browser"] is pool.launched[1]
+
+
+def test_waiting_borrower_replaces_a_browser_that_fails_to_reset():
+    pool = FakePool(size=1)
+    browser = pool.acquire()
+    thread, result = acquire_in_thread(pool)
+    thread.join(0.2)
+
+    def broken_reset():
+        raise RuntimeError("tab crashed")
+
+    browser.cookies = SimpleNamespace(delete=broken_reset)
+    pool.release(browser)
+    thread.join(2)
+    assert result["browser"] is pool.launched[1]
+
+
+def test_unhealthy_idle_browser_is_replaced():
+    pool = FakePool(size=1)
+    browser = pool.acquire()
+    pool.release(browser)
+    browser.healthy = False
+
+    assert pool.acquire() is pool.launched[1]
+    assert browser.quit_called
+
+
+def test_acquire_times_out_when_every_browser_is_busy():
+    pool = FakePool(size=1)
+    pool.acquire()
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.1)
+
+
+def test_pool_never_exceeds_its_size():
+    pool = FakePool(size=2, max_uses=1)
+    in_use = []
+    most_in_use = []
+    lock = threading.Lock()
+
+    def borrow():
+        with pool.browser(timeout=5) as browser:
+            with lock:
+                in_use.append(browser)
+                most_in_use.append(len(in_use))
+            with lock:
+                in_use.remove(browser)
+
+    threads = [threading.Thread(target=borrow) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert not any(thread.is_alive() for thread in threads)
+    assert max(most_in_use) <= 2
+    assert len(pool.launched) == 8
@@ -0,0 +1,56 @@
+import pytest
+import soupsieve
+from bs4 import BeautifulSoup
+
+from extractors import Field, FindSelector, Spec, compile_selector
+
+# Nested and repeated matches, elements with several classes, text between tags
+HTML = """
+<div class="outer box"><ul class="item_list">
+  <li class="slide first"><div class="content_title"><a href="/a">A</a></div></li>
+  text
+  <li class="slide"><div class="content_title">No link</div>
+    <ul class="item_list"><li class="slide"><div class="content_title"><a href="/nested">Nested</a></div></li></ul>
+  </li>
+</ul></div>
+<ul class="item_list"><li class="slide"><div class="content_title"><a href="/b" id="last">B</a></div></li></ul>
+<figure class="lede"><a href="/full"><img src="/image.jpg"></a></figure>
+"""
+
+SIMPLE_SELECTORS = [
+    "li", "li.slide", ".slide", "ul.item_list li.slide", "div.content_title a", "ul li a", "a#last", "#last",
+    "figure.lede a img", "div.outer li.first a", "li.missing", "ul.item_list li.slide div.content_title a",
+]
+
+
+@pytest.fixture(scope="module")
+def soup():
+    return BeautifulSoup(HTML, "html.parser")
+
+
+@pytest.mark.parametrize("selector", SIMPLE_SELECTORS)
+def test_simple_selectors_match_like_soupsieve(soup, selector):
+    compiled = compile_selector(selector)
+    assert isinstance(compiled, FindSelector)
+    assert compiled.select(soup) == soupsieve.select(selector, soup)
+    assert compiled.select_one(soup) is soupsieve.select_one(selector, soup)
+
+
+@pytest.mark.parametrize("selector", ["div.collapsible.results", "a:has(h3)", "ul > li", 'a[rel~="next"]', "a, b"])
+def test_other_selectors_are_compiled_with_soupsieve(selector):
+    assert not isinstance(compile_selector(selector), FindSelector)
+
+
+def test_spec_reads_every_scope_once_in_document_order(soup):
+    spec = Spec({
+        "title": Field("div.content_title", strip=True),
+        "url": Field("div.content_title a", attr="href", join=True, required=True),
+    }, scope="ul.item_list li.slide", many=True)
+
+    assert spec.apply(soup, "https://site/news/") == [
+        {"title": "A", "url": "https://site/a"},
+        # Like a CSS descendant selector, the field reads the link of the item nested inside this one
+        {"title": "No link", "url": "https://site/nested"},
+        {"title": "Nested", "url": "https://site/nested"},
+        {"title": "B", "url": "https://site/b"},
+    ]
@@ -0,0 +1,202 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from fetchers import HttpFetcher
+from http_cache import HttpCache
+
+LAST_MODIFIED = "Mon, 19 Oct 2020 12:00:00 GMT"
+
+
+## Stand-in site that sends validators
+# pages maps a path to (body, headers). A request whose If-None-Match or If-Modified-Since matches the page's
+# validator gets a 304. Every request's path, conditional headers and status are logged.
+class ValidatingServer:
+    def __init__(self):
+        self.pages = {}
+        self.log = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body, headers = server.pages[self.path]
+                conditional = {name: self.headers[name] for name in ("If-None-Match", "If-Modified-Since")
+                               if self.headers.get(name)}
+                not_modified = (
+                    (headers.get("ETag") and conditional.get("If-None-Match") == headers["ETag"])
+                    or (headers.get("Last-Modified") and conditional.get("If-Modified-Since") == headers["Last-Modified"])
+                )
+                server.log.append((self.path, conditional, 304 if not_modified else 200))
+                self.send_response(304 if not_modified else 200)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if not_modified:
+                    self.end_headers()
+                    return
+                encoded = body.encode("utf-8")
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def url(self, path):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{path}"
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture(scope="module")
+def validating_server():
+    server = ValidatingServer()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def site(validating_server):
+    validating_server.pages.clear()
+    validating_server.log.clear()
+    return validating_server
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return HttpCache(str(tmp_path / "http_cache"))
+
+
+@pytest.fixture
+def fetcher(cache):
+    fetcher = HttpFetcher(session=requests.Session(), cache=cache, limiter=False)
+    yield fetcher
+    fetcher.session.close()
+
+
+def test_etag_revalidation_reuses_the_stored_page(site, fetcher):
+    site.pages["/news"] = ("<p>news</p>", {"ETag": '"v1"'})
+
+    assert fetcher.get(site.url("/news")) == "<p>news</p>"
+    assert fetcher.get(site.url("/news")) == "<p>news</p>"
+    assert site.log == [("/news", {}, 200), ("/news", {"If-None-Match": '"v1"'}, 304)]
+
+
+def test_last_modified_revalidation_reuses_the_stored_page(site, fetcher):
+    site.pages["/facts"] = ("<table></table>", {"Last-Modified": LAST_MODIFIED})
+
+    fetcher.get(site.url("/facts"))
+    assert fetcher.get(site.url("/facts")) == "<table></table>"
+    assert site.log[-1] == ("/facts", {"If-Modified-Since": LAST_MODIFIED}, 304)
+
+
+def test_changed_page_is_downloaded_and_stored_again(site, fetcher):
+    site.pages["/news"] = ("<p>old</p>", {"ETag": '"v1"'})
+    fetcher.get(site.url("/news"))
+    site.pages["/news"] = ("<p>new</p>", {"ETag": '"v2"'})
+
+    assert fetcher.get(site.url("/news")) == "<p>new</p>"
+    assert fetcher.get(site.url("/news")) == "<p>new</p>"
+    assert [status for _, _, status in site.log] == [200, 200, 304]
+    assert site.log[-1][1] == {"If-None-Match": '"v2"'}
+
+
+def test_page_without_validators_is_not_stored(site, fetcher, cache):
+    site.pages["/plain"] = ("<p>plain</p>", {})
+    fetcher.get(site.url("/plain"))
+    fetcher.get(site.url("/plain"))
+
+    assert [conditional for _, conditional, _ in site.log] == [{}, {}]
+    assert cache.conditional_headers(site.url("/plain")) == {}
+
+
+def test_parsed_value_is_reused_for_the_same_body(site, fetcher, cache):
+    site.pages["/news"] = ("<p>news</p>", {"ETag": '"v1"'})
+    url = site.url("/news")
+    calls = []
+
+    def parse(body):
+        calls.append(body)
+        return {"length": len(body)}
+
+    for _ in range(2):
+        assert cache.parsed(url, "news", fetcher.get(url), parse) == {"length": 11}
+    assert calls == ["<p>news</p>"]
+
+    # A different body under the same url is parsed again
+    assert cache.parsed(url, "news", "<p>other news</p>", parse) == {"length": 17}
+    assert len(calls) == 2
+
+
+def test_parsed_value_is_dropped_when_the_extractor_changes(site, fetcher, cache):
+    site.pages["/news"] = ("<p>news</p>", {"ETag": '"v1"'})
+    url = site.url("/news")
+    body = fetcher.get(url)
+
+    assert cache.parsed(url, "news", body, lambda body: None, fingerprint="old") is None
+    assert cache.parsed(url, "title", body, lambda body: "old title", fingerprint="old") == "old title"
+    # The same body, parsed by fixed extractor code, isn't answered from the old code's values
+    assert cache.parsed(url, "news", body, lambda body: "news", fingerprint="new") == "news"
+    assert cache.parsed(url, "news", body, lambda body: "parsed again", fingerprint="new") == "news"
+
+    # Values saved under the old fingerprint were dropped with the new save
+    assert set(cache._read_meta(cache._key(url))["parsed"]) == {"news"}
+
+
+def test_spec_signature_changes_with_the_selectors():
+    from extractors import Field, Spec
+
+    spec = Spec({"title": Field("div.content_title")}, scope="li.slide")
+    assert spec.signature() == Spec({"title": Field("div.content_title")}, scope="li.slide").signature()
+    assert spec.signature() != Spec({"title": Field("div.headline")}, scope="li.slide").signature()
+    assert spec.signature() != Spec({"title": Field("div.content_title", strip=True)}, scope="li.slide").signature()
+    assert spec.signature() != Spec({"title": Field("div.content_title")}, scope="li.item").signature()
+
+
+def test_least_recently_used_page_is_evicted_past_max_bytes(tmp_path):
+    cache = HttpCache(str(tmp_path / "http_cache"), max_bytes=1500)
+    page = "x" * 300
+    for name in ("a", "b"):
+        cache.store(f"http://site/{name}", page, etag=f'"{name}"')
+    # Reading a marks it as recently used, so b is the oldest when c pushes the cache over max_bytes
+    assert cache.body("http://site/a") == page
+    cache.store("http://site/c", page, etag='"c"')
+    cache.store("http://site/d", page, etag='"d"')
+
+    assert cache.conditional_headers("http://site/b") == {}
+    assert cache.body("http://site/b") is None
+    assert cache.body("http://site/a") == page
+    assert cache.body("http://site/d") == page
+
+
+def test_eviction_order_survives_a_restart(tmp_path):
+    directory = str(tmp_path / "http_cache")
+    cache = HttpCache(directory, max_bytes=10_000)
+    for name in ("a", "b"):
+        cache.store(f"http://site/{name}", "x" * 300, etag=f'"{name}"')
+    meta_path = os.path.join(directory, cache._key("http://site/a") + ".json")
+    os.utime(meta_path, (1, 1))
+
+    reopened = HttpCache(directory, max_bytes=10_000)
+    assert next(iter(reopened._sizes)) == cache._key("http://site/a")
+
+
+def test_missing_body_after_a_304_is_downloaded_in_full(site, fetcher, cache):
+    site.pages["/hemispheres"] = ("<ul></ul>", {"ETag": '"v1"'})
+    url = site.url("/hemispheres")
+    fetcher.get(url)
+    # The body is gone (evicted by another process) but its validators are still there
+    os.remove(os.path.join(cache.directory, cache._key(url) + ".body"))
+
+    assert fetcher.get(url) == "<ul></ul>"
+    assert site.log[1:] == [("/hemispheres", {"If-None-Match": '"v1"'}, 304), ("/hemispheres", {}, 200)]
+    assert cache.body(url) == "<ul></ul>"
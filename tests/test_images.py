@@ -0,0 +1,22 @@
+import logging
+
+import mongomock
+
+import images
+
+
+def test_failed_download_is_logged_and_skipped(monkeypatch, tmp_path, caplog):
+    def download(url, media_dir):
+        raise OSError("connection refused")
+
+    monkeypatch.setattr(images, "download", download)
+    mars = {"featured_image": "https://site/featured.jpg", "hemispheres": [{"image_url": "https://site/cerberus.jpg"}]}
+
+    with caplog.at_level(logging.WARNING, logger="images"):
+        result = images.mirror_images(mongomock.MongoClient().mars_app, mars, str(tmp_path))
+
+    assert result == {"downloaded": 0, "thumbnails": 0}
+    assert [record.getMessage() for record in caplog.records] == [
+        "could not mirror https://site/featured.jpg: OSError('connection refused')",
+        "could not mirror https://site/cerberus.jpg: OSError('connection refused')",
+    ]
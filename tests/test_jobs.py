@@ -0,0 +1,167 @@
+import datetime as dt
+import queue as queue_module
+import time
+import urllib.request
+
+import mongomock
+import pytest
+
+import metrics
+import worker
+from jobs import MongoJobQueue
+
+
+@pytest.fixture
+def queue():
+    return MongoJobQueue(mongomock.MongoClient().mars_app)
+
+
+def expire(queue, job_id):
+    queue.collection.update_one({"_id": job_id}, {"$set": {"lease_until": dt.datetime.now() - dt.timedelta(seconds=1)}})
+
+
+def test_claim_leases_the_job(queue):
+    job = queue.submit("scrape_all")
+    claimed = queue.claim("worker-1")
+
+    assert claimed["id"] == job["id"] and claimed["status"] == "running"
+    document = queue.collection.find_one({"_id": job["id"]})
+    assert document["worker"] == "worker-1"
+    assert document["lease_until"] > dt.datetime.now()
+
+
+def test_expired_job_is_requeued_and_claimed_again(queue):
+    job = queue.submit("scrape_all")
+    queue.claim("dead-worker")
+    expire(queue, job["id"])
+
+    # The next claim takes the abandoned job back, and the key no longer points at a dead job
+    claimed = queue.claim("worker-2")
+    assert claimed["id"] == job["id"]
+    assert queue.collection.find_one({"_id": job["id"]})["worker"] == "worker-2"
+    assert queue.active("scrape_all")["id"] == job["id"]
+    assert not queue.heartbeat(job["id"], "dead-worker")
+
+
+def test_worker_that_lost_its_lease_cannot_touch_the_job_again(queue):
+    job = queue.submit("scrape_all")
+    queue.claim("slow-worker")
+    expire(queue, job["id"])
+    queue.claim("worker-2")
+
+    # The first worker's scrape ends after the job was requeued and claimed again
+    assert not queue.report(job["id"], "slow-worker", "news", "done")
+    assert not queue.finish(job["id"], "slow-worker", result={"changed": ["news"]})
+
+    document = queue.collection.find_one({"_id": job["id"]})
+    assert document["status"] == "running"
+    assert document["worker"] == "worker-2"
+    assert document["active_key"] == "scrape_all"
+    assert document["progress"] == {} and document["result"] is None
+
+    assert queue.report(job["id"], "worker-2", "news", "done")
+    assert queue.finish(job["id"], "worker-2", result={"changed": ["news"]})
+    assert queue.get(job["id"])["progress"] == {"news": "done"}
+    assert queue.active("scrape_all") is None
+
+
+def test_live_lease_is_left_alone(queue):
+    job = queue.submit("scrape_all")
+    queue.claim("worker-1")
+
+    assert queue.claim("worker-2") is None
+    assert queue.heartbeat(job["id"], "worker-1")
+    assert queue.active("scrape_all")["status"] == "running"
+
+
+def test_expired_job_fails_after_max_attempts(queue):
+    job = queue.submit("scrape_all")
+    for attempt in range(2):
+        queue.claim(f"worker-{attempt}", max_attempts=2)
+        expire(queue, job["id"])
+    queue.requeue_expired(max_attempts=2)
+
+    failed = queue.get(job["id"])
+    assert failed["status"] == "failed"
+    assert "lease" in failed["error"]
+    # The key is free for a new job
+    assert queue.active("scrape_all") is None
+    assert queue.submit("scrape_all")["id"] != job["id"]
+
+
+def test_finished_job_drops_its_lease(queue):
+    job = queue.submit("scrape_all")
+    queue.claim("worker-1")
+    assert queue.finish(job["id"], "worker-1", result={"changed": []})
+
+    assert "lease_until" not in queue.collection.find_one({"_id": job["id"]})
+    assert not queue.heartbeat(job["id"], "worker-1")
+
+
+def test_heartbeat_renews_the_lease_while_the_job_runs(queue):
+    queue = MongoJobQueue(queue.collection.database, lease_seconds=0.1)
+    job = queue.submit("scrape_all")
+    queue.claim("worker-1")
+
+    with worker.heartbeat(queue, job["id"], "worker-1", interval=0.02):
+        time.sleep(0.3)
+        assert queue.claim("worker-2") is None
+    time.sleep(0.15)
+    assert queue.claim("worker-2")["id"] == job["id"]
+
+
+def test_worker_outside_a_supervisor_has_a_parent():
+    assert worker.parent_alive()
+
+
+## Supervisor metrics
+class ExitedProcess:
+    exitcode = 0
+
+    def is_alive(self):
+        return False
+
+    def join(self):
+        pass
+
+
+def worker_snapshot(jobs):
+    registry = metrics.Registry()
+    registry.inc("mars_stage_total", jobs, stage="save", outcome="success")
+    registry.observe("mars_stage_seconds", 0.2, stage="save")
+    snapshot = registry.snapshot()
+    snapshot["gauges"][("mars_readiness_budget_seconds", metrics._label_key({"host": "mars.nasa.gov"}))] = jobs
+    return snapshot
+
+
+def test_supervisor_serves_the_total_of_every_workers_metrics(queue):
+    supervisor = worker.Supervisor(metrics_port=0)
+    supervisor._metrics_queue = queue_module.Queue()
+    supervisor._metrics_queue.put(("worker-1", worker_snapshot(1)))
+    supervisor._metrics_queue.put(("worker-1", worker_snapshot(2)))
+    supervisor._metrics_queue.put(("worker-2", worker_snapshot(5)))
+    supervisor._collect_metrics()
+
+    # The latest snapshot of each worker counts
+    assert 'mars_stage_total{outcome="success",stage="save"} 7' in supervisor.render_metrics()
+
+    # An exited worker's counts are kept, including what it sent just before exiting
+    supervisor._workers["worker-2"] = ExitedProcess()
+    supervisor._metrics_queue.put(("worker-2", worker_snapshot(6)))
+    supervisor._replace_exited(queue)
+    supervisor._metrics_queue.put(("worker-3", worker_snapshot(1)))
+    supervisor._collect_metrics()
+
+    server = supervisor.serve_metrics(host="127.0.0.1")
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+            body = response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert 'mars_stage_total{outcome="success",stage="save"} 9' in body
+    assert 'mars_stage_seconds_count{stage="save"} 3' in body
+    # Gauges are per running worker
+    assert 'mars_readiness_budget_seconds{host="mars.nasa.gov",worker="worker-1"} 2' in body
+    assert 'mars_readiness_budget_seconds{host="mars.nasa.gov",worker="worker-3"} 1' in body
+    assert 'worker="worker-2"' not in body
@@ -0,0 +1,119 @@
+import mongomock
+import pytest
+
+import news_archive
+import scraping
+
+
+def listing(*numbers):
+    slides = "".join(
+        f'<li class="slide"><div class="list_date">October {number}, 2020</div>'
+        f'<div class="content_title"><a href="/news/{number}/">Article {number}</a></div>'
+        f'<div class="article_teaser_body">Teaser {number}</div></li>'
+        for number in numbers
+    )
+    return f'<html><body><ul class="item_list">{slides}</ul></body></html>'
+
+
+def article(number):
+    return {"url": f"https://mars.nasa.gov/news/{number}/", "title": f"Article {number}"}
+
+
+@pytest.fixture
+def collection():
+    return mongomock.MongoClient().mars_app.news_articles
+
+
+## Fake collection that records each bulk_write
+class BulkResult:
+    def __init__(self, upserted_count, modified_count):
+        self.upserted_count = upserted_count
+        self.modified_count = modified_count
+
+
+class RecordingCollection:
+    def __init__(self, stored=()):
+        self.stored = set(stored)
+        self.batches = []
+
+    def bulk_write(self, operations, ordered=True):
+        assert not ordered
+        self.batches.append(operations)
+        urls = [operation._filter["url"] for operation in operations]
+        added = [url for url in urls if url not in self.stored]
+        self.stored.update(urls)
+        return BulkResult(len(added), len(urls) - len(added))
+
+
+def test_articles_skip_repeats_at_the_top_of_the_next_page():
+    pages = [
+        (f"{scraping.NEWS_URL}?page=0", listing(1, 2, 3)),
+        # A new article pushed 3 onto the next page while the listing was being crawled
+        (f"{scraping.NEWS_URL}?page=1", listing(3, 4, 5)),
+        (f"{scraping.NEWS_URL}?page=2", listing(6)),
+    ]
+
+    urls = [item["url"] for item in news_archive.articles(pages)]
+    assert urls == [f"https://mars.nasa.gov/news/{number}/" for number in (1, 2, 3, 4, 5, 6)]
+
+
+def test_articles_stop_at_the_first_empty_page():
+    fetched = []
+
+    def pages():
+        for page, html in enumerate([listing(1, 2), listing(), listing(3)]):
+            fetched.append(page)
+            yield f"{scraping.NEWS_URL}?page={page}", html
+
+    assert [item["title"] for item in news_archive.articles(pages())] == ["Article 1", "Article 2"]
+    assert fetched == [0, 1]
+
+
+def test_until_known_stops_after_enough_known_articles_in_a_row(collection):
+    stop_after = news_archive.STOP_AFTER_KNOWN
+    known = list(range(100, 100 + stop_after + 50))
+    collection.insert_many([article(number) for number in [10, 11] + known])
+    consumed = []
+
+    def crawl():
+        # Two new ones, a short run of known ones, one new one, then the stored part of the archive
+        for number in [1, 2, 10, 11, 3] + known:
+            consumed.append(number)
+            yield article(number)
+
+    new = [item["url"] for item in news_archive.until_known(crawl(), collection)]
+
+    assert new == [article(number)["url"] for number in (1, 2, 3)]
+    # The crawl stopped within a lookup batch of the stop_after-th known article in a row, long before the end
+    assert len(consumed) <= 5 + stop_after + news_archive.STOP_AFTER_KNOWN
+    assert len(consumed) < 5 + len(known)
+
+
+def test_until_known_passes_everything_through_for_an_empty_collection(collection):
+    items = [article(number) for number in range(50)]
+    assert list(news_archive.until_known(iter(items), collection)) == items
+
+
+def test_write_articles_upserts_in_batches():
+    collection = RecordingCollection(stored=[article(1)["url"]])
+
+    counts = news_archive.write_articles(collection, (article(number) for number in range(1, 6)), batch_size=2)
+
+    assert [len(batch) for batch in collection.batches] == [2, 2, 1]
+    assert counts == {"added": 4, "updated": 1}
+    operation = collection.batches[0][0]
+    assert operation._upsert
+    assert operation._doc["$set"]["title"] == "Article 1"
+    assert "first_seen" in operation._doc["$setOnInsert"]
+
+
+def test_write_articles_without_articles_writes_nothing():
+    collection = RecordingCollection()
+    assert news_archive.write_articles(collection, iter([])) == {"added": 0, "updated": 0}
+    assert collection.batches == []
+
+
+def test_crawl_does_not_use_the_shared_http_cache():
+    fetcher = news_archive.crawl_fetcher()
+    assert fetcher.cache is None
+    assert fetcher.http.cache is None
@@ -0,0 +1,32 @@
+import pytest
+
+import scraping
+from bench_parsers import backend_results, recorded_pages
+from replay import recorded_page
+
+PAGES = recorded_pages()
+
+
+def test_every_page_an_extractor_reads_is_recorded():
+    assert [name for name, html, _ in PAGES if html is None] == []
+
+
+# Every installed backend, parsing the whole page or only the part the extractor needs, extracts the same fields
+@pytest.mark.parametrize("name, html, parse", PAGES, ids=[name for name, _, _ in PAGES])
+def test_backends_extract_the_same_fields(name, html, parse):
+    results = backend_results(html, parse)
+    expected = results[("html.parser", False)]
+
+    assert expected
+    assert {key: result for key, result in results.items() if result != expected} == {}
+
+
+# The built-in facts extractor renders the same table as pd.read_html
+def test_facts_engines_render_the_same_table(monkeypatch):
+    pytest.importorskip("pandas")
+    html = recorded_page(scraping.FACTS_URL)
+
+    monkeypatch.setattr(scraping, "FACTS_ENGINE", "pandas")
+    expected = scraping.parse_facts(html)
+    monkeypatch.setattr(scraping, "FACTS_ENGINE", "builtin")
+    assert scraping.parse_facts(html) == expected
@@ -0,0 +1,108 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
+import pytest
+import requests
+
+import metrics
+import scraping
+from ratelimit import HostLimiter, limited_request
+from replay import ReplayFetcher, ReplayServer
+
+# Loose enough that only the server's throttle, not the limiter's token bucket, slows the requests down
+FAST = {"rate": 1000, "burst": 1000, "concurrency": 8}
+
+
+def retries(server, reason):
+    labels = metrics._label_key({"host": urlsplit(server.url).netloc, "reason": reason})
+    return metrics.registry._counters.get(("mars_fetch_retries_total", labels), 0)
+
+
+@pytest.fixture
+def fetch():
+    fetchers = []
+
+    def fetch(server, limiter, url=scraping.NEWS_URL):
+        fetcher = ReplayFetcher(server.url, limiter=limiter)
+        fetchers.append(fetcher)
+        return fetcher.get(url)
+
+    yield fetch
+    for fetcher in fetchers:
+        fetcher.close()
+
+
+def test_throttled_request_waits_for_retry_after_and_is_retried(fetch):
+    limiter = HostLimiter(default=FAST)
+    with ReplayServer(throttle=2, retry_after=1) as server:
+        before = retries(server, "429")
+        started = time.monotonic()
+        pages = [fetch(server, limiter) for _ in range(3)]
+        seconds = time.monotonic() - started
+
+    assert all("content_title" in page for page in pages)
+    # The third request was answered 429, then retried once the Retry-After second had passed
+    assert server.throttled == 1
+    assert server.served == 3
+    assert retries(server, "429") - before == 1
+    assert seconds >= 1
+
+
+# HostLimiter that signals when a host is paused
+class PauseLimiter(HostLimiter):
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.paused = threading.Event()
+
+    def pause(self, host, seconds):
+        super().pause(host, seconds)
+        self.paused.set()
+
+
+def test_retry_after_pauses_the_whole_host(fetch):
+    limiter = PauseLimiter(default=FAST)
+    with ReplayServer(throttle=2, retry_after=1) as server:
+        fetch(server, limiter)
+        fetch(server, limiter)
+        started = time.monotonic()
+        throttled = threading.Thread(target=fetch, args=(server, limiter))
+        throttled.start()
+        # Let the third request get its 429 and pause the host before a fourth one is sent
+        assert limiter.paused.wait(5)
+        page = fetch(server, limiter)
+        seconds = time.monotonic() - started
+        throttled.join()
+
+    # The fourth request was never sent while the host was paused, so it wasn't throttled itself
+    assert "content_title" in page
+    assert seconds >= 0.9
+    assert server.throttled == 1
+    assert server.served == 4
+
+
+def test_retries_give_up_after_max_retries():
+    limiter = HostLimiter(default=FAST)
+    # throttle=0 answers every request with 429
+    with ReplayServer(throttle=0, retry_after=0) as server:
+        host = urlsplit(server.url).netloc
+        url = f"{server.url}/https/mars.nasa.gov/news/"
+        before = retries(server, "429")
+        response = limited_request(host, lambda: requests.get(url, timeout=5), limiter, max_retries=2)
+
+    assert response.status_code == 429
+    assert server.throttled == 3
+    assert retries(server, "429") - before == 2
+
+
+def test_concurrency_is_capped_per_host(fetch):
+    limiter = HostLimiter(default={**FAST, "concurrency": 2})
+    with ReplayServer(delay=0.1) as server:
+        threads = [threading.Thread(target=fetch, args=(server, limiter)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert server.served == 8
+    assert server.peak_concurrency == 2
@@ -0,0 +1,36 @@
+import metrics
+import readiness
+from readiness import LatencyBudgets
+
+
+def test_budget_follows_the_slow_ready_times_of_the_site():
+    budgets = LatencyBudgets()
+    assert budgets.budget("mars.nasa.gov") == readiness.MAX_BUDGET
+
+    for seconds in (1.0, 1.5, 2.0):
+        budgets.record("mars.nasa.gov", seconds)
+    assert budgets.budget("mars.nasa.gov") == 4.0
+    budgets.record("mars.nasa.gov", 0.1)
+    budgets.record("astrogeology.usgs.gov", 0.1)
+    assert budgets.budget("astrogeology.usgs.gov") == readiness.MIN_BUDGET
+
+
+def test_budgets_are_reported_as_metrics():
+    budgets = LatencyBudgets()
+    budgets.record("mars.nasa.gov", 3.0)
+    budgets.record("mars.nasa.gov", 6.0, timed_out=True)
+    registry = metrics.Registry()
+    registry.add_collector(budgets.metric_samples)
+
+    assert budgets.stats() == {"mars.nasa.gov": {"waits": 2, "timeouts": 1, "budget": 12.0}}
+    rendered = registry.render()
+    assert "# TYPE mars_readiness_budget_seconds gauge" in rendered
+    assert 'mars_readiness_budget_seconds{host="mars.nasa.gov"} 12' in rendered
+    assert 'mars_readiness_waits_total{host="mars.nasa.gov"} 2' in rendered
+    assert 'mars_readiness_timeouts_total{host="mars.nasa.gov"} 1' in rendered
+
+
+def test_process_budgets_are_on_the_metrics_route(client):
+    readiness.latency_budgets.record("example.test", 1.0)
+
+    assert 'mars_readiness_budget_seconds{host="example.test"} 2' in client.get("/metrics").get_data(as_text=True)
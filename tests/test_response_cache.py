@@ -0,0 +1,89 @@
+import pytest
+
+from response_cache import ResponseCache
+
+
+## Stub data version and counting build function
+class Version:
+    def __init__(self):
+        self.value = 1
+        self.checks = 0
+
+    def __call__(self):
+        self.checks += 1
+        return self.value
+
+
+class Builds:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, key):
+        def build():
+            self.count += 1
+            return f"{key} #{self.count}"
+        return build
+
+
+@pytest.fixture
+def version():
+    return Version()
+
+
+@pytest.fixture
+def builds():
+    return Builds()
+
+
+def test_entry_is_built_once_per_version(version, builds):
+    cache = ResponseCache(version, revalidate_after=0)
+
+    assert cache.get("index", builds("index")) == "index #1"
+    assert cache.get("index", builds("index")) == "index #1"
+    version.value = 2
+    assert cache.get("index", builds("index")) == "index #2"
+    assert cache.get("index", builds("index")) == "index #2"
+
+
+def test_version_is_only_checked_every_revalidate_after_seconds(version, builds):
+    cache = ResponseCache(version, revalidate_after=60)
+    cache.get("index", builds("index"))
+    version.value = 2
+
+    # Another process's scrape goes unnoticed until the version is checked again...
+    assert cache.get("index", builds("index")) == "index #1"
+    assert version.checks == 1
+    # ...unless this process invalidates the cache itself
+    cache.invalidate()
+    assert cache.get("index", builds("index")) == "index #2"
+    assert version.checks == 2
+
+
+def test_entry_built_while_the_cache_is_invalidated_is_not_kept(version, builds):
+    cache = ResponseCache(version, revalidate_after=60)
+
+    # While the old data is being rendered, a scrape saves new data and invalidates the cache, and another request
+    # renders and caches the new data
+    def slow_build():
+        page = builds("index")()
+        version.value = 2
+        cache.invalidate()
+        assert cache.get("index", builds("index")) == "index #2"
+        return page
+
+    assert cache.get("index", slow_build) == "index #1"
+    # The slow render of the old data didn't replace the new one
+    assert cache.get("index", builds("index")) == "index #2"
+    assert builds.count == 2
+
+
+def test_oldest_entry_is_dropped_past_max_entries(version, builds):
+    cache = ResponseCache(version, revalidate_after=60, max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.get(key, builds(key))
+
+    assert cache.get("b", builds("b")) == "b #2"
+    assert cache.get("c", builds("c")) == "c #3"
+    # a was dropped to make room for c, so it is built again
+    assert cache.get("a", builds("a")) == "a #4"
+    assert builds.count == 4
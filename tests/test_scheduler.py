@@ -0,0 +1,61 @@
+import datetime as dt
+import logging
+import threading
+
+import mongomock
+import pytest
+
+from scheduler import Scheduler
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().mars_app
+
+
+@pytest.fixture
+def submitted():
+    return []
+
+
+@pytest.fixture
+def scheduler(db, submitted):
+    return Scheduler(db, submit=lambda sources: submitted.append(sources) or {"id": "job-1"}, active=lambda: None)
+
+
+def test_manual_scrape_leaves_out_the_weather(scheduler, submitted):
+    assert scheduler.trigger() == {"id": "job-1"}
+    assert submitted == [["news", "featured_image", "facts", "hemispheres"]]
+    assert "weather" not in scheduler.retry_after()
+
+
+def test_weather_is_refreshed_on_its_schedule(scheduler, submitted):
+    scheduler.run_pending()
+    assert "weather" in submitted[0]
+
+
+def test_manual_scrape_skips_recently_scraped_sources(db, scheduler, submitted):
+    just_now = dt.datetime.now()
+    db.mars.insert_one({"section_scraped": {"news": just_now, "facts": just_now}})
+
+    scheduler.trigger()
+    assert submitted == [["featured_image", "hemispheres"]]
+    assert scheduler.retry_after()["news"] > 0
+
+
+def test_failing_scheduled_scrape_is_logged(db, caplog):
+    queued = threading.Event()
+
+    def submit(sources):
+        queued.set()
+        raise RuntimeError("queue is down")
+
+    scheduler = Scheduler(db, submit=submit, active=lambda: None, tick=0.01)
+    with caplog.at_level(logging.ERROR, logger="scheduler"):
+        scheduler.start()
+        assert queued.wait(5)
+        scheduler.stop()
+
+    record = next(record for record in caplog.records if record.name == "scheduler")
+    assert record.getMessage() == "scheduled scrape could not be queued"
+    assert "queue is down" in str(record.exc_info[1])
@@ -0,0 +1,92 @@
+import datetime as dt
+
+import pytest
+
+import scraping
+from fetchers import BrowserFetcher, BrowserPool, Fetcher
+from replay import ReplayFetcher
+
+SOURCE_FIELDS = {
+    "news": ("news_title", "news_paragraph"),
+    "featured_image": ("featured_image",),
+    "facts": ("facts",),
+    "hemispheres": ("hemispheres",),
+    "weather": ("weather",),
+}
+
+
+## Browser pool that counts launches instead of starting Chrome
+class CountingPool(BrowserPool):
+    def __init__(self):
+        super().__init__(size=1)
+        self.launches = 0
+
+    def _launch(self):
+        self.launches += 1
+        raise AssertionError("the scrape started a browser")
+
+
+def test_scrape_all_returns_every_source(replay_fetcher):
+    data = scraping.scrape_all(replay_fetcher)
+
+    assert isinstance(data["last_modified"], dt.datetime)
+    assert set(data["sources"]) == set(scraping.SOURCES)
+    for name, fields in SOURCE_FIELDS.items():
+        assert data["sources"][name] == {"status": "ok", "attempts": 1, "error": None}
+        for field in fields:
+            assert data[field]
+
+    assert data["featured_image"].startswith("https://www.jpl.nasa.gov/spaceimages/images/")
+    assert [hemisphere["title"] for hemisphere in data["hemispheres"]] == [
+        "Cerberus Hemisphere Enhanced", "Schiaparelli Hemisphere Enhanced",
+        "Syrtis Major Hemisphere Enhanced", "Valles Marineris Hemisphere Enhanced",
+    ]
+    for hemisphere in data["hemispheres"]:
+        assert set(hemisphere) == {"title", "image_url"}
+        assert hemisphere["image_url"].startswith("https://astropedia.astrogeology.usgs.gov/download/")
+    assert data["facts"].startswith("<table")
+    assert {"sol", "date", "min_temp", "max_temp", "pressure", "wind_speed"} <= set(data["weather"][0])
+    assert data["timings"]["stages"]
+
+
+def test_scrape_all_limited_to_some_sources(replay_fetcher):
+    data = scraping.scrape_all(replay_fetcher, sources=["news", "facts"])
+
+    assert set(data["sources"]) == {"news", "facts"}
+    assert "news_title" in data and "facts" in data
+    assert "featured_image" not in data and "hemispheres" not in data
+
+
+def test_no_browser_without_js_sources(monkeypatch, replay_server):
+    monkeypatch.setattr(scraping, "JS_SOURCES", set())
+    pool = CountingPool()
+    fetcher = Fetcher(http=ReplayFetcher(replay_server.url), browser=BrowserFetcher(pool=pool))
+    try:
+        data = scraping.scrape_all(fetcher)
+    finally:
+        fetcher.close()
+
+    assert pool.launches == 0
+    assert all(result["status"] == "ok" for result in data["sources"].values())
+
+
+def test_failed_source_is_left_out(monkeypatch, replay_fetcher):
+    def broken(fetcher):
+        raise ValueError("layout changed")
+
+    monkeypatch.setitem(scraping.SOURCES, "facts", broken)
+    data = scraping.scrape_all(replay_fetcher, sources=["facts", "news"])
+
+    assert "facts" not in data
+    assert data["sources"]["facts"]["status"] == "failed"
+    assert data["sources"]["facts"]["error"] == "ValueError: layout changed"
+    assert data["sources"]["news"]["status"] == "ok"
+
+
+@pytest.mark.parametrize("html", ["", "<html><body><p>Moved</p></body></html>"])
+def test_extractors_find_nothing_on_other_pages(html):
+    assert scraping.parse_news(html) == (None, None)
+    assert scraping.parse_featured_image_link(html) is None
+    assert scraping.parse_featured_image(html) is None
+    assert scraping.parse_hemisphere_results(html, scraping.HEMISPHERES_URL) == {"links": [], "next": None}
+    assert scraping.parse_weather(html) == []
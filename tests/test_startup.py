@@ -0,0 +1,14 @@
+import bench_startup
+
+
+def test_app_imports_without_the_scraping_dependencies_within_budget():
+    web = bench_startup.profile(["app"])
+
+    assert web["scraping_modules"] == []
+    assert web["total_ms"] <= bench_startup.IMPORT_BUDGET_MS, web["slowest"][:10]
+
+
+def test_profile_sees_the_scraping_dependencies_when_they_are_imported():
+    with_scraping = bench_startup.profile(["app", "scraping"])
+
+    assert {"scraping", "bs4"} <= set(with_scraping["scraping_modules"])
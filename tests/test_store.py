@@ -0,0 +1,154 @@
+import datetime as dt
+
+import mongomock
+import pytest
+
+import store
+
+START = dt.datetime(2020, 10, 1, 12, 0)
+
+
+# Scraped data as scraping.scrape_all returns it, every source ok unless listed in failed
+def scrape_data(when, news_title="Title A", facts="<table>A</table>", failed=()):
+    data = {
+        "last_modified": when,
+        "news_title": news_title,
+        "news_paragraph": f"About {news_title}",
+        "featured_image": "https://www.jpl.nasa.gov/spaceimages/images/largesize/PIA23893_hires.jpg",
+        "facts": facts,
+        "hemispheres": [{"title": "Cerberus Hemisphere Enhanced", "image_url": "https://astropedia/cerberus.jpg"}],
+        "sources": {},
+    }
+    for section in store.SECTIONS:
+        if section in failed:
+            data["sources"][section] = {"status": "failed", "attempts": 2, "error": "ValueError: layout changed"}
+            for field in store.SECTIONS[section]:
+                del data[field]
+        else:
+            data["sources"][section] = {"status": "ok", "attempts": 1, "error": None}
+    return data
+
+
+@pytest.fixture
+def db():
+    db = mongomock.MongoClient().mars_app
+    store.ensure_indexes(db)
+    return db
+
+
+# Six scrapes an hour apart; the news changes on every other scrape
+@pytest.fixture
+def scraped(db):
+    for scrape in range(6):
+        store.save_scrape(db, scrape_data(START + dt.timedelta(hours=scrape), news_title=f"Title {scrape // 2}"))
+    return db
+
+
+def test_first_scrape_writes_every_section(db):
+    saved = store.save_scrape(db, scrape_data(START))
+
+    assert saved == {"changed": list(store.SECTIONS), "stale": [], "status_changed": False, "version": 1, "scrape": 1}
+    mars = db.mars.find_one()
+    assert mars["news_title"] == "Title A"
+    assert set(mars["section_modified"]) == set(store.SECTIONS)
+
+
+def test_unchanged_scrape_keeps_the_version(db):
+    store.save_scrape(db, scrape_data(START))
+    saved = store.save_scrape(db, scrape_data(START + dt.timedelta(hours=1)))
+
+    assert saved["changed"] == [] and saved["version"] == 1 and saved["scrape"] == 2
+    assert db.mars.find_one()["last_modified"] == START
+
+
+def test_only_changed_sections_are_written(db):
+    store.save_scrape(db, scrape_data(START))
+    saved = store.save_scrape(db, scrape_data(START + dt.timedelta(hours=1), facts="<table>B</table>"))
+
+    assert saved["changed"] == ["facts"] and saved["version"] == 2
+    mars = db.mars.find_one()
+    assert mars["section_modified"]["facts"] == START + dt.timedelta(hours=1)
+    assert mars["section_modified"]["news"] == START
+
+
+def test_failed_source_keeps_its_last_value_and_is_stale(db):
+    store.save_scrape(db, scrape_data(START))
+    saved = store.save_scrape(db, scrape_data(START + dt.timedelta(hours=1), failed=["facts"]))
+
+    assert saved["stale"] == ["facts"] and saved["status_changed"] and saved["version"] == 2
+    mars = db.mars.find_one()
+    assert mars["facts"] == "<table>A</table>"
+    assert mars["section_status"]["facts"]["stale_since"] == START + dt.timedelta(hours=1)
+
+    saved = store.save_scrape(db, scrape_data(START + dt.timedelta(hours=2)))
+    assert saved["stale"] == [] and saved["status_changed"]
+
+
+def test_history_records_hold_only_what_changed(db):
+    store.save_scrape(db, {**scrape_data(START), "timings": {"stages": []}})
+    store.save_scrape(db, scrape_data(START + dt.timedelta(hours=1)))
+    store.save_scrape(db, scrape_data(START + dt.timedelta(hours=2), news_title="Title B"))
+
+    first, unchanged, news = db.mars_history.find({}, {"_id": 0}).sort("scrape", 1)
+    assert set(first) == set(store.SNAPSHOT_FIELDS) | {"scrape", "version", "last_modified", "changed"}
+    assert unchanged == {"scrape": 2, "version": 1, "last_modified": START + dt.timedelta(hours=1), "changed": []}
+    assert news == {"scrape": 3, "version": 2, "last_modified": START + dt.timedelta(hours=2), "changed": ["news"],
+                    "news_title": "Title B", "news_paragraph": "About Title B"}
+
+
+def test_history_pages_with_a_range_cursor(scraped):
+    first_page = store.history(scraped, limit=4)
+    assert [record["scrape"] for record in first_page] == [6, 5, 4, 3]
+
+    second_page = store.history(scraped, before=first_page[-1]["scrape"], limit=4)
+    assert [record["scrape"] for record in second_page] == [2, 1]
+    assert store.history(scraped, before=1) == []
+
+
+def test_history_by_news_title(scraped):
+    assert [record["scrape"] for record in store.history(scraped, news_title="Title 1")] == [3]
+
+
+def test_latest_snapshot_has_every_section(scraped):
+    snapshot = store.latest_snapshot(scraped)
+
+    assert snapshot["scrape"] == 6 and snapshot["changed"] == []
+    assert snapshot["news_title"] == "Title 2"
+    assert snapshot["facts"] == "<table>A</table>"
+    assert snapshot["hemispheres"][0]["title"] == "Cerberus Hemisphere Enhanced"
+
+
+def test_snapshot_at_a_time(scraped):
+    snapshot = store.snapshot_at(scraped, START + dt.timedelta(hours=3, minutes=30))
+
+    assert snapshot["scrape"] == 4
+    assert snapshot["news_title"] == "Title 1"
+    assert snapshot["facts"] == "<table>A</table>"
+    assert store.snapshot_at(scraped, START - dt.timedelta(minutes=1)) is None
+
+
+def test_snapshot_routes(client, app_module):
+    assert client.get("/api/snapshots/latest").status_code == 404
+    for scrape in range(3):
+        store.save_scrape(app_module.mongo.db,
+                          scrape_data(START + dt.timedelta(hours=scrape), news_title=f"Title {scrape}"))
+
+    latest = client.get("/api/snapshots/latest").json
+    assert latest["scrape"] == 3 and latest["news_title"] == "Title 2" and latest["facts"] == "<table>A</table>"
+    assert latest["last_modified"] == "2020-10-01T14:00:00"
+
+    at = client.get("/api/snapshots/at?time=2020-10-01T13:30:00").json
+    assert at["scrape"] == 2 and at["news_title"] == "Title 1"
+    assert client.get("/api/snapshots/at?time=yesterday").status_code == 400
+    assert client.get("/api/snapshots/at?time=2020-01-01T00:00:00").status_code == 404
+
+    page = client.get("/api/snapshots?limit=2").json
+    assert [record["scrape"] for record in page["snapshots"]] == [3, 2]
+    assert page["next"] == "/api/snapshots?before=2&limit=2"
+    page = client.get(page["next"]).json
+    assert [record["scrape"] for record in page["snapshots"]] == [1]
+    assert page["next"] is None
+
+    for limit in (0, -1):
+        assert client.get(f"/api/snapshots?limit={limit}").status_code == 400
+    assert len(client.get("/api/snapshots?limit=1000").json["snapshots"]) == 3
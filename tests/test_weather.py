@@ -0,0 +1,125 @@
+import datetime as dt
+import math
+
+import mongomock
+import pytest
+
+import weather
+
+pytest.importorskip("numpy")
+
+# Six sols: one without a min_temp, the last three without a pressure, and never a wind speed
+SOLS = [
+    # sol, min_temp, max_temp, pressure
+    (100, -90.0, -20.0, 700.0),
+    (101, None, -22.0, 710.0),
+    (102, -94.0, -18.0, 720.0),
+    (103, -92.0, -16.0, None),
+    (104, -96.0, -24.0, None),
+    (105, -98.0, -26.0, None),
+]
+
+
+def observations():
+    return [
+        {"sol": sol, "date": dt.datetime(2020, 10, 1) + dt.timedelta(days=index), "min_temp": min_temp,
+         "max_temp": max_temp, "pressure": pressure, "wind_speed": None}
+        for index, (sol, min_temp, max_temp, pressure) in enumerate(SOLS)
+    ]
+
+
+@pytest.fixture
+def db():
+    db = mongomock.MongoClient().mars_app
+    db.weather.insert_many(observations())
+    return db
+
+
+def test_summary_skips_missing_readings(db):
+    document = weather.summary(weather.columns(db))
+
+    assert document["sols"] == 6
+    assert (document["first_sol"], document["last_sol"]) == (100, 105)
+    assert (document["first_date"], document["last_date"]) == ("2020-10-01", "2020-10-06")
+    assert document["readings"]["min_temp"] == {"count": 5, "min": -98.0, "max": -90.0, "mean": -94.0}
+    assert document["readings"]["pressure"] == {"count": 3, "min": 700.0, "max": 720.0, "mean": 710.0}
+    assert document["readings"]["wind_speed"] == {"count": 0, "min": None, "max": None, "mean": None}
+
+
+def test_summary_of_a_range(db):
+    document = weather.summary(weather.columns(db, weather.range_query(start_sol=103)))
+
+    assert (document["sols"], document["first_sol"]) == (3, 103)
+    assert document["readings"]["pressure"]["count"] == 0
+
+
+def test_downsample_buckets_consecutive_sols(db):
+    series = weather.downsample(weather.columns(db), points=3)
+
+    assert series["sol"] == [100, 102, 104]
+    assert series["date"] == ["2020-10-01", "2020-10-03", "2020-10-05"]
+    # The first bucket's min_temp is only its one present reading
+    assert series["min_temp"] == {"mean": [-90.0, -93.0, -97.0], "min": [-90.0, -94.0, -98.0],
+                                  "max": [-90.0, -92.0, -96.0]}
+    # A bucket without any pressure reading gives None, not NaN
+    assert series["pressure"] == {"mean": [705.0, 720.0, None], "min": [700.0, 720.0, None],
+                                  "max": [710.0, 720.0, None]}
+    assert series["wind_speed"]["mean"] == [None, None, None]
+
+
+def test_downsample_with_more_points_than_sols_keeps_every_sol(db):
+    series = weather.downsample(weather.columns(db), points=50)
+
+    assert series["sol"] == [sol for sol, *_ in SOLS]
+    assert series["min_temp"]["mean"] == [-90.0, None, -94.0, -92.0, -96.0, -98.0]
+
+
+def test_empty_range(db):
+    arrays = weather.columns(db, weather.range_query(start_sol=500))
+
+    document = weather.summary(arrays)
+    assert document["sols"] == 0
+    assert document["first_sol"] is None and document["last_date"] is None
+    assert document["readings"]["max_temp"]["mean"] is None
+
+    series = weather.downsample(arrays)
+    assert series["sol"] == [] and series["date"] == []
+    assert series["max_temp"] == {"mean": [], "min": [], "max": []}
+
+
+def test_range_query_leaves_open_ends_out():
+    assert weather.range_query() == {}
+    assert weather.range_query(start_sol=3) == {"sol": {"$gte": 3}}
+    start, end = dt.datetime(2020, 10, 1), dt.datetime(2020, 10, 3)
+    assert weather.range_query(start_date=start, end_date=end) == {"date": {"$gte": start, "$lte": end}}
+
+
+## Routes
+@pytest.fixture
+def weather_client(client, app_module):
+    app_module.mongo.db.weather.insert_many(observations())
+    return client
+
+
+def test_weather_summary_route(weather_client):
+    response = weather_client.get("/api/weather/summary?start=2020-10-02&end=2020-10-04")
+
+    assert response.status_code == 200
+    assert (response.json["first_sol"], response.json["last_sol"]) == (101, 103)
+    assert response.json["readings"]["min_temp"]["count"] == 2
+
+
+def test_weather_series_route(weather_client):
+    response = weather_client.get("/api/weather/series?start_sol=101&points=2")
+
+    assert response.status_code == 200
+    # Sols 101-102 and 103-105
+    assert response.json["sol"] == [101, 103]
+    assert response.json["pressure"]["mean"][1] is None
+    assert not any(isinstance(value, float) and math.isnan(value) for value in response.json["max_temp"]["mean"])
+
+
+@pytest.mark.parametrize("query", ["points=0", f"points={weather.MAX_SERIES_POINTS + 1}", "points=many",
+                                   "start_sol=first", "start=yesterday"])
+def test_weather_series_rejects_bad_arguments(weather_client, query):
+    assert weather_client.get(f"/api/weather/series?{query}").status_code == 400
@@ -0,0 +1,145 @@
+# Mars weather time series.
+# The InSight weather page only lists the latest sols, so every scrape adds its rows (scraping.parse_weather) to the
+# weather collection, one document per sol, and the collection builds up the whole record over time:
+#   {"sol": 675, "date": datetime(2020, 10, 19), "min_temp": -94.0, "max_temp": -18.0, "pressure": 723.0, ...}
+#
+# The API aggregates a range of sols (or of dates) at a time. The range is read from Mongo with a projection into one
+# NumPy array per reading, and the summary (min, max, mean) and the downsampled series are computed on those arrays
+# instead of looping over documents in Python, so a chart over years of sols takes milliseconds. Missing readings are
+# NaN in the arrays and are skipped by every aggregate. NumPy is only imported once weather is aggregated.
+import datetime as dt
+
+import metrics
+
+# The readings kept for each sol, besides its sol number and date
+READINGS = ("min_temp", "max_temp", "pressure", "wind_speed")
+# Points in a downsampled series when the request doesn't ask for a number, and the most it may ask for
+SERIES_POINTS = 500
+MAX_SERIES_POINTS = 5000
+
+
+# Sol ranges are served by the compound (sol, date) index, date ranges by the date index
+def ensure_indexes(db):
+    db.weather.create_index([("sol", 1), ("date", 1)], unique=True)
+    db.weather.create_index([("date", 1)])
+
+
+# Upsert the scraped rows by sol in one unordered bulk write. Returns how many sols were added and updated
+# (a sol whose readings haven't changed counts as neither).
+def save_weather(db, observations):
+    from pymongo import UpdateOne
+
+    ensure_indexes(db)
+    now = dt.datetime.now()
+    operations = []
+    for observation in observations:
+        date = dt.datetime.fromisoformat(observation["date"]) if observation.get("date") else None
+        readings = {reading: observation.get(reading) for reading in READINGS}
+        operations.append(UpdateOne(
+            {"sol": observation["sol"]},
+            {"$set": {"date": date, **readings}, "$setOnInsert": {"first_seen": now}},
+            upsert=True,
+        ))
+    if not operations:
+        return {"added": 0, "updated": 0}
+    with metrics.timer("save", collection="weather"):
+        result = db.weather.bulk_write(operations, ordered=False)
+    return {"added": result.upserted_count, "updated": result.modified_count}
+
+
+## Range query
+# Mongo filter for a range of sols or dates; either end may be left open
+def range_query(start_sol=None, end_sol=None, start_date=None, end_date=None):
+    query = {}
+    if start_sol is not None or end_sol is not None:
+        query["sol"] = {key: value for key, value in (("$gte", start_sol), ("$lte", end_sol)) if value is not None}
+    if start_date is not None or end_date is not None:
+        query["date"] = {key: value for key, value in (("$gte", start_date), ("$lte", end_date)) if value is not None}
+    return query
+
+
+# The sols in range as column arrays, in sol order: {"sol": int64, "date": datetime64[D], "min_temp": float64, ...}
+def columns(db, query=None):
+    import numpy as np
+
+    cursor = db.weather.find(query or {}, {"_id": 0, "sol": 1, "date": 1, **{reading: 1 for reading in READINGS}})
+    documents = list(cursor.sort("sol", 1))
+    arrays = {
+        "sol": np.fromiter((document["sol"] for document in documents), dtype=np.int64, count=len(documents)),
+        "date": np.array([document.get("date") or "NaT" for document in documents], dtype="datetime64[D]"),
+    }
+    for reading in READINGS:
+        # None becomes NaN
+        arrays[reading] = np.array([document.get(reading) for document in documents], dtype=np.float64)
+    return arrays
+
+
+### Aggregation
+# First and last sol and date of the columns, and min, max and mean of every reading (None for a reading with no
+# values in the range)
+def summary(arrays):
+    import numpy as np
+
+    sols = arrays["sol"]
+    document = {
+        "sols": int(sols.size),
+        "first_sol": int(sols[0]) if sols.size else None,
+        "last_sol": int(sols[-1]) if sols.size else None,
+        "first_date": _date(arrays["date"][0]) if sols.size else None,
+        "last_date": _date(arrays["date"][-1]) if sols.size else None,
+        "readings": {},
+    }
+    for reading in READINGS:
+        values = arrays[reading]
+        values = values[~np.isnan(values)]
+        document["readings"][reading] = {
+            "count": int(values.size),
+            "min": float(values.min()) if values.size else None,
+            "max": float(values.max()) if values.size else None,
+            "mean": float(values.mean()) if values.size else None,
+        }
+    return document
+
+
+# The columns cut into at most `points` buckets of consecutive sols. Each bucket gives its first sol and date, and
+# the mean, min and max of every reading over the bucket (None where the bucket has no value). With no more sols
+# than points, every sol is its own bucket.
+def downsample(arrays, points=SERIES_POINTS):
+    import numpy as np
+
+    size = arrays["sol"].size
+    buckets = min(points, size)
+    # Index of the first sol of each bucket; the buckets differ in size by at most one sol
+    starts = np.unique(np.linspace(0, size, buckets, endpoint=False).astype(np.int64)) if size else np.array([], np.int64)
+
+    series = {
+        "sol": arrays["sol"][starts].tolist(),
+        "date": [_date(date) for date in arrays["date"][starts]],
+    }
+    if not starts.size:
+        series.update({reading: {"mean": [], "min": [], "max": []} for reading in READINGS})
+        return series
+
+    for reading in READINGS:
+        values = arrays[reading]
+        present = ~np.isnan(values)
+        counts = np.add.reduceat(present.astype(np.int64), starts)
+        sums = np.add.reduceat(np.where(present, values, 0.0), starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+        # fmin and fmax skip NaN unless the whole bucket is NaN
+        series[reading] = {
+            "mean": _floats(np.where(counts > 0, means, np.nan)),
+            "min": _floats(np.fmin.reduceat(values, starts)),
+            "max": _floats(np.fmax.reduceat(values, starts)),
+        }
+    return series
+
+
+# Float array as a JSON-ready list, NaN as None
+def _floats(values):
+    return [None if value != value else value for value in values.tolist()]
+
+
+def _date(value):
+    return None if value != value else str(value)
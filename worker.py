@@ -0,0 +1,323 @@
+# Standalone scrape worker.
+# Runs scrapes outside the web app: worker processes take jobs from the Mongo-backed queue (jobs.MongoJobQueue), run
+# scraping.scrape_all and save the result with store.save_scrape. The Flask app only queues jobs and reads their
+# status (with MARS_SCRAPE_BACKEND=worker), so the web tier and the scrape tier can be scaled separately.
+#
+# Every worker is its own process, watched by a supervisor. A worker that crashes is replaced, and the job it was
+# running goes back in the queue (or fails once it has been tried MAX_ATTEMPTS times). A worker whose memory grows
+# past the limit exits after finishing its job and is replaced by a fresh one. While it runs a job a worker renews the
+# job's lease every HEARTBEAT_INTERVAL seconds, so if the supervisor itself is killed, or the host goes down, the job is
+# requeued once its lease runs out instead of staying "running" forever. Workers whose supervisor died finish their
+# current job and exit.
+# With --schedule the supervisor also queues the periodic refreshes of every source (see scheduler.py).
+#
+# The scrape metrics (see metrics.py) are counted in the worker processes, so the web app's /metrics has none of them
+# with this backend. With --metrics-port the workers send their counts to the supervisor after every job, and the
+# supervisor serves the total of all of them, including workers that have since exited, on that port's /metrics.
+#
+#   python worker.py --processes 2 --memory-limit-mb 1024 --schedule --metrics-port 9102
+import argparse
+import logging
+import multiprocessing
+import os
+import queue as queue_module
+import signal
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import images
+import metrics
+import store
+import weather
+from jobs import MongoJobQueue
+from scheduler import Scheduler
+
+logger = logging.getLogger(__name__)
+
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/mars_app")
+# Seconds an idle worker waits before looking for a job again
+POLL_INTERVAL = 1
+# Resident memory, in MiB, above which a worker is replaced after its current job
+MEMORY_LIMIT_MB = 1024
+# Times a job is started before a crashing worker makes it fail instead of going back in the queue
+MAX_ATTEMPTS = 3
+# Seconds the supervisor waits between checks on its workers
+SUPERVISE_INTERVAL = 1
+# Seconds between a worker's renewals of the lease on its job; well under jobs.LEASE_SECONDS
+HEARTBEAT_INTERVAL = 15
+# Download the scraped images and make their thumbnails after every scrape
+MIRROR_IMAGES = os.environ.get("MARS_MIRROR_IMAGES", "1") == "1"
+# Key of scrape jobs in the queue; only one of them is queued or running at a time
+SCRAPE_JOB_KEY = "scrape_all"
+# Log lines of the supervisor and of every worker process (spawned workers set up their own logging)
+LOG_FORMAT = "%(asctime)s %(processName)s %(name)s %(levelname)s %(message)s"
+
+
+# Scrape the given sources (every source by default) and save the result, reporting each source through on_progress
+# as it finishes, then mirror the images it found (see images.py). Returns the sections that changed, the new version
+# and scrape numbers, how many images and thumbnails were added, and how many sols of weather were added and updated.
+def scrape_and_save(db, on_progress=None, sources=None):
+    import scraping
+    mars_data = scraping.scrape_all(on_progress=on_progress, sources=sources)
+    with metrics.timer("save"):
+        store.ensure_indexes(db)
+        saved = store.save_scrape(db, mars_data)
+
+    # The weather rows go to their own time series collection; new readings make a new version of the data
+    if "weather" in mars_data:
+        saved["weather"] = weather.save_weather(db, mars_data["weather"])
+        if saved["weather"]["added"] or saved["weather"]["updated"]:
+            saved["version"] = store.bump_version(db)
+
+    if MIRROR_IMAGES:
+        saved["images"] = images.mirror_images(db, db.mars.find_one({}, {"featured_image": 1, "hemispheres": 1}))
+        # The page links to the new local copies once it is rendered again for a new version
+        if saved["images"]["downloaded"] or saved["images"]["thumbnails"]:
+            saved["version"] = store.bump_version(db)
+    return saved
+
+
+# Scheduler that queues its scrapes in a Mongo job queue, for the worker processes to run
+def mongo_scheduler(db, queue):
+    return Scheduler(
+        db,
+        submit=lambda sources: queue.submit(SCRAPE_JOB_KEY, {"sources": sources}),
+        active=lambda: queue.active(SCRAPE_JOB_KEY),
+    )
+
+
+# Resident set size of this process in MiB
+def memory_mb():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Whether the process that started this one is still running (always true when run outside a supervisor)
+def parent_alive():
+    parent = multiprocessing.parent_process()
+    return parent is None or parent.is_alive()
+
+
+# Renew the lease on the job from a background thread for as long as the block runs
+@contextmanager
+def heartbeat(queue, job_id, worker_id, interval=HEARTBEAT_INTERVAL):
+    done = threading.Event()
+
+    def beat():
+        while not done.wait(interval):
+            if not queue.heartbeat(job_id, worker_id):
+                logger.warning("worker %s lost the lease on job %s", worker_id, job_id)
+                return
+
+    thread = threading.Thread(target=beat, name=f"heartbeat-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        done.set()
+        thread.join()
+
+
+## Worker process
+# Takes jobs one at a time until asked to stop, until its memory passes the limit, or until its supervisor is gone.
+# With a metrics_queue it puts its worker_id and a snapshot of its metrics there after every job.
+def work(worker_id, mongo_uri=MONGO_URI, memory_limit_mb=MEMORY_LIMIT_MB, poll_interval=POLL_INTERVAL,
+         metrics_queue=None):
+    from pymongo import MongoClient
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the supervisor handles Ctrl+C
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+
+    client = MongoClient(mongo_uri)
+    db = client.get_default_database()
+    queue = MongoJobQueue(db)
+    try:
+        while not stopping:
+            if not parent_alive():
+                logger.warning("worker %s lost its supervisor; exiting", worker_id)
+                break
+            job = queue.claim(worker_id, MAX_ATTEMPTS)
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+
+            try:
+                with heartbeat(queue, job["id"], worker_id):
+                    saved = scrape_and_save(db, lambda step, status: queue.report(job["id"], worker_id, step, status),
+                                            sources=job["params"].get("sources"))
+            except Exception as error:
+                finished = queue.finish(job["id"], worker_id, error=f"{type(error).__name__}: {error}")
+            else:
+                finished = queue.finish(job["id"], worker_id, result=saved)
+            if not finished:
+                logger.warning("worker %s lost job %s to another worker; its result was dropped", worker_id, job["id"])
+            if metrics_queue is not None:
+                metrics_queue.put((worker_id, metrics.registry.snapshot()))
+
+            if memory_mb() > memory_limit_mb:
+                logger.info("worker %s is using %.0fMiB, over the %sMiB limit; restarting", worker_id, memory_mb(),
+                            memory_limit_mb)
+                break
+    finally:
+        client.close()
+
+
+## Supervisor
+# Keeps `processes` workers running, replacing any that exit, until it gets SIGTERM or SIGINT.
+# With schedule=True it also runs the scheduler for the periodic refreshes, and with a metrics_port it serves the
+# workers' metrics.
+class Supervisor:
+    def __init__(self, processes=2, mongo_uri=MONGO_URI, memory_limit_mb=MEMORY_LIMIT_MB, schedule=False,
+                 metrics_port=None):
+        self.processes = processes
+        self.mongo_uri = mongo_uri
+        self.memory_limit_mb = memory_limit_mb
+        self.schedule = schedule
+        self.metrics_port = metrics_port
+        # spawn gives every worker a clean interpreter, without the supervisor's Mongo client or threads
+        self._context = multiprocessing.get_context("spawn")
+        self._workers = {}
+        self._stopping = False
+        # Latest metrics snapshot of every running worker, and the metrics of the workers that have exited
+        self._metrics_queue = self._context.Queue() if metrics_port is not None else None
+        self._worker_metrics = {}
+        self._exited_metrics = metrics.Registry()
+        self._metrics_lock = threading.Lock()
+
+    def _start_worker(self):
+        worker_id = f"{os.uname().nodename}-{uuid.uuid4().hex[:8]}"
+        process = self._context.Process(
+            target=work, args=(worker_id, self.mongo_uri, self.memory_limit_mb, POLL_INTERVAL, self._metrics_queue),
+            name=f"scrape-worker-{worker_id}",
+        )
+        process.start()
+        self._workers[worker_id] = process
+
+    def _replace_exited(self, queue):
+        for worker_id, process in list(self._workers.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            del self._workers[worker_id]
+            # Keep the counts of the worker's last job (its gauges go away with it)
+            self._collect_metrics()
+            with self._metrics_lock:
+                snapshot = self._worker_metrics.pop(worker_id, None)
+            if snapshot is not None:
+                self._exited_metrics.merge({**snapshot, "gauges": {}})
+            # Whatever the worker was running when it died goes back in the queue
+            queue.release_worker(worker_id, MAX_ATTEMPTS)
+            if process.exitcode != 0:
+                logger.warning("worker %s exited with code %s", worker_id, process.exitcode)
+
+    # Take in the snapshots the workers have sent since the last call
+    def _collect_metrics(self):
+        if self._metrics_queue is None:
+            return
+        while True:
+            try:
+                worker_id, snapshot = self._metrics_queue.get_nowait()
+            except queue_module.Empty:
+                return
+            with self._metrics_lock:
+                self._worker_metrics[worker_id] = snapshot
+
+    # Total of the metrics of every worker, running or exited, in the Prometheus text format
+    def render_metrics(self):
+        total = metrics.Registry()
+        total.merge(self._exited_metrics.snapshot())
+        with self._metrics_lock:
+            snapshots = list(self._worker_metrics.items())
+        # Every worker learns its own readiness budgets, so gauges are reported per worker
+        for worker_id, snapshot in snapshots:
+            total.merge(snapshot, worker=worker_id)
+        return total.render()
+
+    # Serve render_metrics on /metrics from a background thread
+    def serve_metrics(self, host="", port=None):
+        supervisor = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.partition("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = supervisor.render_metrics().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, self.metrics_port if port is None else port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        return server
+
+    def stop(self, signum=None, frame=None):
+        self._stopping = True
+
+    def run(self):
+        from pymongo import MongoClient
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        client = MongoClient(self.mongo_uri)
+        db = client.get_default_database()
+        queue = MongoJobQueue(db)
+        queue.ensure_indexes()
+        # Jobs left running by a supervisor that didn't get to release them (killed, or the host went down)
+        queue.requeue_expired(MAX_ATTEMPTS)
+        scheduler = mongo_scheduler(db, queue).start() if self.schedule else None
+        metrics_server = self.serve_metrics() if self.metrics_port is not None else None
+        try:
+            while not self._stopping:
+                self._collect_metrics()
+                self._replace_exited(queue)
+                while len(self._workers) < self.processes:
+                    self._start_worker()
+                time.sleep(SUPERVISE_INTERVAL)
+        finally:
+            if scheduler is not None:
+                scheduler.stop()
+            if metrics_server is not None:
+                metrics_server.shutdown()
+                metrics_server.server_close()
+            # Let every worker finish its current job before exiting
+            for process in self._workers.values():
+                process.terminate()
+            for process in self._workers.values():
+                process.join()
+            self._replace_exited(queue)
+            client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run scrape jobs queued by the web app")
+    parser.add_argument("--processes", type=int, default=2, help="number of worker processes")
+    parser.add_argument("--memory-limit-mb", type=int, default=MEMORY_LIMIT_MB,
+                        help="restart a worker once its resident memory passes this many MiB")
+    parser.add_argument("--mongo-uri", default=MONGO_URI)
+    parser.add_argument("--schedule", action="store_true", help="also queue the periodic refresh of every source")
+    parser.add_argument("--metrics-port", type=int, help="serve the workers' scrape metrics on this port's /metrics")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+    Supervisor(args.processes, args.mongo_uri, args.memory_limit_mb, args.schedule, args.metrics_port).run()